@@ -0,0 +1,104 @@
+"""
+Memory taken by a fleet of robots, with the legacy and the current representations.
+
+Each robot has completed one activity and is ready for the next one, which is the
+steady state of a large fleet. The legacy robots are the ones of the baseline
+commit, whose model is extracted with git into a temporary directory and imported
+from there, so the repository must be a git clone. Usage, from the repository root:
+
+    python benchmarks/robot_memory.py [--robots 1000000] [--baseline ef39313]
+"""
+
+import importlib
+import importlib.util
+import io
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import tracemalloc
+
+import click
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from model import activities, robots  # noqa: E402
+
+# commit of the legacy representation
+BASELINE = "ef39313"
+
+
+def import_legacy(commit: str, directory: str):
+    """
+    Extract src/model of commit into directory and import it as legacy_model.
+
+    Return its activities and robots modules.
+    """
+    archive = subprocess.run(
+        ["git", "archive", commit, "src/model"],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+    package = os.path.join(directory, "src", "model")
+    # another name than model, which is the current one
+    spec = importlib.util.spec_from_file_location(
+        "legacy_model",
+        os.path.join(package, "__init__.py"),
+        submodule_search_locations=[package],
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["legacy_model"] = module
+    spec.loader.exec_module(module)
+    return (
+        importlib.import_module("legacy_model.activities"),
+        importlib.import_module("legacy_model.robots"),
+    )
+
+
+def measure(activities_module, robots_module, nbrobots: int) -> int:
+    """
+    Return the number of bytes allocated by a fleet of nbrobots robots, each one
+    having mined a foo
+    """
+    tracemalloc.start()
+    fleet = []
+    for tick in range(0, nbrobots):
+        bot = robots_module.Robot()
+        bot.schedule(activities_module.MineFoo(), tick)
+        bot.work(tick)
+        bot.work(tick + 1)
+        fleet.append(bot)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del fleet
+    return size
+
+
+@click.command()
+@click.option("--robots", "nbrobots", default=1000000, help="Robots of the fleet.")
+@click.option(
+    "--baseline",
+    default=BASELINE,
+    help=f"Commit of the legacy representation. Default {BASELINE}.",
+)
+def main(nbrobots, baseline):
+    with tempfile.TemporaryDirectory() as directory:
+        legacy_activities, legacy_robots = import_legacy(baseline, directory)
+        before = measure(legacy_activities, legacy_robots, nbrobots)
+    after = measure(activities, robots, nbrobots)
+    click.echo(f"robots: {nbrobots}")
+    click.echo(
+        f"legacy:  {before / nbrobots:6.1f} bytes/robot ({before >> 20} MiB), "
+        f"from {baseline}"
+    )
+    click.echo(f"current: {after / nbrobots:6.1f} bytes/robot ({after >> 20} MiB)")
+    click.echo(f"saved:   {100 * (1 - after / before):5.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Performance benchmarks of the foobarfactory engine and autopilots.
+
+Micro-benchmarks time the hot methods of the model on a fleet of robots, macro-
+benchmarks play whole headless games with the autopilots. Each macro-benchmark runs
+in a fresh process, so that the peak memory reported is its own. The report is
+printed as JSON. Usage, from the repository root:
+
+    python benchmarks/suite.py [--targets 30,1000,100000] [--output report.json]
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from model import activities, factory, robots  # noqa: E402
+from model.resources import ResourceLedger  # noqa: E402
+from simulate import PILOTS, build_pilot, play  # noqa: E402
+
+# robots of the fleet of the micro-benchmarks
+FLEET = 10000
+TARGETS = (30, 1000, 100000)
+# robots built per macro-benchmark: the number of games decreases with the target
+ROBOTS_PER_MACRO = 3000
+
+
+# Micro-benchmarks: each one is a setup() building the state, untimed, and a
+# timed run(state) doing FLEET operations.
+
+
+def _working_robots():
+    fleet = [robots.Robot() for _ in range(0, FLEET)]
+    for bot in fleet:
+        bot.schedule(activities.SellFoobar(), tick=0)
+        bot.work(0)
+    return fleet
+
+
+def _robot_work(fleet):
+    # the activities complete at tick 10
+    for tick in range(1, 11):
+        for bot in fleet:
+            bot.work(tick)
+
+
+def _busy_factory():
+    fact = factory.Factory(initial_robots_nb=FLEET, seed=0)
+    fact.resources = {"foobars": FLEET}
+    fact.set_activities(0, *[activities.SellFoobar() for _ in range(0, FLEET)])
+    fact.run(0)
+    return fact
+
+
+def _factory_run(fact):
+    for tick in range(1, 11):
+        fact.run(tick)
+
+
+def _ready_factory():
+    fact = factory.Factory(initial_robots_nb=FLEET, seed=0)
+    fact.resources = {"foos": FLEET, "bars": FLEET}
+    # robots with different previous activities, and activities to dispatch
+    kinds = (activities.MINEFOO, activities.MINEBAR, activities.ASSEMBLEFOOBAR, None)
+    for i, bot in enumerate(fact.robots):
+        bot.previous_type = kinds[i % 4]
+    acts = [
+        activities.get_activty(kinds[i % 3], fact.outcomes) for i in range(0, FLEET)
+    ]
+    return fact, acts
+
+
+def _set_activities(state):
+    fact, acts = state
+    fact.set_activities(0, *acts)
+
+
+def _ledger_and_acts():
+    ledger = ResourceLedger(foos=FLEET, bars=FLEET)
+    return ledger, [activities.AssembleFoobar() for _ in range(0, FLEET)]
+
+
+def _take_resources(state):
+    ledger, acts = state
+    for act in acts:
+        act.take_resources(ledger)
+
+
+def _half_busy_factory():
+    fact = factory.Factory(initial_robots_nb=FLEET, seed=0)
+    fact.resources = {"foobars": FLEET}
+    fact.set_activities(0, *[activities.SellFoobar() for _ in range(0, FLEET // 2)])
+    fact.run(0)
+    return fact
+
+
+def _to_dict(fact):
+    fact.to_dict()
+
+
+def _fork(fact):
+    fact.fork()
+
+
+# name: (setup, run, operations per run)
+MICRO = {
+    "Robot.work": (_working_robots, _robot_work, 10 * FLEET),
+    "Factory.run": (_busy_factory, _factory_run, 10 * FLEET),
+    "Factory.set_activities": (_ready_factory, _set_activities, FLEET),
+    "BaseActivity.take_resources": (_ledger_and_acts, _take_resources, FLEET),
+    "Factory.to_dict": (_half_busy_factory, _to_dict, FLEET),
+    "Factory.fork": (_half_busy_factory, _fork, FLEET),
+}
+
+
+def micro(setup: Callable, run: Callable, nbops: int, repeat: int) -> Dict:
+    """Best time of repeat runs, each one on a fresh state"""
+    best = float("inf")
+    for _ in range(0, repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        best = min(best, time.perf_counter() - start)
+    return {
+        "ops": nbops,
+        "best_seconds": best,
+        "ns_per_op": 1e9 * best / nbops,
+        "ops_per_sec": nbops / best,
+    }
+
+
+# Macro-benchmarks
+
+
+class CountingPilot:
+    """Count the rounds of a game: one round per decision of the pilot"""
+
+    def __init__(self, pilot) -> None:
+        self.pilot = pilot
+        self.rounds = 0
+
+    def get_activities(self, situation: Dict) -> List:
+        self.rounds += 1
+        return self.pilot.get_activities(situation)
+
+
+def _peak_rss_kib() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kibibytes elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def macro(pilot_name: str, target: int, nbgames: int, seed: int) -> Dict:
+    """Play nbgames games, run in a fresh process by the suite"""
+    pilot = CountingPilot(build_pilot(pilot_name, target))
+    ticks = 0
+    start = time.perf_counter()
+    for game in range(0, nbgames):
+        ticks += play(pilot, target, seed=seed + game)
+    seconds = time.perf_counter() - start
+    return {
+        "pilot": pilot_name,
+        "target": target,
+        "games": nbgames,
+        "ticks": ticks,
+        "rounds": pilot.rounds,
+        "seconds": seconds,
+        "ticks_per_sec": ticks / seconds,
+        "rounds_per_sec": pilot.rounds / seconds,
+        "peak_rss_kib": _peak_rss_kib(),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return (
+            subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                check=True,
+            )
+            .stdout.decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option(
+    "--targets",
+    default=",".join(str(t) for t in TARGETS),
+    help="Comma separated targets of the macro-benchmarks. Default "
+    f"{','.join(str(t) for t in TARGETS)}.",
+)
+@click.option(
+    "--pilot",
+    "pilot_names",
+    type=click.Choice(PILOTS),
+    multiple=True,
+    help="Pilot of the macro-benchmarks, can be repeated. Default all autopilots.",
+)
+@click.option(
+    "--only",
+    type=click.Choice(("micro", "macro")),
+    help="Run the micro or the macro-benchmarks only. Default both.",
+)
+@click.option(
+    "--repeat", default=5, help="Runs of each micro-benchmark, best kept. Default 5."
+)
+@click.option("--seed", default=0, help="Seed of the first game. Default 0.")
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the report to this file too.",
+)
+def main(targets, pilot_names, only, repeat, seed, output):
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "micro": {},
+        "macro": [],
+    }
+    if only != "macro":
+        for name, (setup, run, nbops) in MICRO.items():
+            report["micro"][name] = micro(setup, run, nbops, repeat)
+    if only != "micro":
+        # a fresh interpreter per benchmark: the peak memory is its own
+        context = multiprocessing.get_context("spawn")
+        for target in (int(t) for t in targets.split(",")):
+            for name in pilot_names or PILOTS:
+                nbgames = max(1, ROBOTS_PER_MACRO // target)
+                with context.Pool(1) as pool:
+                    report["macro"].append(
+                        pool.apply(macro, (name, target, nbgames, seed))
+                    )
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as outfile:
+            outfile.write(text)
+    click.echo(text)
+
+
+if __name__ == "__main__":
+    main()
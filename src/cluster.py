@@ -0,0 +1,361 @@
+"""
+Cluster of worker processes playing a large set of factories, each one a shard of
+them, under a coordinator collecting the aggregate metrics of every tick.
+
+The factories are split into blocks of a fixed size, each one with its own seed. A
+run deals the blocks to the workers, which play them tick by tick with the lockstep
+engine (see model.lockstep) and report to the coordinator the metrics of each tick:
+total robots, foobars assembled, factories reaching the target. Several ticks are
+reported per message so that the workers seldom wait for each other. A block is
+played the same way whatever the worker playing it: the results of a run do not
+depend on the number of workers, which can be changed between two runs.
+"""
+
+import multiprocessing
+import os
+from collections import namedtuple
+from time import perf_counter
+from typing import Callable, List, Optional
+
+import click
+import numpy as np
+
+from model import lockstep
+from model.randomness import Seed, spawn_seeds
+from pilots import FactoryPilot
+from simulate import PERCENTILES, PILOTS, build_pilot
+
+# Aggregate metrics of all the factories at one tick:
+# robots: robots of all the factories at the end of the tick
+# foobars: foobars assembled during the tick
+# completed: factories which reached the target during the tick
+# playing: factories which did not reach it yet at the end of the tick
+TickMetrics = namedtuple(
+    "TickMetrics", ("tick", "robots", "foobars", "completed", "playing")
+)
+# Result of a run: ticks each factory needed to reach the target (-1 if not reached
+# within the max ticks), metrics of each tick, wall time in seconds
+RunReport = namedtuple("RunReport", ("ticks", "metrics", "wall_time"))
+
+
+class ClusterError(Exception):
+    """Raised by the coordinator when a worker fails, or when there is none"""
+
+    pass
+
+
+def _worker(conn) -> None:
+    """Play the blocks of factories the coordinator deals, until told to stop"""
+    blocks = []
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            # the coordinator exited
+            return
+        except Exception as err:
+            # a message which cannot be unpickled here, e.g. the pilot
+            conn.send(ClusterError(f"{type(err).__name__}: {err}"))
+            continue
+        command = message[0]
+        if command == "stop":
+            conn.close()
+            return
+        try:
+            if command == "start":
+                _, pilot, specs, target, sell_max = message
+                policy = pilot.choose_batch
+                # a round cannot more than double the fleet
+                blocks = [
+                    (
+                        index,
+                        lockstep.LockstepFactories(size, 2 * target, seed=seed),
+                        np.full(size, -1, dtype=np.int64),
+                    )
+                    for index, size, seed in specs
+                ]
+                tick = 0
+                assembled = 0
+                reply = None
+            elif command == "advance":
+                metrics = np.zeros((message[1], 4), dtype=np.int64)
+                for line in metrics:
+                    for _, factories, ticks in blocks:
+                        if (ticks < 0).any():
+                            factories.play_tick(policy, tick, ticks, target, sell_max)
+                    total = sum(
+                        int(factories.assembled.sum()) for _, factories, _ in blocks
+                    )
+                    line[:] = (
+                        sum(
+                            int(factories.nbrobots.sum()) for _, factories, _ in blocks
+                        ),
+                        total - assembled,
+                        sum(int((ticks == tick).sum()) for _, _, ticks in blocks),
+                        sum(int((ticks < 0).sum()) for _, _, ticks in blocks),
+                    )
+                    assembled = total
+                    tick += 1
+                reply = metrics
+            else:
+                reply = [(index, ticks) for index, _, ticks in blocks]
+        except Exception as err:
+            reply = ClusterError(f"{type(err).__name__}: {err}")
+        conn.send(reply)
+
+
+class Cluster:
+    """
+    Coordinator of worker processes playing factories with the lockstep engine.
+
+    The workers are started at once and kept between runs; add_worker,
+    remove_worker and resize change their number between two runs.
+    """
+
+    def __init__(self, workers: Optional[int] = None, block_size: int = 1000) -> None:
+        self.block_size = block_size
+        self._context = multiprocessing.get_context()
+        # (process, connection) of each worker
+        self._workers = []
+        self.resize(os.cpu_count() if workers is None else workers)
+
+    @property
+    def nbworkers(self) -> int:
+        return len(self._workers)
+
+    def add_worker(self) -> None:
+        conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_worker, args=(child_conn,), daemon=True)
+        process.start()
+        child_conn.close()
+        self._workers.append((process, conn))
+
+    def remove_worker(self) -> None:
+        process, conn = self._workers.pop()
+        try:
+            conn.send(("stop",))
+        except BrokenPipeError:
+            # the worker exited already
+            pass
+        conn.close()
+        process.join()
+
+    def resize(self, nbworkers: int) -> None:
+        while self.nbworkers < nbworkers:
+            self.add_worker()
+        while self.nbworkers > nbworkers:
+            self.remove_worker()
+
+    def close(self) -> None:
+        self.resize(0)
+
+    def __enter__(self) -> "Cluster":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _gather(self, messages: List) -> List:
+        """
+        Send its message to each worker and return their replies. Raise ClusterError
+        once they are all read if one failed.
+        """
+        try:
+            for (_, conn), message in zip(self._workers, messages):
+                conn.send(message)
+        except BrokenPipeError:
+            raise ClusterError("A worker exited")
+        replies = []
+        for _, conn in self._workers:
+            try:
+                replies.append(conn.recv())
+            except EOFError:
+                replies.append(ClusterError("A worker exited"))
+        for reply in replies:
+            if isinstance(reply, ClusterError):
+                raise reply
+        return replies
+
+    def run(
+        self,
+        pilot: FactoryPilot,
+        nb_factories: int,
+        target: int = 30,
+        max_ticks: Optional[int] = None,
+        seed: Seed = None,
+        ticks_per_message: int = 10,
+        on_tick: Optional[Callable[[TickMetrics], None]] = None,
+    ) -> RunReport:
+        """
+        Play nb_factories games until each one reaches target robots.
+
+        The pilot must decide through a lockstep policy, choose_batch, and is sent
+        to the workers. on_tick is called with the metrics of each tick, as they are
+        reported by the workers: ticks_per_message ticks at a time.
+        """
+        if not self.nbworkers:
+            raise ClusterError("The cluster has no worker")
+        sizes = [
+            min(self.block_size, nb_factories - start)
+            for start in range(0, nb_factories, self.block_size)
+        ]
+        seeds = spawn_seeds(seed, len(sizes))
+        sell_max = getattr(pilot, "sell_max", lockstep.MAX_SOLD)
+        start = perf_counter()
+        # blocks are dealt in turn: the workers get the same number of games
+        self._gather(
+            [
+                (
+                    "start",
+                    pilot,
+                    [
+                        (index, sizes[index], seeds[index])
+                        for index in range(rank, len(sizes), self.nbworkers)
+                    ],
+                    target,
+                    sell_max,
+                )
+                for rank in range(0, self.nbworkers)
+            ]
+        )
+        metrics = []
+        tick = 0
+        playing = nb_factories
+        while playing and (max_ticks is None or tick <= max_ticks):
+            nbticks = ticks_per_message
+            if max_ticks is not None:
+                nbticks = min(nbticks, max_ticks + 1 - tick)
+            total = sum(self._gather([("advance", nbticks)] * self.nbworkers))
+            for line in total:
+                if not playing:
+                    # the last factories reached the target earlier in the message
+                    break
+                tick_metrics = TickMetrics(tick, *(int(value) for value in line))
+                metrics.append(tick_metrics)
+                if on_tick is not None:
+                    on_tick(tick_metrics)
+                playing = tick_metrics.playing
+                tick += 1
+        ticks = np.empty(nb_factories, dtype=np.int64)
+        for reply in self._gather([("results",)] * self.nbworkers):
+            for index, block_ticks in reply:
+                first = index * self.block_size
+                ticks[first : first + len(block_ticks)] = block_ticks
+        return RunReport(ticks, metrics, perf_counter() - start)
+
+
+@click.command()
+@click.option(
+    "--factories",
+    default=20000,
+    type=click.IntRange(min=1),
+    help="Number of factories to play. Default 20000.",
+)
+@click.option(
+    "--workers",
+    "workers_list",
+    multiple=True,
+    type=click.IntRange(min=1),
+    help="Worker processes; can be repeated to run again with another number of "
+    "workers, on the same cluster. Default: one per core.",
+)
+@click.option(
+    "--pilot",
+    "pilot_name",
+    type=click.Choice(PILOTS),
+    default="smart",
+    help="Pilot of the factories. Default smart.",
+)
+@click.option(
+    "--target", default=30, help="Number of robots to reach to win. Default 30."
+)
+@click.option(
+    "--block-size", default=1000, help="Factories per block of a shard. Default 1000."
+)
+@click.option(
+    "--ticks-per-message",
+    default=10,
+    help="Ticks played by the workers between two reports. Default 10.",
+)
+@click.option(
+    "--max-ticks",
+    default=None,
+    type=int,
+    help="Ticks after which the factories stop. Default: until all reach the target.",
+)
+@click.option(
+    "--report-every",
+    default=0,
+    help="Print the metrics every N ticks. Default 0: only the summary.",
+)
+@click.option(
+    "--seed",
+    default=None,
+    type=int,
+    help="Seed of the games, for reproducible results. Default: random, the same "
+    "for all the runs.",
+)
+def cluster_command(
+    factories,
+    workers_list,
+    pilot_name,
+    target,
+    block_size,
+    ticks_per_message,
+    max_ticks,
+    report_every,
+    seed,
+):
+    pilot = build_pilot(pilot_name, target)
+    # the same games for every run
+    entropy = np.random.SeedSequence(seed).entropy
+
+    def report(metrics: TickMetrics) -> None:
+        if metrics.tick % report_every == 0:
+            click.echo(
+                f"Tick {metrics.tick:>5}  Robots: {metrics.robots:>9}  "
+                f"Foobars: {metrics.foobars:>7}  Completed: {metrics.completed:>6}  "
+                f"Playing: {metrics.playing:>7}"
+            )
+
+    workers_list = workers_list or (os.cpu_count(),)
+    first = None
+    with Cluster(workers_list[0], block_size) as cluster:
+        for nbworkers in workers_list:
+            cluster.resize(nbworkers)
+            run = cluster.run(
+                pilot,
+                factories,
+                target,
+                max_ticks,
+                entropy,
+                ticks_per_message,
+                report if report_every else None,
+            )
+            first = first or run
+            reached = run.ticks[run.ticks >= 0]
+            foobars = sum(metrics.foobars for metrics in run.metrics)
+            click.secho(
+                f"{nbworkers} workers: {len(run.metrics)} ticks in "
+                f"{run.wall_time:.2f}s, speedup {first.wall_time / run.wall_time:.2f}, "
+                f"{foobars / max(1, len(run.metrics)):.1f} foobars/tick, "
+                f"{foobars / run.wall_time:.0f} foobars/s",
+                fg="blue",
+                bold=True,
+            )
+            if reached.size:
+                percentiles = np.percentile(reached, PERCENTILES)
+                click.echo(
+                    f"{reached.size}/{factories} reached the target, mean "
+                    f"{reached.mean():.1f} ticks, "
+                    + ", ".join(
+                        f"p{rank}: {value:.0f}"
+                        for rank, value in zip(PERCENTILES, percentiles)
+                    )
+                )
+            if not np.array_equal(run.ticks, first.ticks):
+                click.secho("Results differ from the first run", fg="red")
+
+
+if __name__ == "__main__":
+    cluster_command()
@@ -0,0 +1,13 @@
+import asyncio
+
+import pytest
+
+# Fixtures
+
+
+@pytest.fixture
+def loop():
+    """Yield a fresh event loop"""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
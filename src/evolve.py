@@ -0,0 +1,485 @@
+"""
+Evolutionary search of rule-list pilots, by a genetic algorithm.
+
+A rule-list pilot (RulePilot) decides like SmartAutopilot: the activity of an
+available robot is the one of the first rule whose conditions hold and which is
+affordable. A condition compares a resource count, or the number of robots, with a
+threshold. The genome of a pilot is its rules and the number of foobars sold at most
+at once; it is saved as JSON.
+
+The search starts from SmartAutopilot, variations of it and random pilots. Each
+generation, the population is evaluated on a process pool: the fitness of a pilot is
+its mean number of ticks to reach the target over games played on the lockstep
+engine (see model.lockstep), every pilot on the same seeds. The next generation
+keeps the best pilots and breeds the others by tournament selection, one-point
+crossover of the rule lists and mutations. The seeds of a generation only depend on
+the seed of the search and on the generation number: a search gives the same result
+whatever the number of workers, and resumes from its checkpoint as if it had not
+been stopped.
+"""
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import click
+import numpy as np
+
+from model import lockstep
+from model.constants import (
+    ACTIVITY_TYPES,
+    ASSEMBLEFOOBAR,
+    BUYROBOT,
+    MINEBAR,
+    MINEFOO,
+    RES_KEY_BARS,
+    RES_KEY_FOOBARS,
+    RES_KEY_FOOS,
+    RES_KEY_MONEY,
+    SELLFOOBAR,
+    TYPE_NAMES,
+)
+from model.resources import COSTS, SLOTS, ResourceLedger
+from pilots import FactoryPilot
+
+# what a condition can compare: the resources, and the number of robots
+ROBOTS = "robots"
+VARIABLES = (RES_KEY_FOOS, RES_KEY_BARS, RES_KEY_FOOBARS, RES_KEY_MONEY, ROBOTS)
+OPERATORS = ("<", ">=")
+# thresholds drawn at random are below these
+THRESHOLD_MAX = {
+    RES_KEY_FOOS: 20,
+    RES_KEY_BARS: 10,
+    RES_KEY_FOOBARS: 10,
+    RES_KEY_MONEY: 12,
+    ROBOTS: 40,
+}
+MAX_RULES = 8
+MAX_CONDITIONS = 3
+
+# A condition: (variable, operator, threshold)
+Condition = Tuple[str, str, int]
+# A rule: (activity type, conditions)
+Rule = Tuple[int, Tuple[Condition, ...]]
+# A genome: {"rules": [...], "sell_max": int}, as saved in JSON
+Genome = Dict
+
+# resources an activity needs to start, by activity code, as lockstep columns
+_FLOORS = np.zeros((len(ACTIVITY_TYPES), 4), dtype=np.int64)
+for _code, _acttype in enumerate(ACTIVITY_TYPES):
+    for _slot, _qty in COSTS[_acttype]:
+        _FLOORS[_code, _slot] = _qty
+
+
+class RulePilot(FactoryPilot):
+    """
+    This autopilot follows a list of rules: the activity of an available robot is
+    the one of the first rule whose conditions all hold and whose resources are
+    available. Foobars are sold sell_max at most at once.
+    """
+
+    def __init__(self, rules: Sequence[Rule], sell_max: int = 5) -> None:
+        super().__init__()
+        self.rules = [
+            (acttype, tuple(tuple(cond) for cond in conditions))
+            for acttype, conditions in rules
+        ]
+        self.sell_max = sell_max
+
+    @classmethod
+    def from_dict(cls, genome: Genome) -> "RulePilot":
+        return cls(
+            [
+                (TYPE_NAMES.index(rule["activity"]), rule["conditions"])
+                for rule in genome["rules"]
+            ],
+            genome["sell_max"],
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "RulePilot":
+        with open(path) as file:
+            return cls.from_dict(json.load(file))
+
+    def to_dict(self) -> Genome:
+        return {
+            "rules": [
+                {
+                    "activity": TYPE_NAMES[acttype],
+                    "conditions": [list(cond) for cond in conditions],
+                }
+                for acttype, conditions in self.rules
+            ],
+            "sell_max": self.sell_max,
+        }
+
+    def get_activities(self, situation: Dict) -> List:
+        robots = situation.get("situation").get("robots")
+        return self.choose(
+            self._get_resources(situation),
+            self._get_nb_possible_actions(robots),
+            len(robots),
+        )
+
+    def decide(self, res: ResourceLedger, nbrobots: int) -> Optional[int]:
+        """Activity type of the first rule which applies, None if none applies"""
+        slots = res.slots
+        for acttype, conditions in self.rules:
+            if not res.can_afford(COSTS[acttype]):
+                continue
+            for variable, operator, threshold in conditions:
+                value = nbrobots if variable == ROBOTS else slots[SLOTS[variable]]
+                if (value < threshold) != (operator == "<"):
+                    break
+            else:
+                return acttype
+        return None
+
+    def choose(self, res: ResourceLedger, nbready: int, nbrobots: int) -> List:
+        """
+        Choose the activities of nbready robots of a fleet of nbrobots with the
+        resources res
+
+        The resources of the chosen activities are reserved in res.
+        """
+        activities = []
+        for _ in range(0, nbready):
+            acttype = self.decide(res, nbrobots)
+            if acttype is None:
+                # the resources are the same for the next robots: nothing either
+                break
+            activities.append(self._reserve(res, acttype, self.sell_max))
+        return activities
+
+    def choose_batch(self, resources: np.ndarray, nbrobots: np.ndarray) -> np.ndarray:
+        """
+        Vectorized decision for one robot of many factories (see model.lockstep)
+
+        The foobars sold at once are capped by the engine: see sell_max of
+        lockstep.play.
+        """
+        columns = dict(zip(VARIABLES, list(resources.T) + [nbrobots]))
+        masks, codes = [], []
+        for acttype, conditions in self.rules:
+            code = lockstep.TYPE_CODES[acttype]
+            mask = (resources >= _FLOORS[code]).all(axis=1)
+            for variable, operator, threshold in conditions:
+                below = columns[variable] < threshold
+                mask &= below if operator == "<" else ~below
+            masks.append(mask)
+            codes.append(code)
+        return np.select(masks, codes, lockstep.NO_ACTIVITY)
+
+
+def smart_genome() -> Genome:
+    """The rules of SmartAutopilot with its default thresholds"""
+    return RulePilot(
+        [
+            (BUYROBOT, ()),
+            (SELLFOOBAR, ()),
+            (MINEFOO, ((RES_KEY_FOOS, "<", 7),)),
+            (MINEBAR, ((RES_KEY_BARS, "<", 1),)),
+            (ASSEMBLEFOOBAR, ()),
+        ]
+    ).to_dict()
+
+
+def _random_condition(rng: np.random.Generator) -> List:
+    variable = VARIABLES[rng.integers(len(VARIABLES))]
+    return [
+        variable,
+        OPERATORS[rng.integers(len(OPERATORS))],
+        int(rng.integers(0, THRESHOLD_MAX[variable] + 1)),
+    ]
+
+
+def _random_rule(rng: np.random.Generator) -> Dict:
+    return {
+        "activity": TYPE_NAMES[rng.integers(len(TYPE_NAMES))],
+        "conditions": [
+            _random_condition(rng)
+            for _ in range(0, int(rng.integers(0, MAX_CONDITIONS)))
+        ],
+    }
+
+
+def random_genome(rng: np.random.Generator) -> Genome:
+    return {
+        "rules": [_random_rule(rng) for _ in range(0, int(rng.integers(2, MAX_RULES)))],
+        "sell_max": int(rng.integers(1, lockstep.MAX_SOLD + 1)),
+    }
+
+
+def mutate(genome: Genome, rng: np.random.Generator) -> Genome:
+    """A copy of genome with one change, sometimes more"""
+    genome = json.loads(json.dumps(genome))
+    rules = genome["rules"]
+    while True:
+        rule = rules[rng.integers(len(rules))]
+        conditions = rule["conditions"]
+        change = rng.integers(8)
+        if change == 0 and conditions:
+            # move a threshold
+            cond = conditions[rng.integers(len(conditions))]
+            cond[2] = max(0, cond[2] + int(rng.choice([-3, -2, -1, 1, 2, 3])))
+        elif change == 1 and conditions:
+            cond = conditions[rng.integers(len(conditions))]
+            cond[1] = OPERATORS[1 - OPERATORS.index(cond[1])]
+        elif change == 2 and len(conditions) < MAX_CONDITIONS:
+            conditions.append(_random_condition(rng))
+        elif change == 3 and conditions:
+            conditions.pop(rng.integers(len(conditions)))
+        elif change == 4:
+            rule["activity"] = TYPE_NAMES[rng.integers(len(TYPE_NAMES))]
+        elif change == 5 and len(rules) > 1:
+            first = int(rng.integers(len(rules) - 1))
+            rules[first], rules[first + 1] = rules[first + 1], rules[first]
+        elif change == 6 and len(rules) < MAX_RULES:
+            rules.insert(rng.integers(len(rules) + 1), _random_rule(rng))
+        elif change == 7 and len(rules) > 1:
+            rules.pop(rng.integers(len(rules)))
+        else:
+            genome["sell_max"] = int(rng.integers(1, lockstep.MAX_SOLD + 1))
+        if rng.random() >= 0.5:
+            return genome
+
+
+def crossover(first: Genome, second: Genome, rng: np.random.Generator) -> Genome:
+    """The first rules of first followed by the last rules of second"""
+    head = first["rules"][: rng.integers(1, len(first["rules"]) + 1)]
+    tail = second["rules"][rng.integers(len(second["rules"])) :]
+    return json.loads(
+        json.dumps(
+            {
+                "rules": (head + tail)[:MAX_RULES],
+                "sell_max": (first if rng.random() < 0.5 else second)["sell_max"],
+            }
+        )
+    )
+
+
+def evaluate(genome: Genome, target: int, nbgames: int, seed, max_ticks: int) -> float:
+    """Mean ticks of the pilot over nbgames games, max_ticks + 1 if not reached"""
+    pilot = RulePilot.from_dict(genome)
+    ticks = lockstep.play(
+        pilot.choose_batch,
+        nbgames,
+        target,
+        seed=seed,
+        max_ticks=max_ticks,
+        sell_max=pilot.sell_max,
+    )
+    ticks[ticks < 0] = max_ticks + 1
+    return float(ticks.mean())
+
+
+def generation_seeds(entropy: int, generation: int) -> List[np.random.SeedSequence]:
+    """Seeds of the games and of the breeding of a generation of a search"""
+    return np.random.SeedSequence(entropy, spawn_key=(generation,)).spawn(2)
+
+
+class Search:
+    """
+    State of an evolutionary search: the population of the current generation, and
+    the best pilots found. It is saved to and loaded from a JSON checkpoint.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        target: int = 30,
+        nbgames: int = 200,
+        elite: int = 2,
+        tournament: int = 3,
+        max_ticks: int = 2000,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.target = target
+        self.nbgames = nbgames
+        self.elite = elite
+        self.tournament = tournament
+        self.max_ticks = max_ticks
+        self.entropy = np.random.SeedSequence(seed).entropy
+        self.generation = 0
+        # (mean ticks, genome) of the best pilot of each generation
+        self.history: List[Tuple[float, Genome]] = []
+        rng = np.random.default_rng(generation_seeds(self.entropy, 0)[1])
+        smart = smart_genome()
+        self.population = [smart] + [
+            mutate(smart, rng) if index % 2 else random_genome(rng)
+            for index in range(1, size)
+        ]
+
+    def save(self, path: str) -> None:
+        """Write the checkpoint, replacing the previous one at once"""
+        state = dict(self.__dict__)
+        state["history"] = [list(entry) for entry in self.history]
+        with open(path + ".tmp", "w") as file:
+            json.dump(state, file)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "Search":
+        with open(path) as file:
+            state = json.load(file)
+        search = cls.__new__(cls)
+        search.__dict__.update(state)
+        search.history = [tuple(entry) for entry in state["history"]]
+        return search
+
+    def step(self, pool: ProcessPoolExecutor) -> float:
+        """Evaluate the current generation, breed the next one, return the best"""
+        games_seed, breeding_seed = generation_seeds(self.entropy, self.generation)
+        population = self.population
+        fitness = list(
+            pool.map(
+                evaluate,
+                population,
+                [self.target] * len(population),
+                [self.nbgames] * len(population),
+                [games_seed] * len(population),
+                [self.max_ticks] * len(population),
+            )
+        )
+        ranking = sorted(range(0, len(population)), key=fitness.__getitem__)
+        self.history.append((fitness[ranking[0]], population[ranking[0]]))
+        rng = np.random.default_rng(breeding_seed)
+
+        def select() -> Genome:
+            contenders = rng.choice(len(population), self.tournament, replace=False)
+            return population[min(contenders, key=fitness.__getitem__)]
+
+        children = [population[index] for index in ranking[: self.elite]]
+        while len(children) < len(population):
+            child = crossover(select(), select(), rng)
+            children.append(mutate(child, rng))
+        self.population = children
+        self.generation += 1
+        return fitness[ranking[0]]
+
+
+@click.command()
+@click.option(
+    "--population",
+    default=32,
+    type=click.IntRange(min=1),
+    help="Pilots per generation. Default 32.",
+)
+@click.option("--generations", default=20, help="Generations to breed. Default 20.")
+@click.option("--games", default=200, help="Games played by each pilot per generation.")
+@click.option(
+    "--target", default=30, help="Number of robots to reach to win. Default 30."
+)
+@click.option(
+    "--elite",
+    default=2,
+    type=click.IntRange(min=0),
+    help="Best pilots kept as they are by the next generation, and validated.",
+)
+@click.option(
+    "--tournament",
+    default=3,
+    type=click.IntRange(min=1),
+    help="Pilots per selection tournament, --population at most.",
+)
+@click.option(
+    "--max-ticks",
+    default=2000,
+    help="Ticks after which a game which did not reach the target stops, counted "
+    "max-ticks + 1. Default 2000.",
+)
+@click.option(
+    "--validation-games",
+    default=2000,
+    help="Games played to compare the best pilot found with SmartAutopilot.",
+)
+@click.option(
+    "--workers", default=None, type=int, help="Worker processes. Default: one per core."
+)
+@click.option(
+    "--seed",
+    default=None,
+    type=int,
+    help="Seed of the search, for reproducible results. Default: random.",
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False),
+    help="File where the search is saved after each generation. If it exists, the "
+    "search resumes from it, with its own settings.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False),
+    default="rules.json",
+    help="File of the best pilot found, for foobarfactory.py --pilot evolved. "
+    "Default rules.json.",
+)
+def evolve_command(
+    population,
+    generations,
+    games,
+    target,
+    elite,
+    tournament,
+    max_ticks,
+    validation_games,
+    workers,
+    seed,
+    checkpoint,
+    output,
+):
+    if checkpoint and os.path.exists(checkpoint):
+        search = Search.load(checkpoint)
+        click.secho(
+            f"Resuming from generation {search.generation} of {checkpoint}", fg="blue"
+        )
+    else:
+        if tournament > population:
+            raise click.BadParameter(
+                f"{tournament} pilots per tournament out of a population of "
+                f"{population}",
+                param_hint="--tournament",
+            )
+        search = Search(population, target, games, elite, tournament, max_ticks, seed)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        while search.generation < generations:
+            best = search.step(pool)
+            click.echo(f"Generation {search.generation:>4}: best {best:.1f} ticks")
+            if checkpoint:
+                search.save(checkpoint)
+        # the best of each generation may have been lucky on its games: play the
+        # last ones again, with SmartAutopilot, on other games. The elite is the one
+        # of the search, a resumed search ignores --elite; the last generations
+        # often share their best genome, each one is played once.
+        smart = smart_genome()
+        candidates = []
+        last = search.history[max(0, len(search.history) - search.elite) :]
+        for _, genome in last:
+            if genome != smart and genome not in candidates:
+                candidates.append(genome)
+        candidates.append(smart)
+        seed = generation_seeds(search.entropy, generations)[0]
+        fitness = list(
+            pool.map(
+                evaluate,
+                candidates,
+                [search.target] * len(candidates),
+                [validation_games] * len(candidates),
+                [seed] * len(candidates),
+                [search.max_ticks] * len(candidates),
+            )
+        )
+    best = min(range(0, len(candidates)), key=fitness.__getitem__)
+    with open(output, "w") as file:
+        json.dump(candidates[best], file, indent=2)
+    click.secho(
+        f"Best pilot: {fitness[best]:.1f} ticks, SmartAutopilot: {fitness[-1]:.1f} "
+        f"ticks, over {validation_games} games. Saved to {output}",
+        fg="green",
+    )
+
+
+if __name__ == "__main__":
+    evolve_command()
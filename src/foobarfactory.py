@@ -1,42 +1,55 @@
-from typing import Dict, Iterable, List
 import click
-import copy
+import cProfile
 import logging
 from datetime import datetime
 import os
+from time import monotonic, perf_counter
+from typing import Callable
 
+from model import cohorts
+from model.constants import STATUS_NAMES, TYPE_NAMES
 from model.factory import FactoryException
 from runtime import Runtime
-from model.constants import (
-    READY,
-    RES_KEY_BARS,
-    RES_KEY_FOOS,
-    RES_KEY_FOOBARS,
-    RES_KEY_MONEY,
-    MINEFOO,
-    MINEBAR,
-    ASSEMBLEFOOBAR,
-    SELLFOOBAR,
-    BUYROBOT,
+from pilots import (
+    DumbAutopilot,
+    InteractiveFactoryPilot,
+    SmartAutopilot,
+    StreamPilot,
 )
+from evolve import RulePilot
+from gametrace import TraceRecorder
+from mcts import MctsAutopilot
+from optimal import OptimalPilot
+from profiling import NullProfiler, PhaseProfiler, StackSampler
+from runlog import LEVELS, RunLog
 
 LOG_DIR = os.getenv("LOG_DIR", ".")
 
-# Logging setup
+# The handlers are set up by the command only (see runlog)
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-file_handler = logging.FileHandler(
-    f"{LOG_DIR}/foobarfactoryrun_{datetime.timestamp(datetime.now())}.log"
-)
-formatter = logging.Formatter("%(asctime)s : %(levelname)s : %(message)s")
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
 
 
 # The factory instance
 FOOBARFACTORY = Runtime()
 
 
+def readable_robot(bot):
+    """Replace the status and type codes of a robot snapshot by their names"""
+    current = bot["current"]
+    if current:
+        current = dict(
+            current,
+            status=STATUS_NAMES[current["status"]],
+            type=TYPE_NAMES[current["type"]],
+        )
+    previous = bot["previous"]
+    return {
+        "status": STATUS_NAMES[bot["status"]],
+        "current": current,
+        "previous": TYPE_NAMES[previous] if previous is not None else None,
+    }
+
+
 def display(datadict, cleanscreen=True):
     if cleanscreen:
         click.clear()
@@ -48,201 +61,52 @@ def display(datadict, cleanscreen=True):
     click.secho(f"Money: {datadict['situation']['resources']['money']}", fg="green")
     click.secho(f"Robots: {len(datadict['situation']['robots'])}", fg="green")
     for bot in datadict["situation"]["robots"]:
-        click.secho(f"Robot: {bot}", fg="red", bg="white")
-
-
-class FactoryPilot:
-    """Base class for pilot: choose activities to do depending on the situation."""
-
-    @staticmethod
-    def _get_nb_possible_actions(robots: Iterable[Dict]):
-        if not robots:
-            return 0
-        return len([bot for bot in robots if bot["status"] == READY])
-
-    @staticmethod
-    def _get_type_possible_actions(resources):
-        actions = [MINEFOO, MINEBAR]
-        if resources[RES_KEY_FOOS] > 0 and resources[RES_KEY_BARS] > 0:
-            actions.append(ASSEMBLEFOOBAR)
-        if resources[RES_KEY_FOOBARS] > 0:
-            actions.append(SELLFOOBAR)
-        if resources[RES_KEY_MONEY] >= 3 and resources[RES_KEY_FOOS] >= 6:
-            actions.append(BUYROBOT)
-        return actions
-
-    def get_activities(self, situation: Dict) -> List:
-        raise NotImplementedError()
+        click.secho(f"Robot: {readable_robot(bot)}", fg="red", bg="white")
 
 
-class InteractiveFactoryPilot(FactoryPilot):
-
-    display_labels = {
-        MINEFOO: "Mine (F)oo",
-        MINEBAR: "Mine (B)ar",
-        ASSEMBLEFOOBAR: "(A)ssemble foobar",
-        SELLFOOBAR: "(S)ell foobars",
-        BUYROBOT: "Buy (R)obot",
-    }
-
-    def get_activities(self, situation: Dict) -> List:
-        res = copy.deepcopy(situation.get("situation").get("resources"))
-        activities = []
-        for _ in range(
-            0, self._get_nb_possible_actions(situation.get("situation").get("robots"))
-        ):
-            possible_actions = [
-                self.display_labels.get(act)
-                for act in self._get_type_possible_actions(res)
-            ]
-            possible_actions.extend(["Do (N)othing"])
-            valid_key_entered = False
-            while not valid_key_entered:
-                act = click.prompt(", ".join(possible_actions), type=str)
-                if act.upper() == "F":
-                    activities.append(MINEFOO)
-                    valid_key_entered = True
-                elif act.upper() == "B":
-                    activities.append(MINEBAR)
-                    valid_key_entered = True
-                elif act.upper() == "A":
-                    activities.append(ASSEMBLEFOOBAR)
-                    res[RES_KEY_FOOS] -= 1
-                    res[RES_KEY_BARS] -= 1
-                    valid_key_entered = True
-                elif act.upper() == "S":
-                    activities.append(
-                        (SELLFOOBAR, {"nbtosell": min(res[RES_KEY_FOOBARS], 5)})
-                    )
-                    res[RES_KEY_FOOBARS] -= min(res[RES_KEY_FOOBARS], 5)
-                    valid_key_entered = True
-                elif act.upper() == "R":
-                    activities.append(BUYROBOT)
-                    res[RES_KEY_MONEY] -= 3
-                    res[RES_KEY_FOOS] -= 6
-                    valid_key_entered = True
-                elif act.upper() == "N":
-                    # voluntary no action
-                    valid_key_entered = True
-                    continue
-                else:
-                    click.secho("Invalid key pressed, try again", fg="white", bg="red")
-        return activities
-
+def summary(tick, nbrobots, res, elapsed):
+    """Final situation, without the robots details"""
+    click.secho(
+        f"Tick {tick}  Robots: {nbrobots}  "
+        f"Foos: {res['foos']}  Bars: {res['bars']}  Foobars: {res['foobars']}  "
+        f"Money: {res['money']}  Wall time: {elapsed:.3f}s",
+        fg="green",
+    )
 
-class DumbAutopilot(FactoryPilot):
 
+class ProgressLine:
     """
-    This autopilot follows a straightforward strategy:
-
-    - 28 new robots to buy
-    - means 6*28 = 168 foos to provide
-    - and 3*28 = 84 money units to provide
-    - means 84 foobars to sell
-    - means 84 foobars to assemble but that will require more attempts
-    - means 84 more foos and 84 bars to provide
-
-    The strategy will be:
-    - assemble 84 foobars
-    - mine 168 foos
-    - buy robots
-
-    Obviously this is not optimized at all because only two robots are doing all the work.
+    One line progress, rewritten in place at most once per interval seconds of
+    clock. A line shorter than the previous one is padded to erase it.
     """
 
-    def __init__(self, target) -> None:
-        super().__init__()
+    def __init__(
+        self, target: int, interval: float = 0.2, clock: Callable[[], float] = monotonic
+    ) -> None:
         self.target = target
-
-    def get_activities(self, situation: Dict) -> List:
-        # nbpa will always be 2 at the beginning because this strategy is dumb:
-        nbpa = self._get_nb_possible_actions(situation.get("situation").get("robots"))
-        nbrobots = len(situation.get("situation").get("robots"))
-        # when nbrobots is greater than 2, it means we are buying robots with all
-        # our resources, and do nothing else than that.
-        # get a snapshot of the current resources
-        res = copy.deepcopy(situation.get("situation").get("resources"))
-        # hold chosen activities
-        activities = []
-        for _ in range(0, nbpa):
-            nbfoobars = res.get(RES_KEY_FOOBARS)
-            nbfoos = res.get(RES_KEY_FOOS)
-            nbmoney = res.get(RES_KEY_MONEY)
-            if nbrobots == 2:
-                # Do foobars as long as we haven't reach 84
-                if nbfoobars + nbmoney < 3 * (self.target - 2):
-                    nbmissing = 3 * (self.target - 2) - nbmoney - nbfoobars
-                    if res.get(RES_KEY_FOOS) < nbmissing:
-                        activities.append(MINEFOO)
-                    elif res.get(RES_KEY_BARS) < nbmissing:
-                        activities.append(MINEBAR)
-                    else:
-                        # enough resources
-                        activities.append(ASSEMBLEFOOBAR)
-                        # adjust resources for next activity choice of the same round
-                        # assuming foobar will succeed
-                        res[RES_KEY_FOOS] -= 1
-                        res[RES_KEY_BARS] -= 1
-                # Do foos as long as we haven't reach 168
-                elif nbfoos < 6 * (self.target - 2):
-                    activities.append(MINEFOO)
-                # Sell foobars
-                elif nbmoney < 3 * (self.target - 2):
-                    nbfoobars = res.get(RES_KEY_FOOBARS)
-                    activities.append((SELLFOOBAR, {"nbtosell": min(nbfoobars, 5)}))
-                    # adjust resources for next activity choice of the same round
-                    res[RES_KEY_FOOBARS] -= min(nbfoobars, 5)
-                # Buy robot
-                elif nbmoney >= 3 and nbfoos >= 6:
-                    activities.append(BUYROBOT)
-                    res[RES_KEY_MONEY] -= 3
-                    res[RES_KEY_FOOS] -= 6
-            elif nbmoney >= 3 and nbfoos >= 6:
-                activities.append(BUYROBOT)
-                res[RES_KEY_MONEY] -= 3
-                res[RES_KEY_FOOS] -= 6
-        return activities
-
-
-class SmartAutopilot(FactoryPilot):
-    """
-    This autopilot follows a smarter strategy: buy robots as fast as possible :
-
-    - if you can buy a robot, buy it
-    - if not, sell a foobar if you can
-    - if not :
-      * if you have less than 7 foos, mine one
-      * if you have more than 7 foos:
-        - if you have less than 1 bar, mine one
-        - else assemble one foobar
-    """
-
-    def get_activities(self, situation: Dict) -> List:
-        nbpa = self._get_nb_possible_actions(situation.get("situation").get("robots"))
-        res = copy.deepcopy(situation.get("situation").get("resources"))
-        # hold chosen activities
-        activities = []
-        for _ in range(0, nbpa):
-            nbfoobars = res.get(RES_KEY_FOOBARS)
-            nbbars = res.get(RES_KEY_BARS)
-            nbfoos = res.get(RES_KEY_FOOS)
-            nbmoney = res.get(RES_KEY_MONEY)
-            if nbmoney >= 3 and nbfoos >= 6:
-                activities.append(BUYROBOT)
-                res[RES_KEY_MONEY] -= 3
-                res[RES_KEY_FOOS] -= 6
-            elif nbfoobars >= 1:
-                activities.append((SELLFOOBAR, {"nbtosell": min(nbfoobars, 5)}))
-                res[RES_KEY_FOOBARS] -= min(nbfoobars, 5)
-            elif nbfoos < 7:
-                activities.append(MINEFOO)
-            elif nbbars < 1:
-                activities.append(MINEBAR)
-            elif nbfoos >= 1 and nbbars >= 1:
-                activities.append(ASSEMBLEFOOBAR)
-                res[RES_KEY_FOOS] -= 1
-                res[RES_KEY_BARS] -= 1
-        return activities
+        self.interval = interval
+        self.clock = clock
+        self.next_refresh = 0.0
+        self.width = 0
+
+    def update(self, datadict, force=False):
+        now = self.clock()
+        if now < self.next_refresh and not force:
+            return
+        self.next_refresh = now + self.interval
+        res = datadict["situation"]["resources"]
+        line = (
+            f"Tick {datadict['tick']}  "
+            f"Robots: {len(datadict['situation']['robots'])}/{self.target}  "
+            f"Foos: {res['foos']}  Bars: {res['bars']}  Foobars: {res['foobars']}  "
+            f"Money: {res['money']}"
+        )
+        click.echo(f"\r{line.ljust(self.width)}", nl=False)
+        self.width = len(line)
+
+    def finish(self, datadict):
+        self.update(datadict, force=True)
+        click.echo()
 
 
 @click.command()
@@ -256,37 +120,263 @@ class SmartAutopilot(FactoryPilot):
 )
 @click.option(
     "--pilot",
-    type=click.Choice(["smart", "dumb", "interactive"]),
+    type=click.Choice(["smart", "dumb", "mcts", "optimal", "evolved", "interactive"]),
     default="smart",
     help="Kind of pilot who run the factory. Default smart. if interactive, you play",
 )
-def foobarfactory(delay: int, target: int, pilot: str):
+@click.option(
+    "--mcts-rollouts",
+    default=256,
+    type=click.IntRange(min=1),
+    help="Rollouts per decision of the mcts pilot. Default 256.",
+)
+@click.option(
+    "--mcts-time",
+    default=None,
+    type=float,
+    help="Seconds per decision of the mcts pilot, the first budget exhausted stops "
+    "the search. Default: no time limit.",
+)
+@click.option(
+    "--mcts-workers",
+    default=None,
+    type=click.IntRange(min=0),
+    help="Worker processes of the mcts pilot rollouts, 0 to play them in the main "
+    "process. Default: one per core.",
+)
+@click.option(
+    "--policy",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Policy table of the optimal pilot, computed by optimal.py.",
+)
+@click.option(
+    "--rules",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Rules of the evolved pilot, found by evolve.py.",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(["object", "cohort"]),
+    default="object",
+    help="object: one object per robot. cohort: robots counted by state, for huge "
+    "targets: headless, smart and dumb pilots only, without log, trace or profile. "
+    "Default object.",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Feed the smart or dumb pilot with the changes of the factory instead of "
+    "its whole situation. With --headless and --log-level off, the situation is "
+    "not built during the run.",
+)
+@click.option(
+    "--event-driven/--tick-by-tick",
+    default=True,
+    help="Jump directly to the next tick where something happens. Default event-driven.",
+)
+@click.option(
+    "--seed",
+    default=None,
+    type=int,
+    help="Seed of the random outcomes, to replay a run. Default: random.",
+)
+@click.option(
+    "--headless",
+    "--quiet",
+    "headless",
+    is_flag=True,
+    help="Render nothing during the run, only a final summary.",
+)
+@click.option(
+    "--progress",
+    is_flag=True,
+    help="Show a progress line, refreshed at a fixed rate. Implies --headless.",
+)
+@click.option(
+    "--progress-interval",
+    default=0.2,
+    help="Seconds between two refreshes of the progress line. Default 0.2.",
+)
+@click.option(
+    "--log-level",
+    type=click.Choice(list(LEVELS)),
+    default="info",
+    help="Level of the JSON lines run log. off: no log file. Default info.",
+)
+@click.option(
+    "--log-every",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Log the situation every N rounds only. Default 1: every round.",
+)
+@click.option(
+    "--record",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Record the game in this binary trace file, to replay it with gametrace.py.",
+)
+@click.option(
+    "--keyframe-every",
+    default=100,
+    type=click.IntRange(min=1),
+    help="Rounds between two keyframes of the recorded trace. Default 100.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Time the phases of the game loop and print a report at the end.",
+)
+@click.option(
+    "--profile-cprofile",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Dump cProfile stats (pstats format) to this file. Implies --profile.",
+)
+@click.option(
+    "--profile-stacks",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Sample the stack and dump it to this file, in the collapsed format of "
+    "flamegraphs. Implies --profile. Unix only.",
+)
+def foobarfactory(
+    delay: int,
+    target: int,
+    pilot: str,
+    mcts_rollouts: int,
+    mcts_time: float,
+    mcts_workers: int,
+    policy: str,
+    rules: str,
+    engine: str,
+    stream: bool,
+    event_driven: bool,
+    seed: int,
+    headless: bool,
+    progress: bool,
+    progress_interval: float,
+    log_level: str,
+    log_every: int,
+    record: str,
+    keyframe_every: int,
+    profile: bool,
+    profile_cprofile: str,
+    profile_stacks: str,
+):
     if pilot == "smart":
         pilot_instance = SmartAutopilot()
     elif pilot == "dumb":
         pilot_instance = DumbAutopilot(target=target)
+    elif pilot == "mcts":
+        pilot_instance = MctsAutopilot(
+            target=target,
+            rollouts=mcts_rollouts,
+            time_budget=mcts_time,
+            workers=mcts_workers,
+            seed=seed,
+        )
+    elif pilot == "optimal":
+        if not policy:
+            raise click.UsageError("The optimal pilot needs a --policy table")
+        pilot_instance = OptimalPilot(policy)
+    elif pilot == "evolved":
+        if not rules:
+            raise click.UsageError("The evolved pilot needs a --rules file")
+        pilot_instance = RulePilot.load(rules)
     else:
         pilot_instance = InteractiveFactoryPilot()
+    if engine == "cohort":
+        if pilot not in ("smart", "dumb"):
+            raise click.UsageError("The cohort engine plays the smart and dumb pilots")
+        start = perf_counter()
+        tick, fleet = cohorts.play(
+            cohorts.cohort_policy(pilot_instance.choose_batch), target, seed=seed
+        )
+        summary(tick, fleet.nbrobots, fleet.resources_dict(), perf_counter() - start)
+        click.secho(f"Number of robots reached after {tick} ticks", fg="green")
+        return
+    if stream:
+        if pilot not in ("smart", "dumb"):
+            raise click.UsageError("Only the smart and dumb pilots read a stream")
+        pilot_instance = StreamPilot(pilot_instance, FOOBARFACTORY.change_stream())
+    headless = headless or progress
+    if headless and pilot == "interactive":
+        raise click.UsageError("The interactive pilot needs the situation displayed")
+    progress_line = ProgressLine(target, progress_interval) if progress else None
+    run_log = RunLog.open(
+        logger,
+        f"{LOG_DIR}/foobarfactoryrun_{datetime.timestamp(datetime.now())}.log",
+        level=log_level,
+        every=log_every,
+    )
     FOOBARFACTORY.set_tick_delay(delay)
-    while len(FOOBARFACTORY.display().get("situation").get("robots")) < target:
-        logger.info(FOOBARFACTORY.display())
-        display(FOOBARFACTORY.display())
-        activities = pilot_instance.get_activities(FOOBARFACTORY.display())
+    FOOBARFACTORY.set_event_driven(event_driven)
+    FOOBARFACTORY.set_seed(seed)
+    recorder = TraceRecorder(open(record, "wb"), keyframe_every) if record else None
+    FOOBARFACTORY.set_recorder(recorder)
+    profiling = profile or profile_cprofile or profile_stacks
+    profiler = PhaseProfiler() if profiling else NullProfiler()
+    FOOBARFACTORY.set_profiler(profiler)
+    sampler = StackSampler() if profile_stacks else None
+    cprofiler = cProfile.Profile() if profile_cprofile else None
+    if sampler:
+        sampler.start()
+    if cprofiler:
+        cprofiler.enable()
+    # nothing reads the situation of the rounds
+    blind = stream and headless and not progress_line and log_level == "off"
+    start = perf_counter()
+    while FOOBARFACTORY.count_robots() < target:
+        situation = None if blind else FOOBARFACTORY.display()
+        with profiler.phase("log"):
+            run_log.round(situation)
+        with profiler.phase("render"):
+            if not headless:
+                display(situation)
+            elif progress_line:
+                progress_line.update(situation)
+        with profiler.phase("pilot"):
+            activities = pilot_instance.get_activities(situation)
         try:
             if activities:
                 FOOBARFACTORY.program(*activities)
-                FOOBARFACTORY.run()
+                FOOBARFACTORY.run(situation=False)
             else:
-                FOOBARFACTORY.run(force_one_next=True)
+                FOOBARFACTORY.run(force_one_next=True, situation=False)
         except FactoryException as err:
             logger.error(str(err))
-            click.secho(f"Factory error: {str(err)}", fg="white", bg="red")
-    logger.info(FOOBARFACTORY.display())
-    display(FOOBARFACTORY.display())
+            if not headless:
+                click.secho(f"Factory error: {str(err)}", fg="white", bg="red")
+        profiler.end_round()
+    elapsed = perf_counter() - start
+    if pilot == "mcts":
+        pilot_instance.close()
+    if cprofiler:
+        cprofiler.disable()
+        cprofiler.dump_stats(profile_cprofile)
+    if sampler:
+        sampler.stop()
+        sampler.dump(profile_stacks)
+    run_log.round(FOOBARFACTORY.display(), force=True)
+    run_log.close()
+    if recorder:
+        recorder.close(FOOBARFACTORY.display()["tick"])
+    if headless:
+        if progress_line:
+            progress_line.finish(FOOBARFACTORY.display())
+        final = FOOBARFACTORY.display()
+        summary(
+            final["tick"],
+            len(final["situation"]["robots"]),
+            final["situation"]["resources"],
+            elapsed,
+        )
+    else:
+        display(FOOBARFACTORY.display())
     click.secho(
         f"Number of robots reached after {FOOBARFACTORY.display().get('tick')} ticks",
         fg="green",
     )
+    if profiling:
+        for line in profiler.format_report():
+            click.echo(line)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,355 @@
+"""
+Binary trace of a game, and its deterministic replay.
+
+A trace is a header followed by length-prefixed records:
+
+    header:   b"FBFT" + format version (u8)
+    record:   payload length (u32) + payload, the first byte of which is its kind
+
+- round (R): tick (u32), number of activities (u16), then 2 bytes per activity
+  programmed this round: its type code and its parameter, which is the outcome
+  drawn for it (index of the MineBar duration in randomness.BAR_DURATIONS, the
+  AssembleFoobar result) or the number of foobars to sell.
+- keyframe (K): the whole situation of the factory at a tick, before the round of
+  this tick is programmed: tick (u32), resources (4 x i64), robots (u32) then
+  13 bytes per robot (see ROBOT), then the pool of ready robots, whose order
+  decides the robots assigned next: buckets (u16), and for each bucket its previous
+  activity type (i8), its robots (u32) and their indexes (u32 each).
+- end (E): the last tick of the game (u32).
+
+The rounds are enough to replay the game since the runtime is deterministic given
+the decisions and the random outcomes; the keyframes allow to rebuild the
+situation at any tick without replaying the game from the start.
+"""
+
+import struct
+from bisect import bisect_right
+from time import perf_counter
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import click
+
+from model import activities, robots
+from model.constants import ASSEMBLEFOOBAR, MINEBAR, SELLFOOBAR
+from model.factory import Factory, ReadyPool
+from model.randomness import BAR_DURATIONS, ScriptedOutcomes
+from model.resources import ResourceLedger
+
+MAGIC = b"FBFT"
+# version 2: the robots of a round are assigned all at once (see
+# ReadyPool.take_batch), the rounds of version 1 would replay another game
+VERSION = 2
+HEADER = struct.Struct("<4sB")
+LENGTH = struct.Struct("<I")
+ROUND = struct.Struct("<cIH")
+ACTIVITY = struct.Struct("<BB")
+KEYFRAME = struct.Struct("<cIqqqqI")
+# robot status, previous type, current activity type, status and parameter,
+# activity start tick, robot scheduled start tick (-1 for none)
+ROBOT = struct.Struct("<BbbBBii")
+BUCKETS = struct.Struct("<H")
+BUCKET = struct.Struct("<bI")
+INDEX = struct.Struct("<I")
+END = struct.Struct("<cI")
+KIND_ROUND, KIND_KEYFRAME, KIND_END = b"R", b"K", b"E"
+
+
+class TraceException(Exception):
+    """Raised on a malformed trace"""
+
+    pass
+
+
+# Encoding
+
+
+def activity_param(act: activities.BaseActivity) -> int:
+    """The random outcome, or the number of foobars to sell, of an activity"""
+    if act.type == MINEBAR:
+        return BAR_DURATIONS.index(act.duration)
+    if act.type == ASSEMBLEFOOBAR:
+        return act.future_result
+    if act.type == SELLFOOBAR:
+        return act.nbtosell
+    return 0
+
+
+def build_activities(descriptors: List[Tuple[int, int]]) -> List:
+    """Rebuild the activities of a round from their (type, parameter)"""
+    outcomes = ScriptedOutcomes(
+        [BAR_DURATIONS[param] for acttype, param in descriptors if acttype == MINEBAR],
+        [param for acttype, param in descriptors if acttype == ASSEMBLEFOOBAR],
+    )
+    return [
+        (
+            activities.get_activty(acttype, outcomes, nbtosell=param)
+            if acttype == SELLFOOBAR
+            else activities.get_activty(acttype, outcomes)
+        )
+        for acttype, param in descriptors
+    ]
+
+
+def _none(value: Optional[int]) -> int:
+    return -1 if value is None else value
+
+
+def _some(value: int) -> Optional[int]:
+    return None if value < 0 else value
+
+
+def encode_keyframe(tick: int, factory: Factory) -> bytes:
+    res = factory.resources
+    parts = [
+        KEYFRAME.pack(
+            KIND_KEYFRAME,
+            tick,
+            res["foos"],
+            res["bars"],
+            res["foobars"],
+            res["money"],
+            len(factory.robots),
+        )
+    ]
+    for bot in factory.robots:
+        act = bot.current_activity
+        if act is None:
+            parts.append(
+                ROBOT.pack(bot.status, _none(bot.previous_type), -1, 0, 0, -1, -1)
+            )
+        else:
+            parts.append(
+                ROBOT.pack(
+                    bot.status,
+                    _none(bot.previous_type),
+                    act.type,
+                    act.status,
+                    activity_param(act),
+                    _none(act.start_tick),
+                    _none(bot.current_activity_start_tick),
+                )
+            )
+    indexes = {id(bot): index for index, bot in enumerate(factory.robots)}
+    layout = factory.ready_layout()
+    parts.append(BUCKETS.pack(len(layout)))
+    for acttype, bots in layout:
+        parts.append(BUCKET.pack(_none(acttype), len(bots)))
+        parts.extend(INDEX.pack(indexes[id(bot)]) for bot in bots)
+    return b"".join(parts)
+
+
+def decode_keyframe(payload: bytes) -> Tuple[int, Factory]:
+    try:
+        _, tick, foos, bars, foobars, money, nbrobots = KEYFRAME.unpack_from(payload)
+        offset = KEYFRAME.size + nbrobots * ROBOT.size
+        robot_states = list(ROBOT.iter_unpack(payload[KEYFRAME.size : offset]))
+    except struct.error as err:
+        raise TraceException("Truncated keyframe") from err
+    factory = Factory(initial_robots_nb=0)
+    factory.resources = ResourceLedger(foos, bars, foobars, money)
+    fleet = []
+    for (
+        status,
+        previous,
+        acttype,
+        actstatus,
+        param,
+        start,
+        scheduled,
+    ) in robot_states:
+        bot = robots.Robot()
+        bot.status = status
+        bot.previous_type = _some(previous)
+        if acttype >= 0:
+            act = build_activities([(acttype, param)])[0]
+            act.status = actstatus
+            act.start_tick = _some(start)
+            bot.current_activity = act
+            bot.current_activity_start_tick = _some(scheduled)
+        fleet.append(bot)
+    if len(fleet) != nbrobots:
+        raise TraceException("Truncated keyframe")
+    try:
+        layout = []
+        (nbbuckets,) = BUCKETS.unpack_from(payload, offset)
+        offset += BUCKETS.size
+        for _ in range(0, nbbuckets):
+            acttype, nbbots = BUCKET.unpack_from(payload, offset)
+            offset += BUCKET.size
+            bots = [
+                fleet[INDEX.unpack_from(payload, offset + i * INDEX.size)[0]]
+                for i in range(0, nbbots)
+            ]
+            offset += nbbots * INDEX.size
+            layout.append((_some(acttype), bots))
+    except (struct.error, IndexError) as err:
+        raise TraceException("Truncated keyframe") from err
+    factory.replace_robots(fleet, ReadyPool.from_layout(layout))
+    return tick, factory
+
+
+def encode_round(tick: int, acts: List[activities.BaseActivity]) -> bytes:
+    return ROUND.pack(KIND_ROUND, tick, len(acts)) + b"".join(
+        ACTIVITY.pack(act.type, activity_param(act)) for act in acts
+    )
+
+
+def decode_round(payload: bytes) -> Tuple[int, List[Tuple[int, int]]]:
+    try:
+        _, tick, nbacts = ROUND.unpack_from(payload)
+        descriptors = list(ACTIVITY.iter_unpack(payload[ROUND.size :]))
+    except struct.error as err:
+        raise TraceException("Truncated round") from err
+    if len(descriptors) != nbacts:
+        raise TraceException("Truncated round")
+    return tick, descriptors
+
+
+# Recording
+
+
+class TraceRecorder:
+    """
+    Record the rounds programmed on a runtime (see Runtime.set_recorder).
+
+    A keyframe is written before the first round and then every keyframe_every
+    rounds.
+    """
+
+    def __init__(self, output: BinaryIO, keyframe_every: int = 100) -> None:
+        self.output = output
+        self.keyframe_every = keyframe_every
+        self.rounds = 0
+        self.last_tick = 0
+        output.write(HEADER.pack(MAGIC, VERSION))
+
+    def _write(self, payload: bytes) -> None:
+        self.output.write(LENGTH.pack(len(payload)))
+        self.output.write(payload)
+
+    def before_round(self, tick: int, factory: Factory) -> None:
+        if self.rounds % self.keyframe_every == 0:
+            self._write(encode_keyframe(tick, factory))
+
+    def record_round(self, tick: int, acts: List[activities.BaseActivity]) -> None:
+        self._write(encode_round(tick, acts))
+        self.rounds += 1
+        self.last_tick = tick
+
+    def close(self, tick: int) -> None:
+        self._write(END.pack(KIND_END, tick))
+        self.output.close()
+
+
+# Replay
+
+
+def advance(factory: Factory, tick: int) -> None:
+    """Run the factory at each tick up to tick at which a robot has something to do"""
+    next_tick = factory.next_event_tick()
+    while next_tick is not None and next_tick <= tick:
+        factory.run(next_tick)
+        next_tick = factory.next_event_tick()
+
+
+def apply_round(factory: Factory, tick: int, descriptors: List[Tuple[int, int]]):
+    advance(factory, tick)
+    factory.set_activities(tick, *build_activities(descriptors))
+    factory.run(tick)
+
+
+class TraceReader:
+    """Random access to a trace, through an index of its keyframes"""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as tracefile:
+            self.data = tracefile.read()
+        magic, version = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            raise TraceException(f"Not a trace of version {VERSION}")
+        # (tick, offset) of the keyframes
+        self.keyframes = []
+        self.end_tick = None
+        for offset, kind, payload in self._records(HEADER.size):
+            if kind == KIND_KEYFRAME:
+                self.keyframes.append((KEYFRAME.unpack_from(payload)[1], offset))
+            elif kind == KIND_END:
+                self.end_tick = END.unpack(payload)[1]
+        if not self.keyframes:
+            raise TraceException("Trace without keyframe")
+
+    def _records(self, offset: int) -> Iterator[Tuple[int, bytes, memoryview]]:
+        data = memoryview(self.data)
+        while offset < len(data):
+            (length,) = LENGTH.unpack_from(data, offset)
+            start = offset + LENGTH.size
+            if start + length > len(data):
+                raise TraceException("Truncated record")
+            yield offset, bytes(data[start : start + 1]), data[start : start + length]
+            offset = start + length
+
+    def rounds(self, offset: int = HEADER.size) -> Iterator[Tuple[int, List]]:
+        for _, kind, payload in self._records(offset):
+            if kind == KIND_ROUND:
+                yield decode_round(payload)
+
+    def factory_at(self, tick: int) -> Factory:
+        """
+        Rebuild the situation at the end of tick.
+
+        Start from the last keyframe at or before tick, and replay the rounds from
+        there.
+        """
+        index = bisect_right([kftick for kftick, _ in self.keyframes], tick) - 1
+        if index < 0:
+            raise TraceException(f"Tick {tick} is before the start of the trace")
+        offset = self.keyframes[index][1]
+        records = self._records(offset)
+        _, _, payload = next(records)
+        _, factory = decode_keyframe(bytes(payload))
+        for _, kind, payload in records:
+            if kind != KIND_ROUND:
+                continue
+            roundtick, descriptors = decode_round(payload)
+            if roundtick > tick:
+                break
+            apply_round(factory, roundtick, descriptors)
+        advance(factory, tick)
+        return factory
+
+    def replay(self) -> Tuple[int, Factory]:
+        """Replay the whole game, return its last tick and final situation"""
+        _, factory = decode_keyframe(bytes(next(self._records(HEADER.size))[2]))
+        tick = 0
+        for tick, descriptors in self.rounds():
+            apply_round(factory, tick, descriptors)
+        tick = self.end_tick if self.end_tick is not None else tick
+        advance(factory, tick)
+        return tick, factory
+
+
+@click.command()
+@click.argument("trace", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--tick",
+    default=None,
+    type=int,
+    help="Rebuild the situation at this tick, from the nearest keyframe. "
+    "Default: replay the whole game.",
+)
+def replay(trace: str, tick: int):
+    start = perf_counter()
+    reader = TraceReader(trace)
+    if tick is None:
+        tick, factory = reader.replay()
+    else:
+        factory = reader.factory_at(tick)
+    elapsed = perf_counter() - start
+    situation: Dict = factory.to_dict()
+    click.secho(f"Tick {tick}  Robots: {len(situation['robots'])}", fg="blue")
+    click.secho(f"Resources: {situation['resources']}", fg="green")
+    click.secho(f"Rebuilt in {elapsed:.3f}s", fg="green")
+
+
+if __name__ == "__main__":
+    replay()
@@ -0,0 +1,368 @@
+"""
+Monte Carlo tree search pilot.
+
+The tree is open-loop: a node stands for a sequence of decisions from the root, not
+for a situation. Each iteration replays the decisions of the path it selects on a
+fork of the situation, with the random outcomes of one of the scenarios of the
+search, then values the leaf by the tick at which SmartAutopilot reaches the target
+from there (the rollout). The decisions of the round are compared on the same
+scenarios, so that the luck of the outcomes does not decide between them. The
+rollouts are played on a process pool, by batches of leaves selected with a virtual
+loss.
+
+A decision is the activity type of one available robot, or None to leave it and the
+next ones idle. The decisions of a round are taken in increasing type order, so
+that each set of activities of a round has a single path in the tree. The tree is
+kept from a round to the next: the node reached by the decisions taken becomes the
+new root.
+"""
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from model.factory import Factory, FactoryState
+from model.randomness import OutcomeStream, ScriptedOutcomes, Seed
+from model.resources import ResourceLedger
+from pilots import FactoryPilot, SmartAutopilot
+from runtime import build_activities
+
+# exploration constant of UCB1, on values normalized to [0, 1]
+EXPLORATION = 0.15
+# random outcomes scenarios of a search
+SCENARIOS = 16
+ROLLOUT_POLICY = SmartAutopilot()
+
+
+def run_until_ready(factory: Factory, tick: int, force_one_next: bool = False) -> int:
+    """
+    Run the factory like an event-driven runtime.Runtime.run does, until robots are
+    available, and return the tick reached
+    """
+    while True:
+        factory.run(tick)
+        if factory.count_ready() and not force_one_next:
+            return tick
+        next_tick = None if force_one_next else factory.next_event_tick()
+        tick += 1 if next_tick is None else max(1, next_tick - tick)
+        force_one_next = False
+
+
+def play_round(factory: Factory, tick: int, descriptors: List) -> int:
+    """Program the activities described like the game loop does, return the tick"""
+    if not descriptors:
+        return run_until_ready(factory, tick, force_one_next=True)
+    factory.set_activities(tick, *build_activities(factory.outcomes, *descriptors))
+    return run_until_ready(factory, tick)
+
+
+def legal_decisions(resources: ResourceLedger, last: int) -> List[Optional[int]]:
+    """Decisions for the next available robot, after a decision of type last"""
+    decisions = [acttype for acttype in resources.feasible_types() if acttype >= last]
+    return decisions + [None]
+
+
+def rollout(
+    state: FactoryState,
+    tick: int,
+    descriptors: List,
+    reserved: Tuple[int, ...],
+    nbready: int,
+    target: int,
+    seed: Seed,
+) -> int:
+    """
+    Play the game from the state with the rollout policy, return the tick at which
+    the target is reached.
+
+    The round of tick is started: descriptors are already chosen, with their
+    resources reserved out of the resources left reserved, and nbready robots are
+    still available.
+    """
+    factory = Factory.from_state(state, OutcomeStream(seed))
+    resources = ResourceLedger()
+    resources.slots = list(reserved)
+    descriptors = descriptors + ROLLOUT_POLICY.choose(resources, nbready)
+    while True:
+        tick = play_round(factory, tick, descriptors)
+        if len(factory.robots) >= target:
+            return tick
+        descriptors = ROLLOUT_POLICY.choose(
+            factory.resources.copy(), factory.count_ready()
+        )
+
+
+def _rollout_job(job: Tuple) -> int:
+    return rollout(*job)
+
+
+class Node:
+    """Statistics of the iterations through a sequence of decisions"""
+
+    __slots__ = ("children", "visits", "ticks")
+
+    def __init__(self) -> None:
+        self.children = {}
+        self.visits = 0
+        # sum of the ticks-to-target of the iterations
+        self.ticks = 0.0
+
+    def mean(self) -> float:
+        return self.ticks / self.visits
+
+
+class _Round:
+    """Decisions of the current round, replayed on a fork of the situation"""
+
+    __slots__ = ("factory", "tick", "resources", "nbready", "last", "descriptors")
+
+    def __init__(self, factory: Factory, tick: int) -> None:
+        self.factory = factory
+        self.tick = tick
+        self._start()
+
+    def _start(self) -> None:
+        self.resources = self.factory.resources.copy()
+        self.nbready = self.factory.count_ready()
+        self.last = -1
+        self.descriptors = []
+
+    def decisions(self) -> List[Optional[int]]:
+        return legal_decisions(self.resources, self.last)
+
+    def default_decision(self) -> Optional[int]:
+        """Decision of the rollout policy for the next available robot"""
+        chosen = ROLLOUT_POLICY.choose(self.resources.copy(), 1)
+        if not chosen:
+            return None
+        return chosen[0][0] if type(chosen[0]) is tuple else chosen[0]
+
+    def decide(self, decision: Optional[int]) -> bool:
+        """Take a decision, play the round if it is over and return True then"""
+        if decision is not None:
+            self.descriptors.append(FactoryPilot._reserve(self.resources, decision))
+            self.last = decision
+            self.nbready -= 1
+            if self.nbready:
+                return False
+        self.tick = play_round(self.factory, self.tick, self.descriptors)
+        self._start()
+        return True
+
+    def job(self, target: int, seed: int) -> Tuple:
+        """Arguments of the rollout from the current decision"""
+        return (
+            self.factory.snapshot(),
+            self.tick,
+            self.descriptors,
+            tuple(self.resources.slots),
+            self.nbready,
+            target,
+            seed,
+        )
+
+
+class MctsAutopilot(FactoryPilot):
+    """
+    This autopilot searches the activities minimizing the ticks to reach the target.
+
+    Each decision costs a budget of rollouts, or of seconds if time_budget is set
+    (or both, the first one exhausted stops the search). The rollouts are played on
+    workers processes, by batches of batch_size; with workers 0 they are played in
+    the calling process.
+    Every first decision of a round is valued on all the scenarios before the search
+    goes deeper: with fewer rollouts than scenarios times the possible activities,
+    the decision is mostly left to chance.
+    """
+
+    def __init__(
+        self,
+        target: int,
+        rollouts: Optional[int] = 256,
+        time_budget: Optional[float] = None,
+        workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        exploration: float = EXPLORATION,
+        scenarios: int = SCENARIOS,
+        seed: Seed = None,
+    ) -> None:
+        super().__init__()
+        if rollouts is None and time_budget is None:
+            raise ValueError("A budget of rollouts or time is needed")
+        self.target = target
+        self.rollouts = rollouts
+        self.time_budget = time_budget
+        self.workers = os.cpu_count() if workers is None else workers
+        self.batch_size = batch_size or max(1, 2 * self.workers)
+        self.exploration = exploration
+        self.scenarios = scenarios
+        self._scenarios = []
+        self.rng = np.random.default_rng(seed)
+        self._pool = None
+        self._root = Node()
+        self._tick = None
+        # range of the ticks-to-target of the current search
+        self._low = self._high = None
+
+    def close(self) -> None:
+        """Stop the worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def get_activities(self, situation: Dict) -> List:
+        tick = situation["tick"]
+        if self._tick is None or tick < self._tick:
+            # another game
+            self._root = Node()
+        self._tick = tick
+        state = Factory.from_dict(situation["situation"]).snapshot()
+        self._search(state, tick)
+        descriptors, self._root = self._best_round(state)
+        return descriptors
+
+    def _search(self, state: FactoryState, tick: int) -> None:
+        start = perf_counter()
+        self._low = self._high = None
+        self._scenarios = self.rng.integers(0, 2**62, size=self.scenarios).tolist()
+        done = 0
+        while (self.rollouts is None or done < self.rollouts) and (
+            self.time_budget is None or perf_counter() - start < self.time_budget
+        ):
+            size = self.batch_size
+            if self.rollouts is not None:
+                size = min(size, self.rollouts - done)
+            selected = [self._select(state, tick) for _ in range(0, size)]
+            jobs = [leaf for _, leaf, _ in selected if isinstance(leaf, tuple)]
+            values = iter(self._play(jobs))
+            for path, leaf, loss in selected:
+                ticks = next(values) if isinstance(leaf, tuple) else leaf
+                self._backpropagate(path, loss, ticks)
+            done += size
+
+    def _play(self, jobs: List[Tuple]) -> List[int]:
+        if self.workers <= 0:
+            return [rollout(*job) for job in jobs]
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return list(self._pool.map(_rollout_job, jobs))
+
+    def _score(self, parent: Node, child: Node) -> float:
+        """UCB1 of a child, the fewer ticks the better"""
+        if self._high is None or self._high == self._low:
+            value = 0.5
+        else:
+            value = (self._high - child.mean()) / (self._high - self._low)
+        return value + self.exploration * math.sqrt(
+            math.log(parent.visits) / child.visits
+        )
+
+    def _decision(self, node: Node, current: _Round) -> Optional[int]:
+        """
+        Choose the decision to explore from node, adding its child if needed.
+
+        The first decisions are all tried on every scenario before UCB1 applies,
+        the next ones are tried once, the decision of the rollout policy first then
+        the others in a random order.
+        """
+        decisions = current.decisions()
+        children = node.children
+        if node is self._root:
+            for decision in decisions:
+                children.setdefault(decision, Node())
+            fewest = min(decisions, key=lambda d: children[d].visits)
+            if children[fewest].visits < self.scenarios:
+                return fewest
+        else:
+            untried = [d for d in decisions if d not in children]
+            if untried:
+                decision = current.default_decision()
+                if decision not in untried:
+                    decision = untried[int(self.rng.integers(0, len(untried)))]
+                children[decision] = Node()
+                return decision
+        return max(decisions, key=lambda d: self._score(node, children[d]))
+
+    def _select(self, state: FactoryState, tick: int):
+        """
+        Select a path from the root, down to a node valued on fewer rollouts than
+        scenarios.
+
+        Return the path, the rollout job of its leaf or the tick-to-target if the
+        target is reached along the path, and the virtual loss: the iteration is
+        counted in the nodes of the path as a loss until its result is known.
+        """
+        # the outcomes are drawn once the first decision is known
+        factory = Factory.from_state(state, ScriptedOutcomes())
+        current = _Round(factory, tick)
+        node = self._root
+        path = [node]
+        leaf = None
+        while leaf is None:
+            decision = self._decision(node, current)
+            node = node.children[decision]
+            path.append(node)
+            if len(path) == 2:
+                # the nth iteration through each first decision plays the nth
+                # scenario: the first decisions are compared on the same outcomes
+                seed = self._scenarios[node.visits % len(self._scenarios)]
+                factory.outcomes = OutcomeStream(seed)
+            if current.decide(decision) and len(factory.robots) >= self.target:
+                leaf = current.tick
+            elif node.visits < self.scenarios:
+                # not expanded until valued on as many rollouts as scenarios
+                leaf = current.job(self.target, seed + 1)
+        loss = 0 if self._high is None else self._high
+        for visited in path:
+            visited.visits += 1
+            visited.ticks += loss
+        return path, leaf, loss
+
+    def _backpropagate(self, path: List[Node], loss: int, ticks: int) -> None:
+        if self._high is None:
+            self._low = self._high = ticks
+        else:
+            self._low = min(self._low, ticks)
+            self._high = max(self._high, ticks)
+        for node in path:
+            node.ticks += ticks - loss
+
+    def _best_round(self, state: FactoryState) -> Tuple[List, Node]:
+        """
+        Return the most visited decisions of the round of the root, and the node
+        they lead to.
+
+        The decisions left out of the tree are taken by the rollout policy, the
+        tree is dropped then.
+        """
+        resources = ResourceLedger()
+        resources.slots = list(state.resources)
+        nbready = sum(len(indexes) for _, indexes in state.ready)
+        descriptors = []
+        node = self._root
+        last = -1
+        while nbready:
+            children = node.children
+            legal = [
+                d
+                for d in legal_decisions(resources, last)
+                if d in children and children[d].visits
+            ]
+            if not legal:
+                descriptors.extend(ROLLOUT_POLICY.choose(resources, nbready))
+                return descriptors, Node()
+            # the fewest ticks breaks the ties
+            decision = max(
+                legal, key=lambda d: (children[d].visits, -children[d].mean())
+            )
+            node = children[decision]
+            if decision is None:
+                break
+            descriptors.append(self._reserve(resources, decision))
+            last = decision
+            nbready -= 1
+        return descriptors, node
@@ -2,16 +2,12 @@
 
 # activity statuses
 
-import random
+import math
 import json
-from typing import Dict
+from operator import attrgetter
+from typing import Dict, Optional, Tuple, Union
 
 from .constants import (
-    RES_KEY_MONEY,
-    RES_KEY_BARS,
-    RES_KEY_FOOBARS,
-    RES_KEY_FOOS,
-    RES_KEY_NEWROBOTS,
     READY,
     RUNNING,
     COMPLETED,
@@ -22,16 +18,36 @@ from .constants import (
     SELLFOOBAR,
     BUYROBOT,
 )
+from .randomness import DEFAULT_OUTCOMES, OutcomeStream
+from .resources import (
+    COSTS,
+    FOOS,
+    BARS,
+    FOOBARS,
+    MONEY,
+    NEWROBOTS,
+    Cost,
+    ResourceLedger,
+    ResourcesException,
+    cost,
+)
+
+Resources = Union[Dict, ResourceLedger]
 
 
-def get_activty(type, **kwargs):
-    """Activity instance factory"""
+def get_activty(type, outcomes: Optional[OutcomeStream] = None, **kwargs):
+    """
+    Activity instance factory
+
+    The random outcomes of the activity are drawn from outcomes, default from
+    randomness.DEFAULT_OUTCOMES.
+    """
     if type == MINEFOO:
         return MineFoo()
     if type == MINEBAR:
-        return MineBar()
+        return MineBar(outcomes=outcomes)
     if type == ASSEMBLEFOOBAR:
-        return AssembleFoobar()
+        return AssembleFoobar(outcomes=outcomes)
     if type == SELLFOOBAR:
         return SellFoobar(nbtosell=int(kwargs.get("nbtosell", 1)))
     if type == BUYROBOT:
@@ -55,10 +71,14 @@ class BaseActivity:
     """
     Base class, handles status logic in an uniform way.
 
+    Status and type are small int codes (see constants).
+
     CAUTION : NOT THREAD-SAFE
     """
 
-    def __init__(self, type: str, duration: float, future_result: int) -> None:
+    __slots__ = ("status", "type", "duration", "future_result", "start_tick")
+
+    def __init__(self, type: int, duration: float, future_result: int) -> None:
         self.status = READY
         self.type = type
         self.duration = duration
@@ -99,12 +119,23 @@ class BaseActivity:
     def has_completed(self, tick) -> bool:
         return tick - self.start_tick >= self.duration
 
-    def take_resources(self, resources: Dict) -> Dict:
+    def end_tick(self) -> int:
+        """Return the first tick at which the started activity has completed."""
+        return self.start_tick + math.ceil(self.duration)
+
+    @property
+    def cost(self) -> Cost:
+        """Resources needed to do the activity"""
+        return COSTS[self.type]
+
+    def take_resources(self, resources: Resources) -> Resources:
         """
         Consume the needed resources to do the activity.
 
         Arguments:
-          - resources: Dict of resources available before the activity
+          - resources: ResourceLedger or Dict of resources available before the activity
+        A ledger is updated in place (the consumption is a reservation until the ledger
+        is committed) and returned, a dict is left untouched.
         Return the remaining resources after consumption.
         Raise ActivityResourcesException if resources are not sufficient.
         Raise ActivityStatusException if activity not ready.
@@ -113,14 +144,20 @@ class BaseActivity:
             raise ActivityStatusException(
                 f"Activity not READY, current status={self.status}"
             )
-        return self._take_resources(resources)  # impl by subclasses
-
-    def deliver_result(self, resources: Dict) -> Dict:
+        if isinstance(resources, ResourceLedger):
+            self._take_resources(resources)
+            return resources
+        ledger = ResourceLedger.from_dict(resources)
+        self._take_resources(ledger)
+        return ledger.to_dict()
+
+    def deliver_result(self, resources: Resources) -> Resources:
         """
-        Add the result of the completed activity to the resources dict
+        Add the result of the completed activity to the resources
 
         Arguments:
-          - resources: Dict of resources before adding the new ones
+          - resources: ResourceLedger or Dict of resources before adding the new ones
+        A ledger is updated in place and returned, a dict is left untouched.
         Return the new resources after addition.
         Raise ActivityStatusException if activity not completed.
         """
@@ -128,147 +165,160 @@ class BaseActivity:
             raise ActivityStatusException(
                 f"Activity not COMPLETED, current status={self.status}"
             )
-        result = self._deliver_result(resources)  # impl by subclasses
+        if isinstance(resources, ResourceLedger):
+            ledger = resources
+        else:
+            ledger = ResourceLedger.from_dict(resources)
+        self._deliver_result(ledger)  # impl by subclasses
         self.status = CONSUMED
-        return result
+        return resources if ledger is resources else ledger.to_dict()
+
+    def _take_resources(self, ledger: ResourceLedger) -> None:
+        try:
+            ledger.reserve(self.cost)
+        except ResourcesException as err:
+            raise ActivityResourcesException(
+                "Not enough resource for activity %s", self
+            ) from err
 
     def __str__(self) -> str:  # pragma: no cover
         return json.dumps(self.to_dict())
 
     def to_dict(self) -> Dict:  # pragma: no cover
         """Return a dictionary-based representation of the activity"""
-        return self.__dict__
+        return {
+            name: getattr(self, name)
+            for cls in reversed(type(self).__mro__)
+            for name in getattr(cls, "__slots__", ())
+        }
+
+    def state(self) -> Tuple:
+        """
+        Return the state of the activity as an immutable tuple.
+
+        The tuple holds the class of the activity then the values of its slots,
+        from_state() builds an activity equal to this one.
+        """
+        cls = type(self)
+        return (cls,) + _STATE_GETTERS[cls](self)
+
+    @staticmethod
+    def from_state(state: Tuple) -> "BaseActivity":
+        cls = state[0]
+        activity = cls.__new__(cls)
+        for name, value in zip(_STATE_SLOTS[cls], state[1:]):
+            setattr(activity, name, value)
+        return activity
+
+    @staticmethod
+    def from_dict(datadict: Dict) -> "BaseActivity":
+        """Build the activity represented by datadict (see to_dict)"""
+        cls = ACTIVITY_CLASSES[datadict["type"]]
+        activity = cls.__new__(cls)
+        for name in _STATE_SLOTS[cls]:
+            setattr(activity, name, datadict[name])
+        return activity
 
 
 class MineFoo(BaseActivity):
     """Take 1 tick, produce 1 Foo"""
 
+    __slots__ = ()
+
     def __init__(self) -> None:
         super().__init__(type=MINEFOO, duration=1, future_result=1)
 
-    def _take_resources(self, resources: Dict) -> Dict:
-        # no resource needed.
-        return resources.copy()
-
-    def _deliver_result(self, resources: Dict) -> Dict:
-        newres = resources.copy()
-        newres[RES_KEY_FOOS] += self.future_result
-        return newres
+    def _deliver_result(self, ledger: ResourceLedger) -> None:
+        ledger.credit(FOOS, self.future_result)
 
 
 class MineBar(BaseActivity):
     """Take between 0.5 and 2 ticks, produce one Bar"""
 
-    def __init__(self) -> None:
+    __slots__ = ()
+
+    def __init__(self, outcomes: Optional[OutcomeStream] = None) -> None:
         # duration is a random value between 0.5 and 2.0 ticks.
         # To have more interesting results, possible values are
         # voluntarily limited to 0.5, 1.0, 1.5 and 2.0
-        # So, instead of this: (any tenth of a tick)
-        # duration = float(random.randint(5, 20)/10.0)
-        # set duration like this:
+        # (see randomness.BAR_DURATIONS)
         super().__init__(
             type=MINEBAR,
-            duration=[0.5, 1.0, 1.5, 2.0][random.randint(0, 3)],
+            duration=(outcomes or DEFAULT_OUTCOMES).bar_duration(),
             future_result=1,
         )
 
-    def _take_resources(self, resources: Dict) -> Dict:
-        # no resource needed.
-        return resources.copy()
-
-    def _deliver_result(self, resources: Dict) -> Dict:
-        newres = resources.copy()
-        newres[RES_KEY_BARS] += self.future_result
-        return newres
+    def _deliver_result(self, ledger: ResourceLedger) -> None:
+        ledger.credit(BARS, self.future_result)
 
 
 class AssembleFoobar(BaseActivity):
     """Take 2 ticks, produce 1 Foobar with 60% chance or 0"""
 
-    def __init__(self) -> None:
+    __slots__ = ()
+
+    def __init__(self, outcomes: Optional[OutcomeStream] = None) -> None:
         # There is a 60% chance (or 3/5) that 1 Foobar was assembled
         # Otherwise it's a failure : 0 Foobar assembled
         super().__init__(
             type=ASSEMBLEFOOBAR,
             duration=2,
-            future_result=[1, 1, 1, 0, 0][random.randint(0, 4)],
+            future_result=(outcomes or DEFAULT_OUTCOMES).assembly_result(),
         )
 
-    def _take_resources(self, resources: Dict) -> Dict:
-        try:
-            if resources[RES_KEY_FOOS] < 1 or resources[RES_KEY_BARS] < 1:
-                raise ActivityResourcesException(
-                    "Not enough resource for activity %s", self
-                )
-        except KeyError:  # pragma: no cover
-            raise ActivityResourcesException(
-                "Not enough resource for activity %s", self
-            )
-        newres = resources.copy()
-        newres[RES_KEY_FOOS] -= 1
-        newres[RES_KEY_BARS] -= 1
-        return newres
-
-    def _deliver_result(self, resources: Dict) -> Dict:
-        newres = resources.copy()
-        newres[RES_KEY_FOOBARS] += self.future_result
+    def _deliver_result(self, ledger: ResourceLedger) -> None:
+        ledger.credit(FOOBARS, self.future_result)
         # the bar is reusable if no new foobar assembled
         if self.future_result == 0:
-            newres[RES_KEY_BARS] += 1
-        return newres
+            ledger.credit(BARS, 1)
 
 
 class SellFoobar(BaseActivity):
     """Take 10 ticks, produce the requested number of money units"""
 
+    __slots__ = ("nbtosell",)
+
     def __init__(self, nbtosell: int = 1) -> None:
         if nbtosell < 1 or nbtosell > 5:
             raise ValueError("nbtosell must be between 1 and 5")
         super().__init__(type=SELLFOOBAR, duration=10, future_result=nbtosell)
         self.nbtosell = nbtosell
 
-    def _take_resources(self, resources: Dict) -> Dict:
-        try:
-            if resources[RES_KEY_FOOBARS] < self.nbtosell:
-                raise ActivityResourcesException(
-                    "Not enough resource for activity %s", self
-                )
-        except KeyError:
-            raise ActivityResourcesException(  # pragma: no cover
-                "Not enough resource for activity %s", self
-            )
-        newres = resources.copy()
-        newres[RES_KEY_FOOBARS] -= self.nbtosell
-        return newres
+    @property
+    def cost(self) -> Cost:
+        return cost(foobars=self.nbtosell)
 
-    def _deliver_result(self, resources: Dict) -> Dict:
-        newres = resources.copy()
-        newres[RES_KEY_MONEY] += self.future_result
-        return newres
+    def _deliver_result(self, ledger: ResourceLedger) -> None:
+        ledger.credit(MONEY, self.future_result)
 
 
 class BuyRobot(BaseActivity):
     """Take 0 tick, produce one robot"""
 
+    __slots__ = ()
+
     def __init__(self) -> None:
         super().__init__(type=BUYROBOT, duration=0, future_result=1)
 
-    def _take_resources(self, resources: Dict) -> Dict:
-        try:
-            if resources[RES_KEY_MONEY] < 3 or resources[RES_KEY_FOOS] < 6:
-                raise ActivityResourcesException(
-                    "Not enough resource for activity %s", self
-                )
-        except KeyError:
-            raise ActivityResourcesException(  # pragma: no cover
-                "Not enough resource for activity %s", self
-            )
-        newres = resources.copy()
-        newres[RES_KEY_MONEY] -= 3
-        newres[RES_KEY_FOOS] -= 6
-        return newres
-
-    def _deliver_result(self, resources: Dict) -> Dict:
-        newres = resources.copy()
-        newres[RES_KEY_NEWROBOTS] = self.future_result
-        return newres
+    def _deliver_result(self, ledger: ResourceLedger) -> None:
+        ledger.credit(NEWROBOTS, self.future_result)
+
+
+ACTIVITY_CLASSES = {
+    MINEFOO: MineFoo,
+    MINEBAR: MineBar,
+    ASSEMBLEFOOBAR: AssembleFoobar,
+    SELLFOOBAR: SellFoobar,
+    BUYROBOT: BuyRobot,
+}
+
+# slots of the state of each activity class, see BaseActivity.state()
+_STATE_SLOTS = {
+    cls: tuple(
+        name
+        for base in reversed(cls.__mro__)
+        for name in getattr(base, "__slots__", ())
+    )
+    for cls in ACTIVITY_CLASSES.values()
+}
+_STATE_GETTERS = {cls: attrgetter(*slots) for cls, slots in _STATE_SLOTS.items()}
@@ -0,0 +1,79 @@
+"""
+Change streams of a factory: what changed between two reads, instead of the whole
+situation.
+
+A stream opened on a factory (see Factory.change_stream) is told by the factory of
+each robot changing status and of each activity completed, and keeps the resources
+of its previous read: read() returns a FactoryDelta whose size depends on what
+happened since the previous read, not on the size of the fleet. The first read is
+a reset: it holds every robot, and the resources counted from zero.
+"""
+
+from collections import namedtuple
+from typing import List, Set, Tuple
+
+from .resources import MONEY
+
+# What changed in a factory since the previous read of a change stream:
+# reset: the whole fleet was replaced (e.g. restored), robots then holds every robot
+# robots: (index, status, previous type, type of the current activity or None) of
+#   the robots which changed status or are new, by increasing index
+# completed: (robot index, activity type) of the activities completed, in order
+# resources: changes of the foos, bars, foobars and money
+# nbrobots: number of robots of the factory
+FactoryDelta = namedtuple(
+    "FactoryDelta", ("reset", "robots", "completed", "resources", "nbrobots")
+)
+
+
+class ChangeStream:
+    """
+    Changes of a factory, accumulated until read.
+
+    CAUTION : the robots must only be changed by the factory methods.
+    """
+
+    def __init__(self, factory) -> None:
+        self.factory = factory
+        self._resources = (0,) * (MONEY + 1)
+        self._changed: Set[int] = set()
+        self._completed: List[Tuple[int, int]] = []
+        self._reset = True
+
+    def robot_changed(self, index: int) -> None:
+        self._changed.add(index)
+
+    def activity_completed(self, index: int, acttype: int) -> None:
+        self._completed.append((index, acttype))
+
+    def fleet_replaced(self) -> None:
+        self._reset = True
+        self._changed.clear()
+
+    def read(self) -> FactoryDelta:
+        """Return the changes since the previous read, and forget them"""
+        fleet = self.factory.robots
+        slots = tuple(self.factory.resources.slots[: MONEY + 1])
+        indexes = range(0, len(fleet)) if self._reset else sorted(self._changed)
+        robots = []
+        for index in indexes:
+            bot = fleet[index]
+            act = bot.current_activity
+            acttype = None if act is None else act.type
+            robots.append((index, bot.status, bot.previous_type, acttype))
+        delta = FactoryDelta(
+            self._reset,
+            tuple(robots),
+            tuple(self._completed),
+            tuple(now - before for now, before in zip(slots, self._resources)),
+            len(fleet),
+        )
+        self._resources = slots
+        self._changed.clear()
+        self._completed.clear()
+        self._reset = False
+        return delta
+
+    def close(self) -> None:
+        """Stop following the changes of the factory"""
+        self.factory.close_stream(self)
@@ -0,0 +1,271 @@
+"""
+Fleet engine counting the robots by state instead of holding one object per robot.
+
+Robots in the same state are interchangeable: an available robot is known by the
+type of its previous activity, a busy one by its activity, the tick at which it
+completes and the number of foobars it sells. The fleet is a histogram of counts
+over these states, and a tick advances whole cohorts at once: the MineBar durations
+of a cohort are drawn multinomially when it is programmed, the assembled foobars of
+a cohort binomially when it completes. The cost of a tick depends on the number of
+states, not on the size of the fleet.
+
+The rules are the ones of model.factory.Factory driven by runtime.Runtime, with the
+activity codes of model.lockstep. The robots assigned to an activity are the ones
+which did the same activity, then the idle ones, then the others by increasing
+previous activity code.
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .constants import (
+    ACTIVITY_TYPES,
+    ASSEMBLEFOOBAR,
+    BUYROBOT,
+    MINEBAR,
+    MINEFOO,
+    SELLFOOBAR,
+    RES_KEY_BARS,
+    RES_KEY_FOOBARS,
+    RES_KEY_FOOS,
+    RES_KEY_MONEY,
+)
+from .factory import FactoryException
+from .lockstep import (
+    BAR_DURATIONS,
+    BARS,
+    COSTS,
+    DURATIONS,
+    FOOBARS,
+    FOOS,
+    MAX_SOLD,
+    MONEY,
+    MOVE_TICKS,
+    NO_ACTIVITY,
+    TYPE_CODES,
+    Policy,
+)
+from .randomness import ASSEMBLY_DRAWS, ASSEMBLY_SUCCESSES
+
+FOO = TYPE_CODES[MINEFOO]
+BAR = TYPE_CODES[MINEBAR]
+ASSEMBLE = TYPE_CODES[ASSEMBLEFOOBAR]
+SELL = TYPE_CODES[SELLFOOBAR]
+BUY = TYPE_CODES[BUYROBOT]
+# ticks of the longest activity, on a new workstation: completions are kept in a
+# ring of as many slots plus one
+HORIZON = MOVE_TICKS + int(DURATIONS.max()) + 1
+ASSEMBLY_SUCCESS = ASSEMBLY_SUCCESSES / ASSEMBLY_DRAWS
+
+# A cohort of decisions: activity code, number of robots, foobars sold by each one
+Cohort = Tuple[int, int, int]
+# Decides the cohorts of a round from the resources, the number of available robots
+# and the number of robots
+CohortPolicy = Callable[[np.ndarray, int, int], List[Cohort]]
+
+
+class CohortFactory:
+    """A fleet of robots counted by state"""
+
+    def __init__(self, initial_robots_nb: int = 2, seed: Optional[int] = None) -> None:
+        self.rng = np.random.default_rng(seed)
+        self.nbrobots = initial_robots_nb
+        # available robots by previous activity code, the last one for none
+        self.ready = np.zeros(len(ACTIVITY_TYPES) + 1, dtype=np.int64)
+        self.ready[NO_ACTIVITY] = initial_robots_nb
+        # busy robots by completion tick modulo HORIZON, activity code and foobars
+        # sold
+        self.busy = np.zeros(
+            (HORIZON, len(ACTIVITY_TYPES), MAX_SOLD + 1), dtype=np.int64
+        )
+        self.resources = np.zeros(4, dtype=np.int64)
+
+    def count_ready(self) -> int:
+        return int(self.ready.sum())
+
+    def resources_dict(self) -> Dict[str, int]:
+        return {
+            RES_KEY_FOOS: int(self.resources[FOOS]),
+            RES_KEY_BARS: int(self.resources[BARS]),
+            RES_KEY_FOOBARS: int(self.resources[FOOBARS]),
+            RES_KEY_MONEY: int(self.resources[MONEY]),
+        }
+
+    def run(self, tick: int) -> None:
+        """Deliver the cohorts completing at tick"""
+        slot = self.busy[tick % HORIZON]
+        if not slot.any():
+            return
+        done = slot.sum(axis=1)
+        assembled = int(done[ASSEMBLE])
+        successes = self.rng.binomial(assembled, ASSEMBLY_SUCCESS) if assembled else 0
+        self.resources[FOOS] += done[FOO]
+        # a failed assembly gives the bar back
+        self.resources[BARS] += done[BAR] + assembled - successes
+        self.resources[FOOBARS] += successes
+        self.resources[MONEY] += slot[SELL] @ np.arange(0, MAX_SOLD + 1)
+        self.ready[: len(ACTIVITY_TYPES)] += done
+        self.ready[NO_ACTIVITY] += done[BUY]
+        self.nbrobots += int(done[BUY])
+        slot[:] = 0
+
+    def next_event_tick(self, tick: int) -> Optional[int]:
+        """First tick after tick at which a cohort completes, None if none is busy"""
+        for offset in range(1, HORIZON):
+            if self.busy[(tick + offset) % HORIZON].any():
+                return tick + offset
+        return None
+
+    def set_activities(self, tick: int, cohorts: List[Cohort]) -> None:
+        """
+        Assign the cohorts of activities to available robots.
+
+        Like the factory, as many activities as possible are assigned to robots
+        which did the same activity, the others to idle robots, then to any robot.
+        Raise FactoryException, and assign nothing, if the robots or the resources
+        are not sufficient.
+        """
+        if sum(count for _, count, _ in cohorts) > self.count_ready():
+            raise FactoryException("Not enough available robots")
+        spent = np.zeros(4, dtype=np.int64)
+        for code, count, nbtosell in cohorts:
+            spent += COSTS[code] * count
+            spent[FOOBARS] += nbtosell * count
+        if (spent > self.resources).any():
+            raise FactoryException("Not enough resources")
+        self.resources -= spent
+        missing = [
+            count - self._assign(tick, code, code, count, nbtosell)
+            for code, count, nbtosell in cohorts
+        ]
+        for previous in [NO_ACTIVITY] + list(range(0, len(ACTIVITY_TYPES))):
+            for index, (code, _, nbtosell) in enumerate(cohorts):
+                missing[index] -= self._assign(
+                    tick, code, previous, missing[index], nbtosell
+                )
+
+    def _assign(
+        self, tick: int, code: int, previous: int, count: int, nbtosell: int
+    ) -> int:
+        """
+        Assign up to count activities code to the available robots whose previous
+        activity is previous, return the number assigned
+        """
+        taken = min(count, int(self.ready[previous]))
+        if taken:
+            self.ready[previous] -= taken
+            moving = previous not in (code, NO_ACTIVITY)
+            self._schedule(tick + (MOVE_TICKS if moving else 0), code, taken, nbtosell)
+        return taken
+
+    def _schedule(self, start: int, code: int, count: int, nbtosell: int) -> None:
+        if code == BAR:
+            bars = self.rng.multinomial(
+                count, [1 / len(BAR_DURATIONS)] * len(BAR_DURATIONS)
+            )
+            for ticks, drawn in zip(BAR_DURATIONS, bars):
+                self.busy[(start + ticks) % HORIZON, code, 0] += drawn
+        else:
+            self.busy[(start + DURATIONS[code]) % HORIZON, code, nbtosell] += count
+
+
+def _run_length(
+    policy: Policy, resources: np.ndarray, nbrobots: int, code: int, cost, limit: int
+) -> int:
+    """
+    Number of robots in a row, up to limit, for which policy chooses code while
+    each one spends cost. The decisions are evaluated by chunks of growing size.
+    """
+    start, size = 1, 1
+    while start < limit:
+        steps = np.arange(start, min(limit, start + size))
+        rows = resources - steps[:, None] * cost
+        changed = np.flatnonzero(policy(rows, np.full(len(rows), nbrobots)) != code)
+        if changed.size:
+            return int(steps[changed[0]])
+        start += size
+        size *= 2
+    return limit
+
+
+def bulk_decisions(
+    policy: Policy, resources: np.ndarray, nbready: int, nbrobots: int
+) -> List[Cohort]:
+    """
+    Decisions of policy for nbready robots, as cohorts.
+
+    The same decisions as one call of the policy per robot, each one with the
+    resources left by the previous ones, with foobars sold 5 at most: a decision
+    spending nothing is the decision of all the next robots, and a decision spending
+    resources is repeated as long as the policy keeps it.
+    """
+    resources = np.array(resources, dtype=np.int64)
+    cohorts = []
+    while nbready:
+        row = resources[None, :]
+        code = int(policy(row, np.array([nbrobots]))[0])
+        if code == NO_ACTIVITY:
+            break
+        cost = COSTS[code].copy()
+        nbtosell = 0
+        if code == SELL:
+            nbtosell = int(min(resources[FOOBARS], MAX_SOLD))
+            if not nbtosell:
+                # selling nothing is not a valid activity
+                break
+            cost[FOOBARS] = nbtosell
+        spending = cost > 0
+        if not spending.any():
+            count = nbready
+        else:
+            affordable = int((resources[spending] // cost[spending]).min())
+            limit = min(nbready, affordable)
+            if code == SELL and nbtosell < MAX_SOLD:
+                limit = min(limit, 1)
+            count = _run_length(policy, resources, nbrobots, code, cost, limit)
+        if not count:
+            break
+        cohorts.append((code, count, nbtosell))
+        resources -= cost * count
+        nbready -= count
+    return cohorts
+
+
+def cohort_policy(policy: Policy) -> CohortPolicy:
+    """The cohort policy deciding like the lockstep policy"""
+
+    def _decide(resources: np.ndarray, nbready: int, nbrobots: int) -> List[Cohort]:
+        return bulk_decisions(policy, resources, nbready, nbrobots)
+
+    return _decide
+
+
+def play(
+    decide: CohortPolicy,
+    target: int = 30,
+    initial_robots_nb: int = 2,
+    seed: Optional[int] = None,
+    max_ticks: Optional[int] = None,
+) -> Tuple[int, CohortFactory]:
+    """
+    Play one game until target robots, like the event-driven runtime.
+
+    Return the tick at which the target is reached, or the first tick after
+    max_ticks, and the fleet then.
+    """
+    fleet = CohortFactory(initial_robots_nb, seed=seed)
+    tick = 0
+    while fleet.nbrobots < target and (max_ticks is None or tick <= max_ticks):
+        cohorts = decide(fleet.resources.copy(), fleet.count_ready(), fleet.nbrobots)
+        force_one_next = not cohorts
+        if cohorts:
+            fleet.set_activities(tick, cohorts)
+        while True:
+            fleet.run(tick)
+            if fleet.count_ready() and not force_one_next:
+                break
+            next_tick = None if force_one_next else fleet.next_event_tick(tick)
+            tick += 1 if next_tick is None else next_tick - tick
+            force_one_next = False
+    return tick, fleet
@@ -1,17 +1,20 @@
-# statuses
-READY = "ready"
-RUNNING = "running"
-COMPLETED = "completed"
-CONSUMED = "consumed"
-SCHEDULING = "scheduling"
-WORKING = "working"
+# statuses, coded as small ints: STATUS_NAMES[code] is the readable name
+READY = 0
+RUNNING = 1
+COMPLETED = 2
+CONSUMED = 3
+SCHEDULING = 4
+WORKING = 5
+STATUS_NAMES = ("ready", "running", "completed", "consumed", "scheduling", "working")
 
-# types
-MINEFOO = "minefoo"
-MINEBAR = "minebar"
-ASSEMBLEFOOBAR = "assemblefoobar"
-SELLFOOBAR = "sellfoobar"
-BUYROBOT = "buyrobot"
+# types, coded as small ints: TYPE_NAMES[code] is the readable name
+MINEFOO = 0
+MINEBAR = 1
+ASSEMBLEFOOBAR = 2
+SELLFOOBAR = 3
+BUYROBOT = 4
+ACTIVITY_TYPES = (MINEFOO, MINEBAR, ASSEMBLEFOOBAR, SELLFOOBAR, BUYROBOT)
+TYPE_NAMES = ("minefoo", "minebar", "assemblefoobar", "sellfoobar", "buyrobot")
 
 # resource keys
 RES_KEY_FOOS = "foos"
@@ -0,0 +1,101 @@
+"""
+Rule-based policies compiled into dense decision tables.
+
+A lockstep policy (see model.lockstep.Policy) decides the activity of one available
+robot from the resources left by the choices already made in the round and the
+number of robots of the factory: the number of robots still to decide does not
+matter, a round is one decision per available robot. Compiling the policy evaluates
+it once over a bounded domain of resource counts and fleet sizes; a decision is then
+an index in the table, for one factory or for many at once.
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+from .lockstep import Policy
+
+# highest foos, bars, foobars, money and number of robots of the default domain
+DEFAULT_BOUNDS = (63, 31, 7, 15, 31)
+
+
+class DecisionTable:
+    """
+    Activity codes of a policy over a bounded domain.
+
+    codes[foos, bars, foobars, money, nbrobots] is the code chosen by the policy;
+    outside the domain, the policy is called.
+    """
+
+    def __init__(self, policy: Policy, codes: np.ndarray) -> None:
+        self.policy = policy
+        self.codes = codes
+        self.bounds = np.array(codes.shape) - 1
+        self._flat = codes.ravel()
+        # offsets of the resources and of the number of robots in the flat table
+        self._strides = np.array(codes.strides) // codes.itemsize
+        # the same as Python ints, for the decisions one by one
+        self._top = tuple(self.bounds.tolist())
+        self._steps = tuple(self._strides.tolist())
+        self._view = memoryview(self._flat)
+
+    @classmethod
+    def compile(
+        cls, policy: Policy, bounds: Tuple[int, ...] = DEFAULT_BOUNDS
+    ) -> "DecisionTable":
+        """Evaluate policy over the domain, one vectorized call per foos count"""
+        shape = tuple(bound + 1 for bound in bounds)
+        codes = np.empty(shape, dtype=np.int8)
+        grid = np.indices(shape[1:]).reshape(len(shape) - 1, -1).T
+        resources = np.zeros((len(grid), 4), dtype=np.int64)
+        resources[:, 1:] = grid[:, :3]
+        for foos in range(0, shape[0]):
+            resources[:, 0] = foos
+            codes[foos] = policy(resources, grid[:, 3]).reshape(shape[1:])
+        return cls(policy, codes)
+
+    def __call__(self, resources: np.ndarray, nbrobots: np.ndarray) -> np.ndarray:
+        """Decisions of many factories: a lockstep policy"""
+        resources = np.asarray(resources, dtype=np.int64)
+        nbrobots = np.asarray(nbrobots, dtype=np.int64)
+        # compared unsigned, the negative counts are out of bounds too
+        inside = nbrobots.view(np.uint64) <= self.bounds[4]
+        unsigned = resources.view(np.uint64)
+        for column in range(0, 4):
+            inside &= unsigned[:, column] <= self.bounds[column]
+        index = resources @ self._strides[:4] + nbrobots * self._strides[4]
+        if inside.all():
+            return self._flat.take(index)
+        codes = np.empty(len(resources), dtype=np.int8)
+        codes[inside] = self._flat.take(index[inside])
+        codes[~inside] = self.policy(resources[~inside], nbrobots[~inside])
+        return codes
+
+    def covers(
+        self, foos: int, bars: int, foobars: int, money: int, nbrobots: int
+    ) -> bool:
+        """Whether the decision of one factory is in the table"""
+        top_foos, top_bars, top_foobars, top_money, top_robots = self._top
+        return (
+            0 <= foos <= top_foos
+            and 0 <= bars <= top_bars
+            and 0 <= foobars <= top_foobars
+            and 0 <= money <= top_money
+            and 0 <= nbrobots <= top_robots
+        )
+
+    def decide(
+        self, foos: int, bars: int, foobars: int, money: int, nbrobots: int
+    ) -> int:
+        """Decision of one factory"""
+        if self.covers(foos, bars, foobars, money, nbrobots):
+            step_foos, step_bars, step_foobars, step_money, step_robots = self._steps
+            return self._view[
+                foos * step_foos
+                + bars * step_bars
+                + foobars * step_foobars
+                + money * step_money
+                + nbrobots * step_robots
+            ]
+        resources = np.array([[foos, bars, foobars, money]], dtype=np.int64)
+        return int(self.policy(resources, np.array([nbrobots]))[0])
@@ -1,29 +1,25 @@
-import copy
 import json
-from collections import defaultdict
-from typing import Dict, List, Tuple
+from collections import Counter, defaultdict, namedtuple
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
 from . import robots
-from .constants import (
-    RES_KEY_NEWROBOTS,
-    RES_KEY_BARS,
-    RES_KEY_FOOBARS,
-    RES_KEY_FOOS,
-    RES_KEY_MONEY,
-)
+from .constants import READY, RES_KEY_NEWROBOTS
 from .activities import (
     BaseActivity,
     ActivityResourcesException,
 )
+from .changes import ChangeStream
+from .randomness import OutcomeStream, Seed
+from .resources import ResourceLedger
 
 
 def group_by_previous_activity(
     robots: List[robots.Robot], no_act_key: str = "idle"
-) -> Dict[str, robots.Robot]:
+) -> Dict[Union[int, str], List[robots.Robot]]:
     """Organize robots by type of their previous activity"""
     bots_by_act = defaultdict(list)
     for bot in robots:
-        if bot.previous_activity:
-            bots_by_act[bot.previous_activity.type].append(bot)
+        if bot.previous_type is not None:
+            bots_by_act[bot.previous_type].append(bot)
         else:
             bots_by_act[no_act_key].append(bot)
     return bots_by_act
@@ -35,108 +31,345 @@ class FactoryException(Exception):
     pass
 
 
+class ReadyPool:
+    """
+    Robots available for a new activity, indexed by the type of their previous one.
+
+    Robots without previous activity are indexed under None.
+    """
+
+    def __init__(self, robots: Iterable[robots.Robot] = ()) -> None:
+        self._buckets = group_by_previous_activity(robots, no_act_key=None)
+        self._count = sum(len(bots) for bots in self._buckets.values())
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, robot: robots.Robot) -> None:
+        self._buckets[robot.previous_type].append(robot)
+        self._count += 1
+
+    def layout(self) -> List[Tuple[Optional[int], List[robots.Robot]]]:
+        """
+        Return the buckets, in order, with their robots, in order.
+
+        The order decides which robot is taken: from_layout() rebuilds the same pool.
+        """
+        return [(acttype, list(bots)) for acttype, bots in self._buckets.items()]
+
+    @classmethod
+    def from_layout(cls, layout) -> "ReadyPool":
+        pool = cls()
+        for acttype, bots in layout:
+            pool._buckets[acttype] = list(bots)
+            pool._count += len(bots)
+        return pool
+
+    def take_batch(self, activity_types: Sequence[int]) -> List[robots.Robot]:
+        """
+        Remove and return the robots to do activities of the given types, in order.
+
+        The assignment is computed on the counts of activities per type: as many
+        activities as possible get a robot with the same previous activity type,
+        the others get robots without previous activity, then any robot. This
+        minimizes the number of robots changing of activity type, which costs them
+        5 ticks each.
+        """
+        if len(activity_types) > self._count:
+            raise FactoryException("Not enough robots")
+        demand = Counter(activity_types)
+        taken = {acttype: [] for acttype in demand}
+        buckets = self._buckets
+        # 1- robots with the same previous activity type
+        for acttype, count in demand.items():
+            taken[acttype] = _pop(buckets.get(acttype, []), count)
+        # 2- robots without previous activity, 3- now, any bot will do...
+        for bots in [buckets.get(None, [])] + list(buckets.values()):
+            for acttype, count in demand.items():
+                if not bots:
+                    break
+                taken[acttype].extend(_pop(bots, count - len(taken[acttype])))
+        self._count -= len(activity_types)
+        robots_by_type = {acttype: iter(bots) for acttype, bots in taken.items()}
+        return [next(robots_by_type[acttype]) for acttype in activity_types]
+
+
+def _pop(bots: List[robots.Robot], count: int) -> List[robots.Robot]:
+    """Remove and return up to count robots from the end of bots, last first"""
+    count = min(count, len(bots))
+    if count <= 0:
+        return []
+    taken = bots[-count:]
+    del bots[-count:]
+    taken.reverse()
+    return taken
+
+
+# Immutable situation of a factory, see Factory.snapshot():
+# resources: tuple of the slots of the ledger
+# robots: tuple of the robot states (see Robot.state)
+# ready: pool of the ready robots, tuple of (previous type, tuple of robot indexes)
+FactoryState = namedtuple("FactoryState", ("resources", "robots", "ready"))
+
+
 class Factory:
-    def __init__(self, initial_robots_nb: int = 2) -> None:
+    def __init__(self, initial_robots_nb: int = 2, seed: Seed = None) -> None:
         self.robots = [robots.Robot() for _ in range(0, initial_robots_nb)]
-        self.resources = {
-            RES_KEY_FOOS: 0,
-            RES_KEY_BARS: 0,
-            RES_KEY_FOOBARS: 0,
-            RES_KEY_MONEY: 0,
-        }
+        self.resources = ResourceLedger()
+        # robots available for a new activity
+        self._ready = ReadyPool(self.robots)
+        # incremented each time the situation changes
+        self.version = 0
+        # random outcomes of the activities done in this factory
+        self.outcomes = OutcomeStream(seed)
+        # robot -> its state, for the robots unchanged since their state was built
+        self._states = {}
+        # robot -> its index in the fleet
+        self._positions = {}
+        # open change streams, told of the changes
+        self._streams = []
+
+    @classmethod
+    def from_state(
+        cls, state: FactoryState, outcomes: Optional[OutcomeStream] = None
+    ) -> "Factory":
+        """Build a factory in the state, drawing its outcomes from outcomes"""
+        factory = cls._blank(outcomes)
+        factory.restore(state)
+        return factory
+
+    @classmethod
+    def _blank(cls, outcomes: Optional[OutcomeStream]) -> "Factory":
+        """Factory without robots nor resources, to be restored"""
+        factory = cls.__new__(cls)
+        factory.version = 0
+        factory.outcomes = OutcomeStream() if outcomes is None else outcomes
+        factory._streams = []
+        return factory
 
     def to_dict(self) -> Dict:
+        """Return a snapshot of the situation, decoupled from the factory"""
         return {
-            "resources": copy.deepcopy(self.resources),
-            "robots": [copy.deepcopy(r.to_dict()) for r in self.robots],
+            "resources": self.resources.to_dict(),
+            "robots": [r.to_dict() for r in self.robots],
         }
 
+    @classmethod
+    def from_dict(
+        cls, datadict: Dict, outcomes: Optional[OutcomeStream] = None
+    ) -> "Factory":
+        """
+        Build a factory in the situation represented by datadict (see to_dict).
+
+        The order of the pool of the ready robots is not part of the situation: the
+        pool is built in the fleet order.
+        """
+        factory = cls._blank(outcomes)
+        factory.resources = datadict["resources"]
+        factory.replace_robots([robots.Robot.from_dict(r) for r in datadict["robots"]])
+        return factory
+
     def __str__(self) -> str:  # pragma: no cover
         return json.dumps(self.to_dict())
 
+    @property
+    def resources(self) -> ResourceLedger:
+        return self._resources
+
+    @resources.setter
+    def resources(self, resources) -> None:
+        if isinstance(resources, Mapping):
+            resources = ResourceLedger.from_dict(resources)
+        self._resources = resources
+
     ### PUBLIC METHODS ###
 
     def run(self, tick: int) -> None:
         """Run the factory at the specified tick and update the situation"""
-        for rob in self.robots:
-            self._update_after_activity(rob.work(tick=tick))
+        streams = self._streams
+        for index, rob in enumerate(self.robots):
+            status = rob.status
+            done = rob.work(tick=tick)
+            if done is not None:
+                self._ready.add(rob)
+                for stream in streams:
+                    stream.activity_completed(index, done.type)
+            self._update_after_activity(done)
+            if rob.status != status:
+                self.version += 1
+                self._states.pop(rob, None)
+                for stream in streams:
+                    stream.robot_changed(index)
+
+    def replace_robots(
+        self, robots: List[robots.Robot], ready: Optional[ReadyPool] = None
+    ) -> None:
+        """
+        Replace the whole fleet, e.g. to restore a recorded situation
+
+        ready is the pool of the ready robots, default built in the fleet order.
+        """
+        self.robots = robots
+        if ready is None:
+            ready = ReadyPool(r for r in robots if r.status == READY)
+        self._ready = ready
+        self._states = {}
+        self._positions = {}
+        self.version += 1
+        for stream in self._streams:
+            stream.fleet_replaced()
+
+    def snapshot(self) -> FactoryState:
+        """
+        Return the situation of the factory as an immutable FactoryState.
+
+        The states of the robots are built once and shared until the robots change,
+        so that successive snapshots and the factories restored from them only cost
+        the robots changed in between.
+        CAUTION : the robots must only be changed by the factory methods.
+        """
+        states = self._states
+        positions = self._update_positions()
+        robot_states = []
+        for bot in self.robots:
+            state = states.get(bot)
+            if state is None:
+                state = states[bot] = bot.state()
+            robot_states.append(state)
+        return FactoryState(
+            tuple(self.resources.slots),
+            tuple(robot_states),
+            tuple(
+                (acttype, tuple(positions[bot] for bot in bots))
+                for acttype, bots in self._ready.layout()
+            ),
+        )
+
+    def restore(self, state: FactoryState) -> None:
+        """Put the factory back in a state returned by snapshot()"""
+        fleet = [robots.Robot.from_state(robot) for robot in state.robots]
+        ledger = ResourceLedger()
+        ledger.slots = list(state.resources)
+        self.resources = ledger
+        self.replace_robots(
+            fleet,
+            ReadyPool.from_layout(
+                (acttype, [fleet[index] for index in indexes])
+                for acttype, indexes in state.ready
+            ),
+        )
+        self._states = dict(zip(fleet, state.robots))
+
+    def fork(self, outcomes: Optional[OutcomeStream] = None) -> "Factory":
+        """
+        Return an independent factory in the same situation, e.g. to explore a
+        hypothetical future.
+
+        The fork draws its outcomes from outcomes, default from a copy of the stream
+        of this factory: then it draws the same outcomes as this factory would.
+        """
+        if outcomes is None:
+            outcomes = self.outcomes.copy()
+        return Factory.from_state(self.snapshot(), outcomes)
+
+    def change_stream(self) -> ChangeStream:
+        """Open a stream of the changes of the factory from now (see model.changes)"""
+        stream = ChangeStream(self)
+        self._streams.append(stream)
+        return stream
+
+    def close_stream(self, stream: ChangeStream) -> None:
+        self._streams.remove(stream)
+
+    def ready_layout(self) -> List[Tuple[Optional[int], List[robots.Robot]]]:
+        """Return the layout of the pool of ready robots (see ReadyPool.layout)"""
+        return self._ready.layout()
+
+    def count_ready(self) -> int:
+        """Return the number of robots available for a new activity"""
+        return len(self._ready)
+
+    def next_event_tick(self) -> Optional[int]:
+        """
+        Return the next tick at which a robot starts or completes an activity.
+
+        Return None if no robot has anything to do.
+        """
+        ticks = [
+            t for t in (rob.next_event_tick() for rob in self.robots) if t is not None
+        ]
+        return min(ticks) if ticks else None
 
     def set_activities(self, tick, *activities) -> None:
         """Set activities on available robots.
 
         If any activity is wrong (not enough resources) then an exception is raised
         and no activity is assigned to any robot"""
-        future_resources = self.resources.copy()  # shallow copy is enough here
-        avrobots = [r for r in self.robots if r.status == robots.READY]
-        assignments = self._validate_activities(avrobots, future_resources, *activities)
+        try:
+            assignments = self._validate_activities(
+                self._ready, self.resources, *activities
+            )
+        except Exception:
+            self.resources.rollback()
+            raise
         # All checks have passed, assignments are valid so:
+        self.resources.commit()
+        states = self._states
         for robot, activity in assignments:
-            self.resources = activity.take_resources(self.resources)
             robot.schedule(activity=activity, tick=tick)
+            states.pop(robot, None)
+        self.version += 1
+        if self._streams:
+            positions = self._update_positions()
+            for robot, _ in assignments:
+                for stream in self._streams:
+                    stream.robot_changed(positions[robot])
 
     ### PRIVATE METHODS ###
 
+    def _update_positions(self) -> Dict[robots.Robot, int]:
+        """Return the index of each robot in the fleet, indexing the new robots"""
+        positions = self._positions
+        fleet = self.robots
+        for index in range(len(positions), len(fleet)):
+            positions[fleet[index]] = index
+        return positions
+
     def _validate_activities(
         self, available_robots, available_resources, *activities
     ) -> List[Tuple[robots.Robot, BaseActivity]]:
         """
         Validate activities and return assignments (robot, activity)
 
+        The resources of the activities are reserved in the available_resources
+        ledger, it is up to the caller to commit or rollback the reservations.
         Raise FactoryException if any activity is invalid (not enough resource)
         """
-        future_assignments = list()
+        if not isinstance(available_robots, ReadyPool):
+            available_robots = ReadyPool(available_robots)
         if len(available_robots) < len(activities):
             raise FactoryException("Not enough available robots")
         try:
-            # reorder activities to have previous first
-            # in order to minimize changing assignment time
-            previousacts = {
-                bot.previous_activity.type if bot.previous_activity else None
-                for bot in available_robots
-            }
-            sortedacts = sorted(
-                activities, key=lambda act: 0 if act.type in previousacts else 1
-            )
-            for act in sortedacts:
-                available_resources = act.take_resources(available_resources)
-                # Try to assign the act to a robot which previously did the same activity
-                # to minimize the time lost between activities
-                assigned = self._find_good_robot(available_robots, act.type)
-                # the assigned robot is no longer available:
-                available_robots.remove(assigned)
-                future_assignments.append((assigned, act))
-            return future_assignments
-        except ActivityResourcesException as actexcept:  # pragma: no cover
+            for act in activities:
+                act.take_resources(available_resources)
+        except ActivityResourcesException as actexcept:
             raise FactoryException("Not enough resources", actexcept)
+        # Assign the acts at once, to robots which previously did the same activity
+        # as much as possible, to minimize the time lost between activities.
+        # The assigned robots are no longer available.
+        bots = available_robots.take_batch([act.type for act in activities])
+        return list(zip(bots, activities))
 
     def _update_after_activity(self, activity: BaseActivity) -> None:
         """Update the factory situation after the processing of the provided activity"""
         if activity is None:
             return
-        newresources = activity.deliver_result(self.resources)
-        if RES_KEY_NEWROBOTS in newresources:
+        activity.deliver_result(self.resources)
+        newrobots = self.resources.pop(RES_KEY_NEWROBOTS)
+        for _ in range(0, newrobots):
             # add robots
-            self.robots.extend(
-                [robots.Robot() for _ in range(0, newresources.get(RES_KEY_NEWROBOTS))]
-            )
-            del newresources[RES_KEY_NEWROBOTS]
-        self.resources = newresources
-
-    def _find_good_robot(self, avrobots, activity_type: str) -> robots.Robot:
-        # preference order:
-        # 1- robot with the same previous activity type
-        # 2- robot without previous activity
-        # 3- robot with a different activity
-        robots = group_by_previous_activity(avrobots)
-        sameact = robots.get(activity_type, [])
-        if len(sameact) > 0:
-            return sameact.pop()
-        idle = robots.get("idle", [])
-        if len(idle) > 0:
-            return idle.pop()
-        # now, any bot will do...
-        for _, bots in robots.items():
-            if len(bots) > 0:
-                return bots.pop()
-        # should not happen
-        raise FactoryException("Not enough robots")  # pragma: no cover
+            bot = robots.Robot()
+            self.robots.append(bot)
+            self._ready.add(bot)
+            for stream in self._streams:
+                stream.robot_changed(len(self.robots) - 1)
@@ -0,0 +1,299 @@
+"""
+Array-backed engine advancing thousands of independent factories in lockstep.
+
+Each robot attribute is a NumPy column with a leading factory axis, so one tick of
+every factory costs a handful of vectorized operations instead of one Python call
+per robot. The game rules are the ones of model.factory.Factory driven by
+runtime.Runtime:
+
+- activities started on a new workstation wait 5 ticks before starting
+- MineBar durations are 0.5, 1.0, 1.5 or 2.0 ticks, AssembleFoobar succeeds 3 times
+  out of 5 and gives the bar back on failure
+- robot assignment prefers robots which did the same activity, then idle robots
+- the pilot is asked again on the same tick as long as it programs something and
+  robots are available.
+"""
+
+from typing import Callable, Optional
+
+import numpy as np
+
+from .constants import (
+    ACTIVITY_TYPES,
+    MINEFOO,
+    MINEBAR,
+    ASSEMBLEFOOBAR,
+    SELLFOOBAR,
+    BUYROBOT,
+)
+
+# activity codes are the index of the activity type in ACTIVITY_TYPES
+TYPE_CODES = {acttype: code for code, acttype in enumerate(ACTIVITY_TYPES)}
+NO_ACTIVITY = -1
+
+# robot statuses
+ABSENT = -1  # slot without robot (yet)
+READY = 0
+SCHEDULING = 1
+WORKING = 2
+
+# resource columns
+FOOS = 0
+BARS = 1
+FOOBARS = 2
+MONEY = 3
+
+# ticks needed to complete an activity: MineBar durations are rounded up to whole
+# ticks since the factory only runs on whole ticks.
+DURATIONS = np.array([1, 0, 2, 10, 0])
+BAR_DURATIONS = np.ceil(np.array([0.5, 1.0, 1.5, 2.0])).astype(np.int64)
+# resources consumed, by activity code: (foos, bars, foobars, money)
+COSTS = np.array(
+    [[0, 0, 0, 0], [0, 0, 0, 0], [1, 1, 0, 0], [0, 0, 0, 0], [6, 0, 0, 3]]
+)
+MOVE_TICKS = 5
+# foobars sold by a SellFoobar activity at most
+MAX_SOLD = 5
+
+# A policy chooses the activity code of one available robot, for every factory,
+# from the resources left by the choices already made and the number of robots.
+Policy = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+def _last_true(mask: np.ndarray) -> np.ndarray:
+    """Column index of the last True value of each row (rows without any are 0)"""
+    return mask.shape[1] - 1 - np.argmax(mask[:, ::-1], axis=1)
+
+
+class LockstepFactories:
+    """Many independent factories stored as NumPy columns"""
+
+    def __init__(
+        self,
+        nb_factories: int,
+        max_robots: int,
+        initial_robots_nb: int = 2,
+        seed: Optional[int] = None,
+    ) -> None:
+        shape = (nb_factories, max_robots)
+        self.rng = np.random.default_rng(seed)
+        self.nbrobots = np.full(nb_factories, initial_robots_nb, dtype=np.int64)
+        self.status = np.full(shape, ABSENT, dtype=np.int8)
+        self.status[:, :initial_robots_nb] = READY
+        self.activity = np.full(shape, NO_ACTIVITY, dtype=np.int8)
+        self.previous = np.full(shape, NO_ACTIVITY, dtype=np.int8)
+        self.start_tick = np.zeros(shape, dtype=np.int32)
+        self.duration = np.zeros(shape, dtype=np.int32)
+        # assembled foobars or sold foobars
+        self.result = np.zeros(shape, dtype=np.int32)
+        self.resources = np.zeros((nb_factories, 4), dtype=np.int64)
+        # foobars assembled since the start
+        self.assembled = np.zeros(nb_factories, dtype=np.int64)
+
+    @property
+    def nb_factories(self) -> int:
+        return self.status.shape[0]
+
+    def ready_counts(self) -> np.ndarray:
+        return np.count_nonzero(self.status == READY, axis=1)
+
+    def run(self, tick: int, rows: Optional[np.ndarray] = None) -> None:
+        """Run the factories selected by the boolean mask rows at the given tick"""
+        status = self.status
+        selected = np.ones(status.shape, dtype=bool) if rows is None else rows[:, None]
+        starting = selected & (status == SCHEDULING) & (self.start_tick <= tick)
+        self.start_tick[starting] = tick
+        status[starting] = WORKING
+        done = (
+            selected & (status == WORKING) & (tick - self.start_tick >= self.duration)
+        )
+        if not done.any():
+            return
+        activity = self.activity
+
+        def completed(code):
+            return done & (activity == code)
+
+        assembled = completed(TYPE_CODES[ASSEMBLEFOOBAR])
+        successes = np.count_nonzero(assembled & (self.result == 1), axis=1)
+        failures = np.count_nonzero(assembled & (self.result == 0), axis=1)
+        self.resources[:, FOOS] += np.count_nonzero(completed(TYPE_CODES[MINEFOO]), 1)
+        # a failed assembly gives the bar back
+        self.resources[:, BARS] += (
+            np.count_nonzero(completed(TYPE_CODES[MINEBAR]), 1) + failures
+        )
+        self.resources[:, FOOBARS] += successes
+        self.assembled += successes
+        self.resources[:, MONEY] += np.where(
+            completed(TYPE_CODES[SELLFOOBAR]), self.result, 0
+        ).sum(axis=1)
+        newrobots = np.count_nonzero(completed(TYPE_CODES[BUYROBOT]), axis=1)
+        self.previous[done] = activity[done]
+        activity[done] = NO_ACTIVITY
+        status[done] = READY
+        if newrobots.any():
+            slots = np.arange(status.shape[1])
+            added = (slots >= self.nbrobots[:, None]) & (
+                slots < (self.nbrobots + newrobots)[:, None]
+            )
+            status[added] = READY
+            self.nbrobots += newrobots
+
+    def choose_activities(
+        self, policy: Policy, rows: np.ndarray, sell_max: int = MAX_SOLD
+    ):
+        """
+        Ask the policy an activity for each available robot of the factories rows.
+
+        Return (codes, nbtosell, valid), one line per factory of rows:
+        - codes: activity code chosen for each decision, NO_ACTIVITY if none
+        - nbtosell: number of foobars to sell for SellFoobar decisions, sell_max at
+          most
+        - valid: False for the factories whose choices overspend their resources
+        """
+        ready = self.ready_counts()[rows]
+        nbdecisions = int(ready.max()) if ready.size else 0
+        codes = np.full((len(rows), nbdecisions), NO_ACTIVITY, np.int8)
+        nbtosell = np.zeros(codes.shape, dtype=np.int64)
+        resources = self.resources[rows]
+        nbrobots = self.nbrobots[rows]
+        for step in range(0, nbdecisions):
+            deciding = ready > step
+            chosen = np.where(deciding, policy(resources, nbrobots), NO_ACTIVITY)
+            codes[:, step] = chosen
+            selling = chosen == TYPE_CODES[SELLFOOBAR]
+            nbtosell[:, step] = np.where(
+                selling, np.minimum(resources[:, FOOBARS], sell_max), 0
+            )
+            resources -= np.where(chosen[:, None] >= 0, COSTS[chosen], 0)
+            resources[:, FOOBARS] -= nbtosell[:, step]
+        valid = ~(resources < 0).any(axis=1)
+        # selling nothing is not a valid activity
+        valid &= ~((codes == TYPE_CODES[SELLFOOBAR]) & (nbtosell < 1)).any(axis=1)
+        return codes, nbtosell, valid
+
+    def set_activities(
+        self, tick: int, rows: np.ndarray, codes: np.ndarray, nbtosell: np.ndarray
+    ) -> None:
+        """
+        Assign the activities chosen for the factories rows to their available robots.
+
+        Like the factory does, as many activities as possible are assigned to a
+        robot which previously did the same activity, the others to an idle robot,
+        then to any robot: as few robots as possible change of activity. The robots
+        changing of activity are taken from the group of the first available robot,
+        by robot index, where the factory takes them from its groups in the order
+        they were created: as many robots change of activity, not the same ones.
+        """
+        if codes.shape[1] == 0:
+            return
+        previous = self.previous[rows]
+        available = self.status[rows] == READY
+        codes = codes.astype(np.int64)
+        pending = codes != NO_ACTIVITY
+        bar_durations = BAR_DURATIONS[self.rng.integers(0, 4, size=codes.shape)]
+        assembled = (self.rng.integers(0, 5, size=codes.shape) < 3).astype(np.int64)
+        for phase in ("same", "idle", "any"):
+            if not pending.any():
+                break
+            for step in range(0, codes.shape[1]):
+                lines = np.flatnonzero(pending[:, step])
+                if not lines.size:
+                    continue
+                code = codes[lines, step]
+                avail, prev = available[lines], previous[lines]
+                if phase == "same":
+                    candidates = avail & (prev == code[:, None])
+                elif phase == "idle":
+                    candidates = avail & (prev == NO_ACTIVITY)
+                else:
+                    # the factory takes from its groups of previous activity in
+                    # the order they were created, which the columns do not keep:
+                    # approximated by the group of the first available robot
+                    first = prev[np.arange(lines.size), np.argmax(avail, axis=1)]
+                    candidates = avail & (prev == first[:, None])
+                found = candidates.any(axis=1)
+                lines, code = lines[found], code[found]
+                robot = _last_true(candidates[found])
+                moving = phase == "any"
+                pending[lines, step] = False
+                available[lines, robot] = False
+                factories = rows[lines]
+                self.status[factories, robot] = SCHEDULING
+                self.activity[factories, robot] = code
+                self.start_tick[factories, robot] = tick + (MOVE_TICKS if moving else 0)
+                self.duration[factories, robot] = np.where(
+                    code == TYPE_CODES[MINEBAR],
+                    bar_durations[lines, step],
+                    DURATIONS[code],
+                )
+                self.result[factories, robot] = np.where(
+                    code == TYPE_CODES[SELLFOOBAR],
+                    nbtosell[lines, step],
+                    assembled[lines, step],
+                )
+                self.resources[factories] -= COSTS[code]
+                self.resources[factories, FOOBARS] -= nbtosell[lines, step]
+
+    def play_tick(
+        self,
+        policy: Policy,
+        tick: int,
+        ticks: np.ndarray,
+        target: int,
+        sell_max: int = MAX_SOLD,
+    ) -> None:
+        """
+        Play one tick of the factories which did not reach target robots yet.
+
+        ticks holds the tick each factory reached the target at, -1 if it did not
+        yet: it is updated with the factories reaching it during this tick.
+        """
+        playing = ticks < 0
+        self.run(tick, playing)
+        while True:
+            reached = playing & (self.nbrobots >= target)
+            ticks[reached] = tick
+            playing &= ~reached
+            deciding = playing & (self.ready_counts() > 0)
+            if not deciding.any():
+                break
+            rows = np.flatnonzero(deciding)
+            codes, nbtosell, valid = self.choose_activities(policy, rows, sell_max)
+            # a factory is asked again only if it programmed something
+            programmed = valid & (codes != NO_ACTIVITY).any(axis=1)
+            if not programmed.any():
+                break
+            rows = rows[programmed]
+            self.set_activities(tick, rows, codes[programmed], nbtosell[programmed])
+            playing = np.zeros(deciding.shape, dtype=bool)
+            playing[rows] = True
+            self.run(tick, playing)
+
+
+def play(
+    policy: Policy,
+    nb_factories: int,
+    target: int = 30,
+    initial_robots_nb: int = 2,
+    seed: Optional[int] = None,
+    max_ticks: Optional[int] = None,
+    sell_max: int = MAX_SOLD,
+) -> np.ndarray:
+    """
+    Play nb_factories games until each one reaches target robots.
+
+    Return the number of ticks each factory needed to reach the target, -1 for the
+    factories which did not reach it within max_ticks. The factories sell sell_max
+    foobars at most at once.
+    """
+    # a round cannot more than double the fleet
+    factories = LockstepFactories(
+        nb_factories, 2 * target, initial_robots_nb=initial_robots_nb, seed=seed
+    )
+    ticks = np.full(nb_factories, -1, dtype=np.int64)
+    tick = 0
+    while (ticks < 0).any() and (max_ticks is None or tick <= max_ticks):
+        factories.play_tick(policy, tick, ticks, target, sell_max)
+        tick += 1
+    return ticks
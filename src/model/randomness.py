@@ -0,0 +1,90 @@
+"""Random outcomes of the activities, drawn from a seedable stream"""
+
+from typing import List, Union
+
+import numpy as np
+
+# Possible MineBar durations, voluntarily limited to 0.5, 1.0, 1.5 and 2.0 ticks
+BAR_DURATIONS = (0.5, 1.0, 1.5, 2.0)
+# There is a 60% chance (or 3/5) that 1 Foobar is assembled
+ASSEMBLY_SUCCESSES = 3
+ASSEMBLY_DRAWS = 5
+
+Seed = Union[None, int, np.random.SeedSequence]
+
+
+class OutcomeStream:
+    """
+    Stream of activity outcomes, reproducible from its seed.
+
+    Outcomes are drawn by blocks of block_size and handed out one by one, so that
+    the cost of the random generator is paid once per block instead of once per
+    activity.
+
+    CAUTION : NOT THREAD-SAFE
+    """
+
+    __slots__ = ("rng", "block_size", "_durations", "_assemblies")
+
+    def __init__(self, seed: Seed = None, block_size: int = 1024) -> None:
+        self.rng = np.random.default_rng(seed)
+        self.block_size = block_size
+        self._durations = []
+        self._assemblies = []
+
+    def copy(self) -> "OutcomeStream":
+        """Return an independent stream drawing the same outcomes as this one"""
+        bit_generator = self.rng.bit_generator
+        copied = type(bit_generator)(0)
+        copied.state = bit_generator.state
+        stream = OutcomeStream.__new__(OutcomeStream)
+        stream.rng = np.random.Generator(copied)
+        stream.block_size = self.block_size
+        stream._durations = list(self._durations)
+        stream._assemblies = list(self._assemblies)
+        return stream
+
+    def bar_duration(self) -> float:
+        """Duration of the next MineBar activity"""
+        if not self._durations:
+            self._durations = self._draw(BAR_DURATIONS)
+        return self._durations.pop()
+
+    def assembly_result(self) -> int:
+        """Number of foobars (0 or 1) produced by the next AssembleFoobar activity"""
+        if not self._assemblies:
+            self._assemblies = self._draw(
+                [1] * ASSEMBLY_SUCCESSES + [0] * (ASSEMBLY_DRAWS - ASSEMBLY_SUCCESSES)
+            )
+        return self._assemblies.pop()
+
+    def _draw(self, values) -> List:
+        indexes = self.rng.integers(0, len(values), size=self.block_size)
+        return np.asarray(values)[indexes].tolist()
+
+
+class ScriptedOutcomes:
+    """Outcomes known in advance, handed out in order (e.g. to replay a game)"""
+
+    __slots__ = ("_durations", "_assemblies")
+
+    def __init__(self, durations: List[float] = (), assemblies: List[int] = ()):
+        self._durations = list(reversed(durations))
+        self._assemblies = list(reversed(assemblies))
+
+    def bar_duration(self) -> float:
+        return self._durations.pop()
+
+    def assembly_result(self) -> int:
+        return self._assemblies.pop()
+
+
+# Stream of the activities built without an explicit one
+DEFAULT_OUTCOMES = OutcomeStream()
+
+
+def spawn_seeds(seed: Seed, nb: int) -> List[np.random.SeedSequence]:
+    """Derive nb independent seeds from seed, e.g. one per game of a batch"""
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return seed.spawn(nb)
@@ -0,0 +1,175 @@
+"""Resources stock of the factory, updated in place"""
+
+from typing import Dict, List, Mapping, Tuple
+
+from .constants import (
+    ACTIVITY_TYPES,
+    RES_KEY_FOOS,
+    RES_KEY_BARS,
+    RES_KEY_FOOBARS,
+    RES_KEY_MONEY,
+    RES_KEY_NEWROBOTS,
+    MINEFOO,
+    MINEBAR,
+    ASSEMBLEFOOBAR,
+    SELLFOOBAR,
+    BUYROBOT,
+)
+
+# slots of the ledger
+FOOS = 0
+BARS = 1
+FOOBARS = 2
+MONEY = 3
+NEWROBOTS = 4
+SLOT_KEYS = (RES_KEY_FOOS, RES_KEY_BARS, RES_KEY_FOOBARS, RES_KEY_MONEY, RES_KEY_NEWROBOTS)
+SLOTS = {key: slot for slot, key in enumerate(SLOT_KEYS)}
+
+# A cost is a tuple of (slot, quantity) pairs
+Cost = Tuple[Tuple[int, int], ...]
+
+
+def cost(foos: int = 0, bars: int = 0, foobars: int = 0, money: int = 0) -> Cost:
+    """Build the cost of an activity"""
+    return tuple(
+        (slot, qty)
+        for slot, qty in ((FOOS, foos), (BARS, bars), (FOOBARS, foobars), (MONEY, money))
+        if qty
+    )
+
+
+# cost of each activity type, for SellFoobar the cost of selling one foobar
+COSTS = {
+    MINEFOO: cost(),
+    MINEBAR: cost(),
+    ASSEMBLEFOOBAR: cost(foos=1, bars=1),
+    SELLFOOBAR: cost(foobars=1),
+    BUYROBOT: cost(foos=6, money=3),
+}
+
+
+class ResourcesException(Exception):
+    """Raised by the ledger when resources are not sufficient"""
+
+    pass
+
+
+class ResourceLedger:
+    """
+    Integer slots of resources, updated in place.
+
+    Reservations are journaled until commit() so that a batch of activities can be
+    checked and applied one by one, then undone all at once by rollback().
+
+    CAUTION : NOT THREAD-SAFE
+    """
+
+    __slots__ = ("slots", "_journal")
+
+    def __init__(self, foos: int = 0, bars: int = 0, foobars: int = 0, money: int = 0):
+        self.slots = [foos, bars, foobars, money, 0]
+        self._journal = []
+
+    @classmethod
+    def from_dict(cls, resources: Mapping) -> "ResourceLedger":
+        ledger = cls()
+        ledger.slots = [resources.get(key, 0) for key in SLOT_KEYS]
+        return ledger
+
+    def to_dict(self) -> Dict:
+        """Return the resources as a dict, with new robots only if there are some"""
+        output = dict(zip(SLOT_KEYS[:NEWROBOTS], self.slots))
+        if self.slots[NEWROBOTS]:
+            output[RES_KEY_NEWROBOTS] = self.slots[NEWROBOTS]
+        return output
+
+    def __getitem__(self, key: str) -> int:
+        return self.slots[SLOTS[key]]
+
+    def get(self, key: str, default: int = None) -> int:
+        if key in SLOTS:
+            return self.slots[SLOTS[key]]
+        return default
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, ResourceLedger):
+            return self.slots == other.slots
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"ResourceLedger({self.to_dict()})"
+
+    def copy(self) -> "ResourceLedger":
+        ledger = ResourceLedger()
+        ledger.slots = list(self.slots)
+        return ledger
+
+    def can_afford(self, needed: Cost) -> bool:
+        slots = self.slots
+        for slot, qty in needed:
+            if slots[slot] < qty:
+                return False
+        return True
+
+    def reserve(self, needed: Cost) -> None:
+        """
+        Take the needed resources, until commit() or rollback().
+
+        Raise ResourcesException if resources are not sufficient.
+        """
+        if not self.can_afford(needed):
+            raise ResourcesException(f"Cannot afford {needed} with {self.to_dict()}")
+        slots = self.slots
+        for slot, qty in needed:
+            slots[slot] -= qty
+        self._journal.append(needed)
+
+    def credit(self, slot: int, qty: int) -> None:
+        """Add some resources"""
+        self.slots[slot] += qty
+
+    def pop(self, key: str) -> int:
+        """Return a resource quantity and reset it"""
+        qty = self[key]
+        self.slots[SLOTS[key]] = 0
+        return qty
+
+    def commit(self) -> None:
+        """Keep the reservations done since the last commit"""
+        self._journal.clear()
+
+    def rollback(self) -> None:
+        """Give back the resources reserved since the last commit"""
+        slots = self.slots
+        for needed in reversed(self._journal):
+            for slot, qty in needed:
+                slots[slot] += qty
+        self._journal.clear()
+
+    def feasible_mask(self) -> int:
+        """
+        Return a bit mask of the activity types which can be started.
+
+        Bit i is set when ACTIVITY_TYPES[i] is affordable.
+        """
+        mask = 0
+        for bit, needed in _TYPE_BITS:
+            if self.can_afford(needed):
+                mask |= bit
+        return mask
+
+    def feasible_types(self) -> List[int]:
+        """Return the activity types which can be started, in ACTIVITY_TYPES order"""
+        mask = self.feasible_mask()
+        return [acttype for bit, acttype in _BIT_TYPES if mask & bit]
+
+
+_TYPE_BITS = [(1 << i, COSTS[acttype]) for i, acttype in enumerate(ACTIVITY_TYPES)]
+_BIT_TYPES = [(1 << i, acttype) for i, acttype in enumerate(ACTIVITY_TYPES)]
+
+
+def type_bit(acttype: int) -> int:
+    """Bit of an activity type in the feasible_mask() of a ledger"""
+    return 1 << ACTIVITY_TYPES.index(acttype)
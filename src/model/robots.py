@@ -1,7 +1,7 @@
 """Definition of Robots capabilities"""
 
 import json
-from typing import Dict
+from typing import Dict, Optional, Tuple
 from . import activities
 from .constants import READY, SCHEDULING, WORKING
 
@@ -13,11 +13,22 @@ class RobotException(Exception):
 
 
 class Robot:
-    """Manage Robot state"""
+    """
+    Manage Robot state
+
+    Only the type code of the previous activity is kept, None if no previous activity.
+    """
+
+    __slots__ = (
+        "status",
+        "previous_type",
+        "current_activity",
+        "current_activity_start_tick",
+    )
 
     def __init__(self) -> None:
         self.status = READY
-        self.previous_activity = None
+        self.previous_type = None
         self.current_activity = None
         self.current_activity_start_tick = None
 
@@ -26,7 +37,7 @@ class Robot:
             raise RobotException("Cannot schedule activity on busy robot")
         self.status = SCHEDULING
         self.current_activity = activity
-        if self.previous_activity and not self.previous_activity.type == activity.type:
+        if self.previous_type is not None and self.previous_type != activity.type:
             self.current_activity_start_tick = (
                 tick + 5
             )  # changing activity takes 5 ticks
@@ -49,23 +60,76 @@ class Robot:
         if self.status == WORKING:
             self.current_activity.progress(tick=tick)
             if self.current_activity.has_completed(tick=tick):
-                self.previous_activity = self.current_activity
+                completed = self.current_activity
+                self.previous_type = completed.type
                 self.current_activity = None
                 self.status = READY
-                return self.previous_activity
+                return completed
         # Mean work is not complete:
         return None
 
+    def next_event_tick(self) -> Optional[int]:
+        """
+        Return the next tick at which calling work() will change the robot state.
+
+        Return None if the robot has nothing to do.
+        """
+        if not self.current_activity:
+            return None
+        if self.status == SCHEDULING:
+            return self.current_activity_start_tick
+        return self.current_activity.end_tick()
+
+    def state(self) -> Tuple:
+        """
+        Return the state of the robot as an immutable tuple.
+
+        (status, previous type, scheduled start tick, state of the current activity
+        or None), from_state() builds a robot equal to this one.
+        """
+        act = self.current_activity
+        return (
+            self.status,
+            self.previous_type,
+            self.current_activity_start_tick,
+            None if act is None else act.state(),
+        )
+
+    @classmethod
+    def from_state(cls, state: Tuple) -> "Robot":
+        robot = cls.__new__(cls)
+        (
+            robot.status,
+            robot.previous_type,
+            robot.current_activity_start_tick,
+            act,
+        ) = state
+        robot.current_activity = (
+            None if act is None else activities.BaseActivity.from_state(act)
+        )
+        return robot
+
+    @classmethod
+    def from_dict(cls, datadict: Dict) -> "Robot":
+        """Build the robot represented by datadict (see to_dict)"""
+        robot = cls()
+        robot.status = datadict["status"]
+        robot.previous_type = datadict["previous"]
+        current = datadict["current"]
+        if current is not None:
+            robot.current_activity = activities.BaseActivity.from_dict(current)
+            robot.current_activity_start_tick = datadict["start_tick"]
+        return robot
+
     def to_dict(self) -> Dict:  # pragma: no cover
         output = {"status": self.status}
         if self.current_activity:
             output["current"] = self.current_activity.to_dict()
         else:
             output["current"] = None
-        if self.previous_activity:
-            output["previous"] = self.previous_activity.to_dict()
-        else:
-            output["previous"] = None
+        output["previous"] = self.previous_type
+        # tick at which the current activity is scheduled to start
+        output["start_tick"] = self.current_activity_start_tick
         return output
 
     def __str__(self) -> str:  # pragma: no cover
@@ -4,7 +4,7 @@ import json
 
 from model.constants import COMPLETED, CONSUMED, RES_KEY_FOOS
 
-from . import activities
+from . import activities, randomness
 
 
 class TestActivityCommon:
@@ -109,6 +109,33 @@ class TestActivityCommon:
         assert activity.status == activities.COMPLETED
         assert activity.has_completed(done_tick)
 
+    @pytest.mark.parametrize(
+        argnames=["activity", "start_tick", "expected"],
+        argvalues=[
+            (activities.MineFoo(), 3, 4),
+            (activities.AssembleFoobar(), 3, 5),
+            (activities.SellFoobar(nbtosell=2), 3, 13),
+            (activities.BuyRobot(), 3, 3),
+        ],
+    )
+    def test_end_tick(self, activity, start_tick, expected):
+        activity.start(start_tick)
+        assert activity.end_tick() == expected
+        assert activity.has_completed(expected)
+
+    @pytest.mark.parametrize(
+        argnames=["duration", "expected"],
+        argvalues=[(0.5, 4), (1.0, 4), (1.5, 5), (2.0, 5)],
+    )
+    def test_end_tick_minebar(self, duration, expected):
+        """Fractional durations complete at the first whole tick past them"""
+        act = activities.MineBar()
+        act.duration = duration
+        act.start(3)
+        assert act.end_tick() == expected
+        assert act.has_completed(expected)
+        assert not act.has_completed(expected - 1)
+
     @pytest.mark.parametrize(
         argnames=[
             "activity",
@@ -210,6 +237,62 @@ class TestActivityCommon:
         act = activities.get_activty(activitycode)
         assert act.type == activitycode
 
+    def test_to_dict(self):
+        act = activities.SellFoobar(nbtosell=3)
+        assert act.to_dict() == {
+            "status": activities.READY,
+            "type": activities.SELLFOOBAR,
+            "duration": 10,
+            "future_result": 3,
+            "start_tick": None,
+            "nbtosell": 3,
+        }
+        with pytest.raises(AttributeError):
+            act.unknown = 1
+
+    @pytest.mark.parametrize(
+        "activity",
+        [
+            activities.MineFoo(),
+            activities.MineBar(),
+            activities.AssembleFoobar(),
+            activities.SellFoobar(nbtosell=4),
+            activities.BuyRobot(),
+        ],
+    )
+    def test_state(self, activity):
+        activity.start(tick=3)
+        state = activity.state()
+        restored = activities.BaseActivity.from_state(state)
+        assert type(restored) is type(activity)
+        assert restored.to_dict() == activity.to_dict()
+        assert restored.state() == state
+        # decoupled
+        restored.status = CONSUMED
+        assert activity.state() == state
+
+    def test_from_dict(self):
+        act = activities.SellFoobar(nbtosell=2)
+        act.start(tick=4)
+        restored = activities.BaseActivity.from_dict(act.to_dict())
+        assert type(restored) is activities.SellFoobar
+        assert restored.state() == act.state()
+
+    def test_get_activity_outcomes(self):
+        def draw(seed):
+            outcomes = randomness.OutcomeStream(seed=seed)
+            return [
+                (
+                    activities.get_activty(activities.MINEBAR, outcomes).duration,
+                    activities.get_activty(
+                        activities.ASSEMBLEFOOBAR, outcomes=outcomes
+                    ).future_result,
+                )
+                for _ in range(20)
+            ]
+
+        assert draw(7) == draw(7)
+
     def test_get_activity_fail(self):
         with pytest.raises(ValueError):
             act = activities.get_activty("Z")
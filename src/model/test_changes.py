@@ -0,0 +1,152 @@
+import pytest
+
+from . import activities, factory
+from .changes import FactoryDelta
+from .constants import READY, SCHEDULING, WORKING
+
+FOO = activities.MINEFOO
+BAR = activities.MINEBAR
+SELL = activities.SELLFOOBAR
+BUY = activities.BUYROBOT
+
+
+# Fixtures
+
+
+@pytest.fixture
+def fact():
+    yield factory.Factory(seed=1)
+
+
+def act(fact, acttype, **params):
+    return activities.get_activty(acttype, fact.outcomes, **params)
+
+
+def replay(deltas):
+    """Robots and resources rebuilt from the deltas of a stream"""
+    robots, resources = [], [0, 0, 0, 0]
+    for delta in deltas:
+        if delta.reset:
+            robots = []
+        for index, *state in delta.robots:
+            if index < len(robots):
+                robots[index] = tuple(state)
+            else:
+                robots.append(tuple(state))
+        resources = [have + change for have, change in zip(resources, delta.resources)]
+        assert len(robots) == delta.nbrobots
+    return robots, resources
+
+
+# Tests
+
+
+class TestChangeStream:
+    def test_first_read(self, fact):
+        fact.resources.slots[:4] = [3, 2, 1, 0]
+        stream = fact.change_stream()
+        assert stream.read() == FactoryDelta(
+            True,
+            ((0, READY, None, None), (1, READY, None, None)),
+            (),
+            (3, 2, 1, 0),
+            2,
+        )
+        assert stream.read() == FactoryDelta(False, (), (), (0, 0, 0, 0), 2)
+
+    def test_round(self, fact):
+        fact.resources.slots[:4] = [0, 0, 2, 0]
+        stream = fact.change_stream()
+        stream.read()
+        fact.set_activities(0, act(fact, SELL, nbtosell=2))
+        assert stream.read() == FactoryDelta(
+            False, ((1, SCHEDULING, None, SELL),), (), (0, 0, -2, 0), 2
+        )
+        fact.run(0)
+        assert stream.read().robots == ((1, WORKING, None, SELL),)
+        fact.run(5)
+        assert stream.read() == FactoryDelta(False, (), (), (0, 0, 0, 0), 2)
+        fact.run(10)
+        assert stream.read() == FactoryDelta(
+            False, ((1, READY, SELL, None),), ((1, SELL),), (0, 0, 0, 2), 2
+        )
+
+    def test_changes_accumulate(self, fact):
+        stream = fact.change_stream()
+        stream.read()
+        for tick in range(0, 4):
+            if fact.count_ready():
+                fact.set_activities(tick, act(fact, FOO), act(fact, FOO))
+            fact.run(tick)
+        delta = stream.read()
+        # the last state of each robot, every completion
+        assert delta.robots == ((0, READY, FOO, None), (1, READY, FOO, None))
+        assert delta.completed == ((0, FOO), (1, FOO)) * 2
+        assert delta.resources == (4, 0, 0, 0)
+
+    def test_new_robots(self, fact):
+        fact.resources.slots[:4] = [12, 0, 0, 6]
+        stream = fact.change_stream()
+        stream.read()
+        fact.set_activities(0, act(fact, BUY), act(fact, BUY))
+        fact.run(0)
+        delta = stream.read()
+        assert delta.robots == (
+            (0, READY, BUY, None),
+            (1, READY, BUY, None),
+            (2, READY, None, None),
+            (3, READY, None, None),
+        )
+        assert delta.completed == ((0, BUY), (1, BUY))
+        assert delta.resources == (-12, 0, 0, -6)
+        assert delta.nbrobots == 4
+
+    def test_restore(self, fact):
+        state = fact.snapshot()
+        stream = fact.change_stream()
+        stream.read()
+        fact.set_activities(0, act(fact, BAR))
+        fact.restore(state)
+        delta = stream.read()
+        assert delta.reset
+        assert delta.robots == ((0, READY, None, None), (1, READY, None, None))
+
+    def test_replay(self, fact):
+        """The deltas of a stream rebuild the situation"""
+        stream = fact.change_stream()
+        deltas = [stream.read()]
+        fact.resources.slots[:4] = [20, 0, 0, 20]
+        for tick in range(0, 30):
+            if fact.count_ready():
+                acttype = BUY if fact.resources["foos"] >= 6 else BAR
+                fact.set_activities(tick, act(fact, acttype))
+            fact.run(tick)
+            if tick % 7 == 0:
+                deltas.append(stream.read())
+        deltas.append(stream.read())
+        robots, resources = replay(deltas)
+        situation = fact.to_dict()
+        assert robots == [
+            (
+                bot["status"],
+                bot["previous"],
+                bot["current"]["type"] if bot["current"] else None,
+            )
+            for bot in situation["robots"]
+        ]
+        assert resources == [
+            situation["resources"][key] for key in ("foos", "bars", "foobars", "money")
+        ]
+
+    def test_streams(self, fact):
+        first = fact.change_stream()
+        second = fact.change_stream()
+        first.read()
+        fact.set_activities(0, act(fact, FOO))
+        assert second.read().reset
+        assert first.read().robots == ((1, SCHEDULING, None, FOO),)
+        first.close()
+        fact.run(0)
+        assert second.read().robots == ((1, WORKING, None, FOO),)
+        assert first.read().robots == ()
+        assert fact.fork().change_stream().read().nbrobots == 2
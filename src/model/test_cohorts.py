@@ -0,0 +1,226 @@
+import numpy as np
+import pytest
+
+from . import cohorts, lockstep
+from .factory import FactoryException
+
+FOO = cohorts.FOO
+BAR = cohorts.BAR
+ASM = cohorts.ASSEMBLE
+SELL = cohorts.SELL
+BUY = cohorts.BUY
+NONE = lockstep.NO_ACTIVITY
+
+
+# Fixtures
+
+
+@pytest.fixture
+def fleet():
+    """Yield a fleet of 10 idle robots with plenty of resources"""
+    facts = cohorts.CohortFactory(initial_robots_nb=10, seed=1)
+    facts.resources[:] = [100, 100, 100, 100]
+    yield facts
+
+
+def rule_policy(resources, nbrobots):
+    """A small rule-based lockstep policy"""
+    foos, bars, foobars, money = resources.T
+    return np.select(
+        [
+            (money >= 3) & (foos >= 6),
+            foobars >= 1,
+            foos < 7,
+            bars < 1,
+            bars < 9,
+        ],
+        [BUY, SELL, FOO, BAR, ASM],
+        NONE,
+    )
+
+
+def one_by_one(policy, resources, nbready, nbrobots):
+    """Decisions of policy robot by robot, as (code, foobars sold)"""
+    resources = np.array(resources, dtype=np.int64)
+    decisions = []
+    for _ in range(0, nbready):
+        code = int(policy(resources[None, :], np.array([nbrobots]))[0])
+        if code == NONE:
+            break
+        nbtosell = int(min(resources[lockstep.FOOBARS], 5)) if code == SELL else 0
+        resources -= lockstep.COSTS[code]
+        resources[lockstep.FOOBARS] -= nbtosell
+        decisions.append((code, nbtosell))
+    return decisions
+
+
+# Tests
+
+
+class TestCohortFactory:
+    def test_init(self):
+        facts = cohorts.CohortFactory()
+        assert facts.nbrobots == 2
+        assert facts.count_ready() == 2
+        assert facts.ready[NONE] == 2
+        assert facts.resources_dict() == {
+            "foos": 0,
+            "bars": 0,
+            "foobars": 0,
+            "money": 0,
+        }
+        assert facts.next_event_tick(0) is None
+
+    @pytest.mark.parametrize(
+        argnames=["code", "nbtosell", "ticks", "expected"],
+        argvalues=[
+            (FOO, 0, 1, [100 + 4, 100, 100, 100]),
+            (SELL, 5, 10, [100, 100, 100 - 20, 100 + 20]),
+        ],
+    )
+    def test_run_delivers(self, fleet, code, nbtosell, ticks, expected):
+        fleet.set_activities(0, [(code, 4, nbtosell)])
+        assert fleet.count_ready() == 6
+        assert fleet.next_event_tick(0) == ticks
+        fleet.run(ticks - 1)
+        assert fleet.count_ready() == 6
+        fleet.run(ticks)
+        assert list(fleet.resources) == expected
+        assert fleet.ready[code] == 4
+        assert fleet.next_event_tick(ticks) is None
+
+    def test_run_assembles(self, fleet):
+        fleet.set_activities(0, [(ASM, 10, 0)])
+        fleet.run(2)
+        foos, bars, foobars, _ = fleet.resources
+        assert foos == 90
+        # a failure gives the bar back
+        assert (bars - 90) + (foobars - 100) == 10
+        assert fleet.ready[ASM] == 10
+
+    def test_minebar_durations(self, fleet):
+        fleet.set_activities(0, [(BAR, 10, 0)])
+        fleet.run(1)
+        first = fleet.resources[lockstep.BARS] - 100
+        assert fleet.next_event_tick(1) == 2
+        fleet.run(2)
+        assert fleet.resources[lockstep.BARS] == 110
+        assert fleet.ready[BAR] == 10
+        assert 0 < first < 10
+
+    def test_buy_immediate(self, fleet):
+        fleet.set_activities(0, [(BUY, 3, 0)])
+        fleet.run(0)
+        assert fleet.nbrobots == 13
+        assert fleet.ready[BUY] == 3
+        assert fleet.ready[NONE] == 10
+        assert list(fleet.resources) == [82, 100, 100, 91]
+
+    def test_assign_order(self, fleet):
+        fleet.ready[:] = [3, 0, 0, 0, 0, 1]
+        fleet.set_activities(0, [(BAR, 2, 0), (FOO, 2, 0)])
+        # minefoo keeps two minefoo robots, minebar takes the idle one then moves
+        # the remaining minefoo one
+        assert fleet.count_ready() == 0
+        assert fleet.busy[1, FOO].sum() == 2
+        assert fleet.busy[1:3, BAR].sum() == 1
+        assert fleet.busy[6:8, BAR].sum() == 1
+
+    def test_assign_known_first(self, fleet):
+        fleet.ready[:] = [0, 0, 1, 0, 0, 1]
+        fleet.set_activities(0, [(FOO, 1, 0), (ASM, 1, 0)])
+        assert fleet.busy[2, ASM].sum() == 1
+        assert fleet.busy[1, FOO].sum() == 1
+
+    def test_assign_minimum_moves(self, fleet):
+        fleet.ready[:] = [1, 1, 1, 0, 0, 0]
+        fleet.set_activities(0, [(FOO, 2, 0), (BAR, 1, 0)])
+        # only the assembler moves, to mine foo
+        assert fleet.busy[1, FOO].sum() == 1
+        assert fleet.busy[6, FOO].sum() == 1
+        assert fleet.busy[1:3, BAR].sum() == 1
+
+    @pytest.mark.parametrize(
+        argnames=["cohort", "message"],
+        argvalues=[
+            ((FOO, 11, 0), "Not enough available robots"),
+            ((SELL, 10, 11), "Not enough resources"),
+            ((SELL, 5, 21), "Not enough resources"),
+        ],
+    )
+    def test_set_activities_invalid(self, fleet, cohort, message):
+        with pytest.raises(FactoryException, match=message):
+            fleet.set_activities(0, [cohort])
+        assert fleet.count_ready() == 10
+        assert list(fleet.resources) == [100, 100, 100, 100]
+
+
+class TestBulkDecisions:
+    @pytest.mark.parametrize(
+        argnames=["resources", "nbready"],
+        argvalues=[
+            ([0, 0, 0, 0], 5),
+            ([7, 0, 0, 0], 3),
+            ([30, 5, 0, 0], 40),
+            ([60, 3, 12, 9], 40),
+            ([6, 0, 3, 3], 1),
+            ([7, 9, 0, 0], 4),
+        ],
+    )
+    def test_same_decisions(self, resources, nbready):
+        bulk = cohorts.bulk_decisions(rule_policy, resources, nbready, 2)
+        assert [
+            (code, nbtosell) for code, count, nbtosell in bulk for _ in range(count)
+        ] == one_by_one(rule_policy, resources, nbready, 2)
+
+    def test_random(self):
+        rng = np.random.default_rng(4)
+        for _ in range(0, 200):
+            resources = rng.integers(0, 80, size=4)
+            nbready = int(rng.integers(1, 100))
+            bulk = cohorts.bulk_decisions(rule_policy, resources, nbready, 2)
+            assert [
+                (code, nbtosell) for code, count, nbtosell in bulk for _ in range(count)
+            ] == one_by_one(rule_policy, resources, nbready, 2)
+
+    def test_cohorts(self):
+        decide = cohorts.cohort_policy(rule_policy)
+        assert decide(np.array([30, 5, 12, 9]), 100, 2) == [
+            (BUY, 3, 0),
+            (SELL, 2, 5),
+            (SELL, 1, 2),
+            (ASM, 5, 0),
+            (BAR, 89, 0),
+        ]
+
+    @pytest.mark.parametrize(argnames="code", argvalues=[SELL, BUY])
+    def test_nothing_affordable(self, code):
+        def policy(resources, nbrobots):
+            return np.full(len(resources), code)
+
+        assert cohorts.bulk_decisions(policy, [0, 0, 0, 0], 2, 2) == []
+
+
+class TestPlay:
+    def test_play(self):
+        decide = cohorts.cohort_policy(rule_policy)
+        tick, facts = cohorts.play(decide, target=5, seed=2)
+        assert facts.nbrobots >= 5
+        assert tick > 0
+        assert cohorts.play(decide, target=5, seed=2)[0] == tick
+
+    def test_play_max_ticks(self):
+        def policy(resources, nbrobots):
+            return np.full(len(resources), FOO)
+
+        tick, facts = cohorts.play(cohorts.cohort_policy(policy), 5, max_ticks=20)
+        assert tick == 21
+        assert facts.nbrobots == 2
+
+    def test_play_nothing_programmed(self):
+        def policy(resources, nbrobots):
+            return np.full(len(resources), NONE)
+
+        tick, facts = cohorts.play(cohorts.cohort_policy(policy), 5, max_ticks=3)
+        assert tick == 4
+        assert facts.count_ready() == 2
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from . import lockstep
+from .decisiontable import DecisionTable
+
+FOO = lockstep.TYPE_CODES[lockstep.MINEFOO]
+BAR = lockstep.TYPE_CODES[lockstep.MINEBAR]
+ASM = lockstep.TYPE_CODES[lockstep.ASSEMBLEFOOBAR]
+SELL = lockstep.TYPE_CODES[lockstep.SELLFOOBAR]
+BUY = lockstep.TYPE_CODES[lockstep.BUYROBOT]
+NONE = lockstep.NO_ACTIVITY
+
+
+# Fixtures
+
+
+def rule_policy(resources, nbrobots):
+    """A small rule-based policy, depending on every input"""
+    foos, bars, foobars, money = resources.T
+    return np.select(
+        [
+            (money >= 3) & (foos >= 6),
+            (foobars >= 1) & (foobars >= nbrobots),
+            foos < 7,
+            bars < 1,
+            bars < 3,
+        ],
+        [BUY, SELL, FOO, BAR, ASM],
+        NONE,
+    )
+
+
+@pytest.fixture
+def table():
+    yield DecisionTable.compile(rule_policy, bounds=(7, 3, 3, 4, 5))
+
+
+# Tests
+
+
+class TestDecisionTable:
+    def test_compile(self, table):
+        assert table.codes.shape == (8, 4, 4, 5, 6)
+        assert table.codes.dtype == np.int8
+        grid = np.indices(table.codes.shape).reshape(5, -1).T
+        expected = rule_policy(grid[:, :4], grid[:, 4])
+        assert (table.codes.ravel() == expected).all()
+
+    def test_call_inside(self, table):
+        resources = np.array([[6, 0, 0, 3], [7, 1, 0, 0], [7, 3, 1, 0], [7, 0, 0, 0]])
+        nbrobots = np.array([2, 2, 5, 2])
+        assert list(table(resources, nbrobots)) == [BUY, ASM, NONE, BAR]
+
+    def test_call_outside(self, table):
+        resources = np.array([[20, 0, 0, 0], [0, 0, 3, 0], [2, 0, 0, 9], [0, -1, 0, 0]])
+        nbrobots = np.array([2, 9, 2, 2])
+        assert list(table(resources, nbrobots)) == list(
+            rule_policy(resources, nbrobots)
+        )
+
+    def test_call_random(self, table):
+        rng = np.random.default_rng(2)
+        resources = rng.integers(-1, 10, size=(500, 4))
+        nbrobots = rng.integers(0, 8, size=500)
+        assert (table(resources, nbrobots) == rule_policy(resources, nbrobots)).all()
+
+    @pytest.mark.parametrize(
+        argnames=["args", "expected"],
+        argvalues=[
+            ((6, 0, 0, 3, 2), BUY),
+            ((0, 0, 2, 0, 2), SELL),
+            ((7, 3, 0, 0, 3), NONE),
+            # outside
+            ((12, 0, 0, 3, 2), BUY),
+            ((7, 3, 2, 0, 9), NONE),
+            ((0, 0, 9, 0, 2), SELL),
+        ],
+    )
+    def test_decide(self, table, args, expected):
+        assert table.decide(*args) == expected
+
+    def test_lockstep_play(self, table):
+        played = lockstep.play(rule_policy, 20, target=4, seed=3, max_ticks=400)
+        assert (
+            lockstep.play(table, 20, target=4, seed=3, max_ticks=400) == played
+        ).all()
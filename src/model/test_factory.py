@@ -2,7 +2,9 @@ import pytest
 from unittest.mock import call, patch, MagicMock
 
 import json
+import random
 from . import activities, robots, factory
+from .constants import ACTIVITY_TYPES
 
 
 # Fixtures
@@ -13,11 +15,7 @@ def mock_robot_builder():
     def _make_robot(prevtype):
         robot = MagicMock()
         robot.status = robots.READY
-        if prevtype is not None:
-            robot.previous_activity = MagicMock()
-            robot.previous_activity.type = prevtype
-        else:
-            robot.previous_activity = None
+        robot.previous_type = prevtype
         return robot
 
     yield _make_robot
@@ -64,6 +62,54 @@ class TestFactory:
         assert "resources" in result
         assert "robots" in result
 
+    def test_to_dict_decoupled(self):
+        fact = factory.Factory()
+        fact.robots[0].schedule(activities.MineFoo(), tick=0)
+        fact.run(0)
+        result = fact.to_dict()
+        result["resources"]["foos"] = 10
+        result["robots"][0]["current"]["status"] = activities.COMPLETED
+        assert fact.resources["foos"] == 0
+        assert fact.robots[0].current_activity.status == activities.RUNNING
+
+    def test_count_ready(self):
+        fact = factory.Factory(initial_robots_nb=3)
+        fact.set_activities(0, activities.MineFoo())
+        assert fact.count_ready() == 2
+        fact.run(0)
+        fact.run(1)
+        assert fact.count_ready() == 3
+
+    def test_version(self):
+        fact = factory.Factory()
+        fact.run(0)
+        assert fact.version == 0
+        fact.set_activities(0, activities.MineFoo())
+        assert fact.version == 1
+        fact.run(0)
+        # the miner started working
+        assert fact.version == 2
+        fact.run(0)
+        assert fact.version == 2
+        fact.run(1)
+        # the miner completed
+        assert fact.version == 3
+
+    def test_next_event_tick_idle(self):
+        fact = factory.Factory()
+        assert fact.next_event_tick() is None
+
+    def test_next_event_tick(self):
+        fact = factory.Factory(initial_robots_nb=3)
+        fact.robots[0].schedule(activities.SellFoobar(), tick=0)
+        fact.robots[1].previous_type = activities.MINEBAR
+        fact.robots[1].schedule(activities.MineFoo(), tick=0)
+        fact.run(0)
+        # the seller completes at 10, the other robot starts mining at 5
+        assert fact.next_event_tick() == 5
+        fact.run(5)
+        assert fact.next_event_tick() == 6
+
     @pytest.mark.parametrize("nbrobots", range(1, 11))
     @patch.object(factory.Factory, "_update_after_activity")
     @patch.object(factory.robots.Robot, "work")
@@ -108,10 +154,10 @@ class TestFactory:
         bot2 = robots.Robot()
         bot3 = robots.Robot()
         bot4 = robots.Robot()
-        bot1.previous_activity = activities.MineFoo()
-        bot2.previous_activity = activities.MineBar()
-        bot3.previous_activity = activities.MineFoo()
-        bot4.previous_activity = None
+        bot1.previous_type = activities.MINEFOO
+        bot2.previous_type = activities.MINEBAR
+        bot3.previous_type = activities.MINEFOO
+        bot4.previous_type = None
         # when
         grouped = factory.group_by_previous_activity([bot1, bot2, bot3, bot4])
         grouped2 = factory.group_by_previous_activity(
@@ -129,6 +175,140 @@ class TestFactory:
             activities.MINEBAR: [bot2],
         }
 
+    def test_replace_robots(self):
+        fact = factory.Factory()
+        fleet = [robots.Robot() for _ in range(3)]
+        fleet[0].schedule(activities.MineFoo(), tick=0)
+        fact.replace_robots(fleet)
+        assert fact.robots == fleet
+        assert fact.count_ready() == 2
+
+    def _busy_factory(self):
+        fact = factory.Factory(initial_robots_nb=4, seed=3)
+        fact.resources = {"foos": 7, "bars": 2, "money": 3}
+        fact.robots[0].previous_type = activities.MINEBAR
+        fact.robots[1].previous_type = activities.MINEFOO
+        fact.replace_robots(fact.robots)
+        fact.set_activities(
+            0,
+            activities.get_activty(activities.MINEBAR, fact.outcomes),
+            activities.get_activty(activities.ASSEMBLEFOOBAR, fact.outcomes),
+        )
+        fact.run(0)
+        return fact
+
+    def _play(self, fact, ticks):
+        """Run the factory, keeping a robot mining bars, and return its situations"""
+        situations = []
+        for tick in range(1, ticks):
+            if fact.count_ready():
+                fact.set_activities(
+                    tick, activities.get_activty(activities.MINEBAR, fact.outcomes)
+                )
+            fact.run(tick)
+            situations.append(fact.to_dict())
+        return situations
+
+    def test_snapshot(self):
+        fact = self._busy_factory()
+        state = fact.snapshot()
+        assert state.resources == (6, 1, 0, 3, 0)
+        assert len(state.robots) == 4
+        assert state.robots[0] == fact.robots[0].state()
+        assert state.ready == (
+            (activities.MINEBAR, ()),
+            (activities.MINEFOO, (1,)),
+            (None, (2,)),
+        )
+        # unchanged robots share their state
+        fact.run(1)
+        again = fact.snapshot()
+        assert again == state
+        assert all(a is b for a, b in zip(again.robots, state.robots))
+        # changed robots do not
+        fact.run(3)
+        changed = fact.snapshot()
+        assert changed.robots[0] is not state.robots[0]
+        assert changed.robots[2] is state.robots[2]
+        # a bar mined, and the bar of the failed assembly given back
+        assert changed.resources == (6, 3, 0, 3, 0)
+
+    def test_restore(self):
+        fact = self._busy_factory()
+        state = fact.snapshot()
+        expected = self._play(fact, 12)
+        version = fact.version
+        fact.restore(state)
+        assert fact.version > version
+        assert fact.snapshot() == state
+        fact.outcomes = factory.OutcomeStream(seed=3)
+        fact.outcomes.bar_duration()
+        fact.outcomes.assembly_result()
+        assert self._play(fact, 12) == expected
+
+    def test_fork(self):
+        fact = self._busy_factory()
+        before = fact.to_dict()
+        forked = fact.fork()
+        assert forked.to_dict() == before
+        assert forked.ready_layout() == [
+            (activities.MINEBAR, []),
+            (activities.MINEFOO, [forked.robots[1]]),
+            (None, [forked.robots[2]]),
+        ]
+        # same outcomes, independent situations
+        assert self._play(forked, 12) == self._play(fact, 12)
+        assert fact.robots[0] is not forked.robots[0]
+        forked.resources.credit(0, 10)
+        assert fact.resources != forked.resources
+
+    def test_fork_new_robots(self):
+        fact = factory.Factory(initial_robots_nb=1, seed=0)
+        fact.resources = {"foos": 6, "money": 3}
+        fact.snapshot()
+        fact.set_activities(0, activities.BuyRobot())
+        fact.run(0)
+        forked = fact.fork(outcomes=factory.OutcomeStream(seed=1))
+        assert len(forked.robots) == 2
+        assert forked.snapshot() == fact.snapshot()
+        assert forked.count_ready() == 2
+
+    def test_from_state(self):
+        state = self._busy_factory().snapshot()
+        fact = factory.Factory.from_state(state)
+        assert fact.snapshot() == state
+        assert fact.outcomes is not None
+
+    def test_from_dict(self):
+        fact = self._busy_factory()
+        restored = factory.Factory.from_dict(fact.to_dict())
+        assert restored.to_dict() == fact.to_dict()
+        assert restored.count_ready() == fact.count_ready()
+        outcomes = factory.OutcomeStream(seed=1)
+        assert factory.Factory.from_dict(fact.to_dict(), outcomes).outcomes is outcomes
+
+    def test_ready_layout(self):
+        fact = factory.Factory(initial_robots_nb=4)
+        fact.robots[0].previous_type = activities.MINEFOO
+        fact.robots[1].previous_type = activities.MINEBAR
+        fact.replace_robots(fact.robots)
+        layout = fact.ready_layout()
+        assert layout == [
+            (activities.MINEFOO, [fact.robots[0]]),
+            (activities.MINEBAR, [fact.robots[1]]),
+            (None, [fact.robots[2], fact.robots[3]]),
+        ]
+        # the same pool gives the same robots
+        copied = factory.Factory(initial_robots_nb=0)
+        copied.replace_robots(fact.robots, factory.ReadyPool.from_layout(layout))
+        acts = [activities.MineBar(), activities.SellFoobar()]
+        copied.resources = fact.resources = {"foobars": 1}
+        assigned = fact._validate_activities(fact._ready, fact.resources, *acts)
+        assigned_copy = copied._validate_activities(
+            copied._ready, copied.resources, *acts
+        )
+        assert [bot for bot, _ in assigned] == [bot for bot, _ in assigned_copy]
+
     @pytest.mark.parametrize(
         argnames=["nbrobots", "nbbusy"],
         argvalues=(
@@ -153,9 +333,30 @@ class TestFactory:
         fact.set_activities(42, MagicMock())
         # then
         for robot, act in assignments:
-            act.take_resources.assert_called_once()
             robot.schedule.assert_called_once_with(activity=act, tick=42)
 
+    def test_set_activities_takes_resources(self):
+        fact = factory.Factory(initial_robots_nb=3)
+        fact.resources = {"foos": 7, "bars": 1, "foobars": 0, "money": 3}
+        # when
+        fact.set_activities(0, activities.BuyRobot(), activities.AssembleFoobar())
+        fact.resources.rollback()
+        # then the reservations were committed
+        assert fact.resources == {"foos": 0, "bars": 0, "foobars": 0, "money": 0}
+        assert fact.count_ready() == 1
+
+    def test_set_activities_rollback(self):
+        fact = factory.Factory(initial_robots_nb=3)
+        fact.resources = {"foos": 6, "bars": 1, "foobars": 0, "money": 3}
+        # when
+        with pytest.raises(factory.FactoryException):
+            fact.set_activities(
+                0, activities.BuyRobot(), activities.AssembleFoobar(), activities.MineFoo()
+            )
+        # then nothing was taken nor assigned
+        assert fact.resources == {"foos": 6, "bars": 1, "foobars": 0, "money": 3}
+        assert fact.count_ready() == 3
+
     @pytest.mark.parametrize(["nbrobots", "nbactivities"], ((0, 1), (1, 3), (4, 5)))
     def test_validate_activities_nerobots(self, nbrobots, nbactivities):
         """Check exception raised when not enough robots"""
@@ -279,6 +480,20 @@ class TestFactory:
                 1,
                 0,
             ),
+            (
+                [activities.MINEFOO, activities.MINEBAR, activities.ASSEMBLEFOOBAR],
+                [activities.MINEFOO, activities.MINEFOO, activities.MINEBAR],
+                2,
+                0,
+                1,
+            ),
+            (
+                [activities.MINEFOO, activities.MINEBAR, None],
+                [activities.MINEBAR, activities.ASSEMBLEFOOBAR, activities.MINEBAR],
+                1,
+                1,
+                1,
+            ),
         ),
     )
     def test_assignments(
@@ -304,13 +519,13 @@ class TestFactory:
                 [
                     (bot, act)
                     for bot, act in assresult
-                    if bot.previous_activity and bot.previous_activity.type == act.type
+                    if bot.previous_type == act.type
                 ]
             )
             == expectsame
         )
         assert (
-            len([(bot, act) for bot, act in assresult if bot.previous_activity is None])
+            len([(bot, act) for bot, act in assresult if bot.previous_type is None])
             == expectnone
         )
         assert (
@@ -318,9 +533,58 @@ class TestFactory:
                 [
                     (bot, act)
                     for bot, act in assresult
-                    if bot.previous_activity
-                    and not bot.previous_activity.type == act.type
+                    if bot.previous_type is not None
+                    and not bot.previous_type == act.type
                 ]
             )
             == expectchange
         )
+
+
+class TestReadyPool:
+    @staticmethod
+    def _pool(previousacts):
+        bots = []
+        for prevtype in previousacts:
+            bot = robots.Robot()
+            bot.previous_type = prevtype
+            bots.append(bot)
+        return bots, factory.ReadyPool(bots)
+
+    def test_take_batch(self):
+        bots, pool = self._pool([activities.MINEFOO, None, activities.MINEFOO])
+        taken = pool.take_batch([activities.MINEBAR, activities.MINEFOO])
+        # the last robot of a group first
+        assert taken == [bots[1], bots[2]]
+        assert len(pool) == 1
+        assert pool.layout() == [(activities.MINEFOO, [bots[0]]), (None, [])]
+
+    def test_take_batch_not_enough(self):
+        _, pool = self._pool([None])
+        with pytest.raises(factory.FactoryException):
+            pool.take_batch([activities.MINEFOO, activities.MINEFOO])
+        assert len(pool) == 1
+
+    def test_take_batch_minimum_moves(self):
+        """The robots changing of activity are only the ones which must"""
+        rng = random.Random(3)
+        choices = list(ACTIVITY_TYPES) + [None]
+        for _ in range(0, 300):
+            previousacts = [rng.choice(choices) for _ in range(rng.randint(1, 12))]
+            acttypes = [
+                rng.choice(ACTIVITY_TYPES)
+                for _ in range(rng.randint(1, len(previousacts)))
+            ]
+            _, pool = self._pool(previousacts)
+            taken = pool.take_batch(acttypes)
+            assert len(set(taken)) == len(acttypes)
+            moves = sum(
+                bot.previous_type not in (None, acttype)
+                for bot, acttype in zip(taken, acttypes)
+            )
+            # the activities without a robot of their type nor an idle robot
+            unmatched = sum(
+                max(0, acttypes.count(acttype) - previousacts.count(acttype))
+                for acttype in set(acttypes)
+            )
+            assert moves == max(0, unmatched - previousacts.count(None))
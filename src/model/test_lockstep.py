@@ -0,0 +1,225 @@
+import numpy as np
+import pytest
+
+from . import lockstep
+from .constants import MINEFOO, MINEBAR, ASSEMBLEFOOBAR, SELLFOOBAR, BUYROBOT
+
+FOO = lockstep.TYPE_CODES[MINEFOO]
+BAR = lockstep.TYPE_CODES[MINEBAR]
+ASM = lockstep.TYPE_CODES[ASSEMBLEFOOBAR]
+SELL = lockstep.TYPE_CODES[SELLFOOBAR]
+BUY = lockstep.TYPE_CODES[BUYROBOT]
+NONE = lockstep.NO_ACTIVITY
+
+
+# Fixtures
+
+
+@pytest.fixture
+def one_factory():
+    """Yield a single factory of 3 robots with plenty of resources"""
+    facts = lockstep.LockstepFactories(1, 6, initial_robots_nb=3, seed=1)
+    facts.resources[:] = [20, 20, 20, 20]
+    yield facts
+
+
+def constant_policy(code):
+    def _policy(resources, nbrobots):
+        return np.full(len(resources), code)
+
+    return _policy
+
+
+def set_one(facts, tick, *codes, nbtosell=None):
+    codes = np.array([codes], dtype=np.int8)
+    if nbtosell is None:
+        nbtosell = np.where(codes == SELL, 1, 0)
+    facts.set_activities(tick, np.array([0]), codes, np.array(nbtosell).reshape(1, -1))
+
+
+# Tests
+
+
+class TestLockstepFactories:
+    def test_init(self):
+        facts = lockstep.LockstepFactories(4, 10)
+        assert facts.nb_factories == 4
+        assert list(facts.nbrobots) == [2, 2, 2, 2]
+        assert list(facts.ready_counts()) == [2, 2, 2, 2]
+        assert (facts.status[:, 2:] == lockstep.ABSENT).all()
+        assert (facts.resources == 0).all()
+
+    @pytest.mark.parametrize(
+        argnames=["code", "duration", "result", "expected"],
+        argvalues=[
+            (FOO, 1, 0, [21, 20, 20, 20]),
+            (BAR, 2, 0, [20, 21, 20, 20]),
+            (ASM, 2, 1, [20, 20, 21, 20]),
+            (ASM, 2, 0, [20, 21, 20, 20]),
+            (SELL, 10, 3, [20, 20, 20, 23]),
+        ],
+    )
+    def test_run_delivers(self, one_factory, code, duration, result, expected):
+        one_factory.status[0, 0] = lockstep.SCHEDULING
+        one_factory.activity[0, 0] = code
+        one_factory.start_tick[0, 0] = 1
+        one_factory.duration[0, 0] = duration
+        one_factory.result[0, 0] = result
+        one_factory.run(0)
+        assert one_factory.status[0, 0] == lockstep.SCHEDULING
+        one_factory.run(1)
+        assert one_factory.status[0, 0] == lockstep.WORKING
+        one_factory.run(duration)
+        assert one_factory.status[0, 0] == lockstep.WORKING
+        one_factory.run(1 + duration)
+        assert one_factory.status[0, 0] == lockstep.READY
+        assert one_factory.previous[0, 0] == code
+        assert one_factory.activity[0, 0] == NONE
+        assert list(one_factory.resources[0]) == expected
+        assert one_factory.assembled[0] == (code == ASM and result)
+
+    def test_run_buy_immediate(self, one_factory):
+        set_one(one_factory, 4, BUY, BUY)
+        assert list(one_factory.ready_counts()) == [1]
+        one_factory.run(4)
+        assert one_factory.nbrobots[0] == 5
+        assert list(one_factory.ready_counts()) == [5]
+        assert list(one_factory.resources[0]) == [8, 20, 20, 14]
+
+    def test_run_rows(self):
+        facts = lockstep.LockstepFactories(2, 4)
+        facts.resources[:] = [6, 0, 0, 3]
+        codes = np.array([[BUY], [BUY]], dtype=np.int8)
+        facts.set_activities(0, np.array([0, 1]), codes, np.zeros((2, 1), np.int64))
+        facts.run(0, np.array([False, True]))
+        assert list(facts.nbrobots) == [2, 3]
+
+    def test_choose_activities(self, one_factory):
+        one_factory.resources[0] = [0, 0, 12, 0]
+        codes, nbtosell, valid = one_factory.choose_activities(
+            constant_policy(SELL), np.array([0])
+        )
+        assert codes.tolist() == [[SELL, SELL, SELL]]
+        assert nbtosell.tolist() == [[5, 5, 2]]
+        assert valid.tolist() == [True]
+
+    def test_choose_activities_sell_max(self, one_factory):
+        one_factory.resources[0] = [0, 0, 12, 0]
+        _, nbtosell, valid = one_factory.choose_activities(
+            constant_policy(SELL), np.array([0]), sell_max=3
+        )
+        assert nbtosell.tolist() == [[3, 3, 3]]
+        assert valid.tolist() == [True]
+
+    def test_choose_activities_partial(self, one_factory):
+        one_factory.status[0, 0] = lockstep.WORKING
+        codes, nbtosell, valid = one_factory.choose_activities(
+            constant_policy(ASM), np.array([0])
+        )
+        assert codes.tolist() == [[ASM, ASM]]
+        assert valid.tolist() == [True]
+
+    @pytest.mark.parametrize(
+        argnames=["code", "resources"],
+        argvalues=[
+            (BUY, [12, 0, 0, 5]),
+            (ASM, [1, 3, 0, 0]),
+            (SELL, [0, 0, 5, 0]),
+        ],
+    )
+    def test_choose_activities_invalid(self, one_factory, code, resources):
+        one_factory.resources[0] = resources
+        _, _, valid = one_factory.choose_activities(
+            constant_policy(code), np.array([0])
+        )
+        assert valid.tolist() == [False]
+
+    def test_set_activities_schedule(self, one_factory):
+        one_factory.previous[0] = [FOO, BAR, NONE, NONE, NONE, NONE]
+        set_one(one_factory, 3, SELL, FOO, nbtosell=[4, 0])
+        # the miner stays on its workstation
+        assert one_factory.status[0, 0] == lockstep.SCHEDULING
+        assert one_factory.activity[0, 0] == FOO
+        assert one_factory.start_tick[0, 0] == 3
+        assert one_factory.duration[0, 0] == 1
+        # the seller is the idle robot: no move needed
+        assert one_factory.activity[0, 2] == SELL
+        assert one_factory.start_tick[0, 2] == 3
+        assert one_factory.duration[0, 2] == 10
+        assert one_factory.result[0, 2] == 4
+        assert one_factory.status[0, 1] == lockstep.READY
+        assert list(one_factory.resources[0]) == [20, 20, 16, 20]
+
+    def test_set_activities_move(self, one_factory):
+        one_factory.previous[0] = [FOO, BAR, FOO, NONE, NONE, NONE]
+        set_one(one_factory, 3, ASM)
+        # the last robot of the group of the first robot has to move
+        assert one_factory.activity[0, 2] == ASM
+        assert one_factory.start_tick[0, 2] == 8
+        assert one_factory.duration[0, 2] == 2
+        assert one_factory.result[0, 2] in {0, 1}
+        assert list(one_factory.resources[0]) == [19, 19, 20, 20]
+
+    def test_set_activities_minimum_moves(self, one_factory):
+        one_factory.previous[0] = [FOO, BAR, ASM, NONE, NONE, NONE]
+        set_one(one_factory, 3, FOO, FOO, BAR)
+        # the miners stay on their workstations, only the assembler moves
+        assert one_factory.activity[0, :3].tolist() == [FOO, BAR, FOO]
+        assert one_factory.start_tick[0, :3].tolist() == [3, 3, 8]
+
+    def test_set_activities_minebar(self, one_factory):
+        set_one(one_factory, 0, BAR, BAR, BAR)
+        assert set(one_factory.duration[0, :3]) <= {1, 2}
+
+    def test_set_activities_nothing(self, one_factory):
+        set_one(one_factory, 0)
+        set_one(one_factory, 0, NONE, NONE)
+        assert list(one_factory.ready_counts()) == [3]
+
+
+class TestPlay:
+    def test_play_tick(self):
+        facts = lockstep.LockstepFactories(3, 8)
+        facts.resources[:] = [[12, 0, 0, 6], [6, 0, 0, 3], [0, 0, 0, 0]]
+        ticks = np.array([-1, -1, 5])
+        facts.play_tick(constant_policy(BUY), 0, ticks, target=4)
+        # the second factory cannot afford two robots: nothing is programmed, the
+        # third one reached the target before: it does not play
+        assert ticks.tolist() == [0, -1, 5]
+        assert list(facts.nbrobots) == [4, 2, 2]
+
+    def test_play(self):
+        def policy(resources, nbrobots):
+            foos, bars, foobars, money = resources.T
+            return np.select(
+                [(money >= 3) & (foos >= 6), foobars >= 1, foos < 7, bars < 1],
+                [BUY, SELL, FOO, BAR],
+                ASM,
+            )
+
+        ticks = lockstep.play(policy, 20, target=4, seed=1)
+        assert (ticks > 0).all()
+        assert (ticks == lockstep.play(policy, 20, target=4, seed=1)).all()
+
+    def test_play_max_ticks(self):
+        ticks = lockstep.play(constant_policy(FOO), 2, target=3, max_ticks=10)
+        assert ticks.tolist() == [-1, -1]
+
+    def test_play_reached(self, monkeypatch):
+        original = lockstep.LockstepFactories.__init__
+
+        def rich_init(self, *args, **kwargs):
+            original(self, *args, **kwargs)
+            self.resources[:] = [12, 0, 0, 6]
+
+        monkeypatch.setattr(lockstep.LockstepFactories, "__init__", rich_init)
+        ticks = lockstep.play(constant_policy(BUY), 2, target=4)
+        assert ticks.tolist() == [0, 0]
+
+    def test_play_nothing_programmed(self):
+        ticks = lockstep.play(constant_policy(NONE), 2, target=3, max_ticks=5)
+        assert ticks.tolist() == [-1, -1]
+
+    def test_play_target_already_reached(self):
+        ticks = lockstep.play(constant_policy(NONE), 2, target=2)
+        assert ticks.tolist() == [0, 0]
@@ -0,0 +1,68 @@
+import numpy as np
+
+from . import randomness
+
+
+class TestOutcomeStream:
+    def test_reproducible(self):
+        stream1 = randomness.OutcomeStream(seed=42)
+        stream2 = randomness.OutcomeStream(seed=42)
+        draws1 = [
+            (stream1.bar_duration(), stream1.assembly_result()) for _ in range(50)
+        ]
+        draws2 = [
+            (stream2.bar_duration(), stream2.assembly_result()) for _ in range(50)
+        ]
+        assert draws1 == draws2
+
+    def test_values(self):
+        stream = randomness.OutcomeStream(seed=1, block_size=8)
+        durations = [stream.bar_duration() for _ in range(2000)]
+        results = [stream.assembly_result() for _ in range(2000)]
+        assert set(durations) == set(randomness.BAR_DURATIONS)
+        assert set(results) == {0, 1}
+        # 3 out of 5
+        assert 0.55 < sum(results) / len(results) < 0.65
+
+    def test_blocks(self):
+        stream = randomness.OutcomeStream(seed=1, block_size=4)
+        stream.bar_duration()
+        assert len(stream._durations) == 3
+        for _ in range(3):
+            stream.bar_duration()
+        stream.bar_duration()
+        assert len(stream._durations) == 3
+        assert stream._assemblies == []
+
+    def test_copy(self):
+        stream = randomness.OutcomeStream(seed=5, block_size=4)
+        stream.bar_duration()
+        copied = stream.copy()
+        draws = [(stream.bar_duration(), stream.assembly_result()) for _ in range(9)]
+        assert [
+            (copied.bar_duration(), copied.assembly_result()) for _ in range(9)
+        ] == draws
+        assert copied.block_size == 4
+
+
+class TestScriptedOutcomes:
+    def test_scripted(self):
+        outcomes = randomness.ScriptedOutcomes([2.0, 0.5], [0, 1])
+        assert outcomes.bar_duration() == 2.0
+        assert outcomes.assembly_result() == 0
+        assert outcomes.bar_duration() == 0.5
+        assert outcomes.assembly_result() == 1
+
+
+class TestSpawnSeeds:
+    def test_spawn_seeds(self):
+        seeds = randomness.spawn_seeds(3, 4)
+        assert len(seeds) == 4
+        assert [s.generate_state(1)[0] for s in seeds] == [
+            s.generate_state(1)[0] for s in randomness.spawn_seeds(3, 4)
+        ]
+        assert len({s.generate_state(1)[0] for s in seeds}) == 4
+
+    def test_spawn_seeds_from_sequence(self):
+        seeds = randomness.spawn_seeds(np.random.SeedSequence(3), 2)
+        assert len(seeds) == 2
@@ -0,0 +1,94 @@
+import pytest
+
+from . import resources
+from .constants import MINEFOO, MINEBAR, ASSEMBLEFOOBAR, SELLFOOBAR, BUYROBOT
+
+
+class TestCost:
+    def test_cost(self):
+        assert resources.cost() == ()
+        assert resources.cost(foos=6, money=3) == (
+            (resources.FOOS, 6),
+            (resources.MONEY, 3),
+        )
+
+
+class TestResourceLedger:
+    def test_init(self):
+        ledger = resources.ResourceLedger(foos=1, bars=2, foobars=3, money=4)
+        assert ledger.to_dict() == {"foos": 1, "bars": 2, "foobars": 3, "money": 4}
+        assert ledger["bars"] == 2
+        assert ledger.get("money") == 4
+        assert ledger.get("unknown", 12) == 12
+
+    def test_from_dict(self):
+        ledger = resources.ResourceLedger.from_dict({"foos": 2, "newrobots": 1})
+        assert ledger.to_dict() == {
+            "foos": 2,
+            "bars": 0,
+            "foobars": 0,
+            "money": 0,
+            "newrobots": 1,
+        }
+
+    def test_eq(self):
+        ledger = resources.ResourceLedger(foos=1)
+        assert ledger == resources.ResourceLedger(foos=1)
+        assert ledger != resources.ResourceLedger(foos=2)
+        assert ledger == {"foos": 1, "bars": 0, "foobars": 0, "money": 0}
+        assert ledger != {"foos": 1}
+        assert not ledger == 1
+
+    def test_copy(self):
+        ledger = resources.ResourceLedger(foos=1)
+        copied = ledger.copy()
+        copied.credit(resources.FOOS, 1)
+        assert ledger["foos"] == 1
+        assert copied["foos"] == 2
+
+    def test_reserve_commit(self):
+        ledger = resources.ResourceLedger(foos=7, bars=1, money=3)
+        ledger.reserve(resources.COSTS[BUYROBOT])
+        ledger.reserve(resources.COSTS[ASSEMBLEFOOBAR])
+        ledger.commit()
+        ledger.rollback()
+        assert ledger == resources.ResourceLedger()
+
+    def test_reserve_rollback(self):
+        ledger = resources.ResourceLedger(foos=7, bars=1, money=3)
+        ledger.commit()
+        ledger.reserve(resources.COSTS[BUYROBOT])
+        with pytest.raises(resources.ResourcesException):
+            ledger.reserve(resources.cost(foos=2))
+        assert ledger == resources.ResourceLedger(foos=1, bars=1)
+        ledger.rollback()
+        assert ledger == resources.ResourceLedger(foos=7, bars=1, money=3)
+
+    def test_pop(self):
+        ledger = resources.ResourceLedger()
+        ledger.credit(resources.NEWROBOTS, 2)
+        assert ledger.pop("newrobots") == 2
+        assert ledger.pop("newrobots") == 0
+        assert "newrobots" not in ledger.to_dict()
+
+    @pytest.mark.parametrize(
+        argnames=["before", "expected"],
+        argvalues=(
+            ({}, [MINEFOO, MINEBAR]),
+            ({"foos": 1}, [MINEFOO, MINEBAR]),
+            ({"foos": 1, "bars": 1}, [MINEFOO, MINEBAR, ASSEMBLEFOOBAR]),
+            ({"foobars": 1}, [MINEFOO, MINEBAR, SELLFOOBAR]),
+            ({"foos": 6, "money": 3}, [MINEFOO, MINEBAR, BUYROBOT]),
+            (
+                {"foos": 6, "bars": 1, "foobars": 2, "money": 3},
+                [MINEFOO, MINEBAR, ASSEMBLEFOOBAR, SELLFOOBAR, BUYROBOT],
+            ),
+        ),
+    )
+    def test_feasible(self, before, expected):
+        ledger = resources.ResourceLedger.from_dict(before)
+        assert ledger.feasible_types() == expected
+        mask = ledger.feasible_mask()
+        for acttype in expected:
+            assert mask & resources.type_bit(acttype)
+        assert bin(mask).count("1") == len(expected)
@@ -1,6 +1,5 @@
 import pytest
 from unittest.mock import MagicMock
-import copy
 
 from . import robots, activities
 
@@ -21,7 +20,7 @@ class TestRobot:
     def test_init(self):
         rob = robots.Robot()
         assert rob.status == robots.READY
-        assert rob.previous_activity is None
+        assert rob.previous_type is None
         assert rob.current_activity is None
         assert rob.current_activity_start_tick is None
 
@@ -43,7 +42,7 @@ class TestRobot:
         rob.schedule(activity=activity, tick=1)
         assert rob.status == robots.SCHEDULING
         assert rob.current_activity == activity
-        assert rob.previous_activity is None
+        assert rob.previous_type is None
         assert rob.current_activity_start_tick == 1
 
     @pytest.mark.parametrize(
@@ -61,11 +60,11 @@ class TestRobot:
         Test activity scheduling on robots with same previous activity type
         """
         rob = robots.Robot()
-        rob.previous_activity = copy.deepcopy(activity)
+        rob.previous_type = activity.type
         rob.schedule(activity=activity, tick=1)
         assert rob.status == robots.SCHEDULING
         assert rob.current_activity == activity
-        assert rob.previous_activity is not None
+        assert rob.previous_type == activity.type
         assert rob.current_activity_start_tick == 1
 
     @pytest.mark.parametrize(
@@ -83,19 +82,18 @@ class TestRobot:
         Test activity scheduling on robots with same previous activity type
         """
         rob = robots.Robot()
-        previous = copy.deepcopy(activity)
         # change type to force something different
-        previous.type = next(
+        previous = next(
             filter(
                 lambda x: not x == activity.type,
                 [activities.MINEFOO, activities.MINEBAR],
             )
         )
-        rob.previous_activity = previous
+        rob.previous_type = previous
         rob.schedule(activity=activity, tick=1)
         assert rob.status == robots.SCHEDULING
         assert rob.current_activity == activity
-        assert rob.previous_activity is not None
+        assert rob.previous_type == previous
         assert rob.current_activity_start_tick == 6
 
     @pytest.mark.parametrize(
@@ -151,16 +149,67 @@ class TestRobot:
         if completed:
             assert rob.status == robots.READY
             assert rob.current_activity is None
-            assert rob.previous_activity == mock_activity
+            assert rob.previous_type == mock_activity.type
             assert result == mock_activity
         else:
             assert rob.status == robots.WORKING
             assert rob.current_activity == mock_activity
             assert result is None
 
+    def test_next_event_tick_noactivity(self):
+        rob = robots.Robot()
+        assert rob.next_event_tick() is None
+
+    def test_next_event_tick_scheduling(self, mock_activity):
+        rob = robots.Robot()
+        rob.status = robots.SCHEDULING
+        rob.current_activity = mock_activity
+        rob.current_activity_start_tick = 6
+        assert rob.next_event_tick() == 6
+
+    def test_next_event_tick_working(self, mock_activity):
+        mock_activity.end_tick.return_value = 12
+        rob = robots.Robot()
+        rob.status = robots.WORKING
+        rob.current_activity = mock_activity
+        assert rob.next_event_tick() == 12
+
     def test_to_dict(self):
         rob = robots.Robot()
         result = rob.to_dict()
         assert "status" in result
         assert "current" in result
         assert "previous" in result
+        assert "start_tick" in result
+
+    def test_from_dict(self):
+        rob = robots.Robot()
+        rob.previous_type = activities.MINEBAR
+        assert robots.Robot.from_dict(rob.to_dict()).state() == rob.state()
+        rob.schedule(activities.MineFoo(), tick=2)
+        assert robots.Robot.from_dict(rob.to_dict()).state() == rob.state()
+
+    def test_state_idle(self):
+        rob = robots.Robot()
+        rob.previous_type = activities.MINEBAR
+        state = rob.state()
+        assert state == (robots.READY, activities.MINEBAR, None, None)
+        restored = robots.Robot.from_state(state)
+        assert restored.to_dict() == rob.to_dict()
+
+    def test_state_busy(self):
+        rob = robots.Robot()
+        rob.previous_type = activities.MINEBAR
+        rob.schedule(activities.MineFoo(), tick=2)
+        restored = robots.Robot.from_state(rob.state())
+        assert restored.to_dict() == rob.to_dict()
+        assert restored.current_activity is not rob.current_activity
+        # the restored robot works on its own
+        assert restored.work(tick=7) is None
+        assert restored.work(tick=8).type == activities.MINEFOO
+        assert rob.status == robots.SCHEDULING
+
+    def test_slots(self):
+        rob = robots.Robot()
+        with pytest.raises(AttributeError):
+            rob.previous_activity = activities.MineFoo()
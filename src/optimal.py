@@ -0,0 +1,391 @@
+"""
+Optimal policy of an abstract game, computed by value iteration.
+
+The abstract state of the game is the resource counts and the multiset of the robot
+states: an available robot is known by the type of its previous activity, a busy one
+by the type of its activity, the ticks remaining until it completes (including the
+5 ticks of a change of activity) and the number of foobars it sells. The random
+outcomes are drawn when they matter: the duration of MineBar when it is programmed,
+the result of AssembleFoobar when it completes.
+
+From a state, the decisions are to program an activity on one available robot (the
+robot the factory would take, no tick elapses) or to wait one tick, leaving the
+available robots idle. The value of a state is the expected number of ticks to reach
+the target; the values are computed by value iteration over the states reachable from
+the start of a game, with bounded resources: what is produced over the cap of a
+resource is lost. The states grow fast with the target: about 700 000 for the
+default target 3, tens of millions beyond.
+
+The policy table holds the best decision of each state, sorted by packed state key,
+in a .npy file which is memory-mapped when loaded. OptimalPilot answers with a
+binary search of the table, and falls back to another pilot outside the table.
+"""
+
+import math
+from collections import deque
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+import click
+import numpy as np
+
+from model.constants import (
+    ASSEMBLEFOOBAR,
+    BUYROBOT,
+    MINEBAR,
+    MINEFOO,
+    READY,
+    SELLFOOBAR,
+)
+from model.randomness import ASSEMBLY_DRAWS, ASSEMBLY_SUCCESSES, BAR_DURATIONS
+from model.resources import ResourceLedger
+from pilots import FactoryPilot, SmartAutopilot
+
+# decision of the table: leave the available robots idle for one tick
+WAIT = -1
+# bits of the packed state key: resources, then up to MAX_ROBOTS robot codes
+RESOURCE_BITS = (6, 5, 4, 5)
+ROBOT_BITS = 7
+MAX_ROBOTS = 6
+MAX_TARGET = MAX_ROBOTS + 1
+# caps of foos, bars, foobars and money below which no robot can be bought
+MIN_CAPS = (6, 1, 1, 3)
+TABLE_DTYPE = np.dtype([("key", "<u8"), ("action", "i1"), ("ticks", "<f4")])
+
+CHANGE_TICKS = 5
+ASSEMBLY_SUCCESS = ASSEMBLY_SUCCESSES / ASSEMBLY_DRAWS
+_BAR_TICKS = [math.ceil(duration) for duration in BAR_DURATIONS]
+# ticks of each activity, with their probability
+TICKS = {
+    MINEFOO: ((1, 1.0),),
+    MINEBAR: tuple(
+        (ticks, _BAR_TICKS.count(ticks) / len(_BAR_TICKS))
+        for ticks in sorted(set(_BAR_TICKS))
+    ),
+    ASSEMBLEFOOBAR: ((2, 1.0),),
+    SELLFOOBAR: ((10, 1.0),),
+    BUYROBOT: ((0, 1.0),),
+}
+
+# robot codes: the available robots first, by previous type (None first), then the
+# busy robots (activity type, remaining ticks, foobars sold)
+IDLE_CODES = {None: 0}
+IDLE_CODES.update({acttype: 1 + acttype for acttype in TICKS})
+IDLE_PREVIOUS = {code: previous for previous, code in IDLE_CODES.items()}
+BUSY = [
+    (acttype, remaining, sold)
+    for acttype, outcomes in TICKS.items()
+    for remaining in range(1, CHANGE_TICKS + max(ticks for ticks, _ in outcomes) + 1)
+    for sold in (range(1, 6) if acttype == SELLFOOBAR else (0,))
+]
+BUSY_CODES = {busy: len(IDLE_CODES) + index for index, busy in enumerate(BUSY)}
+
+
+def default_caps(target: int) -> Tuple[int, int, int, int]:
+    """Caps of foos, bars, foobars and money: what target - 2 robots cost, roughly"""
+    robots = target - 2
+    return (6 * robots + 4, 3, min(5, 3 * robots), 3 * robots)
+
+
+def pack(state: Tuple) -> int:
+    """Key of a state (foos, bars, foobars, money, sorted robot codes)"""
+    key = shift = 0
+    for value, bits in zip(state, RESOURCE_BITS):
+        key |= value << shift
+        shift += bits
+    for code in state[4]:
+        key |= (code + 1) << shift
+        shift += ROBOT_BITS
+    return key
+
+
+def advance(state: Tuple, caps: Tuple[int, int, int, int]) -> List[Tuple[float, Tuple]]:
+    """States one tick later, with their probability"""
+    foos, bars, foobars, money, robots = state
+    codes = []
+    assemblies = newrobots = 0
+    for code in robots:
+        if code in IDLE_PREVIOUS:
+            codes.append(code)
+            continue
+        acttype, remaining, sold = BUSY[code - len(IDLE_CODES)]
+        if remaining > 1:
+            codes.append(BUSY_CODES[(acttype, remaining - 1, sold)])
+            continue
+        codes.append(IDLE_CODES[acttype])
+        if acttype == MINEFOO:
+            foos += 1
+        elif acttype == MINEBAR:
+            bars += 1
+        elif acttype == ASSEMBLEFOOBAR:
+            assemblies += 1
+        elif acttype == SELLFOOBAR:
+            money += sold
+        else:
+            newrobots += 1
+    robots = tuple(sorted(codes + [IDLE_CODES[None]] * newrobots))
+    foos_cap, bars_cap, foobars_cap, money_cap = caps
+    # a failed assembly gives its bar back
+    return [
+        (
+            math.factorial(assemblies)
+            // (math.factorial(won) * math.factorial(assemblies - won))
+            * ASSEMBLY_SUCCESS**won
+            * (1 - ASSEMBLY_SUCCESS) ** (assemblies - won),
+            (
+                min(foos, foos_cap),
+                min(bars + assemblies - won, bars_cap),
+                min(foobars + won, foobars_cap),
+                min(money, money_cap),
+                robots,
+            ),
+        )
+        for won in range(0, assemblies + 1)
+    ]
+
+
+def assign(state: Tuple, acttype: int) -> Optional[List[Tuple[float, Tuple]]]:
+    """
+    States once acttype is programmed on an available robot, with their probability.
+
+    Return None if no robot is available or the resources are not sufficient.
+    """
+    foos, bars, foobars, money, robots = state
+    idle = [code for code in robots if code in IDLE_PREVIOUS]
+    sold = 0
+    if acttype == ASSEMBLEFOOBAR:
+        possible = foos and bars
+        foos, bars = foos - 1, bars - 1
+    elif acttype == SELLFOOBAR:
+        sold = possible = min(foobars, 5)
+        foobars -= sold
+    elif acttype == BUYROBOT:
+        possible = foos >= 6 and money >= 3
+        foos, money = foos - 6, money - 3
+    else:
+        possible = True
+    if not (possible and idle):
+        return None
+    # the robot the factory takes: same previous type, else none, else any
+    if IDLE_CODES[acttype] in idle:
+        taken = IDLE_CODES[acttype]
+    else:
+        taken = idle[0]
+    wait = 0 if taken in (IDLE_CODES[None], IDLE_CODES[acttype]) else CHANGE_TICKS
+    others = list(robots)
+    others.remove(taken)
+    states = []
+    for ticks, probability in TICKS[acttype]:
+        if wait + ticks:
+            codes = others + [BUSY_CODES[(acttype, wait + ticks, sold)]]
+        else:
+            # a robot bought without delay is available at once, as its buyer
+            codes = others + [IDLE_CODES[acttype], IDLE_CODES[None]]
+        states.append((probability, (foos, bars, foobars, money, tuple(sorted(codes)))))
+    return states
+
+
+def solve(
+    target: int,
+    caps: Optional[Tuple[int, int, int, int]] = None,
+    tolerance: float = 1e-6,
+) -> np.ndarray:
+    """
+    Compute the policy minimizing the expected ticks to reach target robots.
+
+    Return the policy table: the key, best decision and expected ticks of each state
+    reachable from the start of a game where the target is not reached, sorted by
+    key.
+    """
+    if not 2 < target <= MAX_TARGET:
+        raise ValueError(f"The target must be between 3 and {MAX_TARGET}")
+    caps = caps or default_caps(target)
+    if any(cap >= 2**bits for cap, bits in zip(caps, RESOURCE_BITS)):
+        raise ValueError(f"The caps must be below {[2**b for b in RESOURCE_BITS]}")
+    if any(cap < needed for cap, needed in zip(caps, MIN_CAPS)):
+        # the target could not be reached: the values would grow forever
+        raise ValueError(f"The caps must be at least {list(MIN_CAPS)}, to buy robots")
+    start = (0, 0, 0, 0, (IDLE_CODES[None],) * 2)
+    indexes = {start: 0}
+    states = deque([start])
+    # one row per decision of a state, in state order: decision, cost, successors
+    row_states, row_actions, row_costs, row_sizes = [], [], [], []
+    successors, probabilities = [], []
+    index = 0
+    while states:
+        state = states.popleft()
+        if len(state[4]) >= target:
+            choices = [(WAIT, 0.0, [(1.0, state)])]
+        else:
+            choices = [
+                (acttype, 0.0, outcomes)
+                for acttype in TICKS
+                for outcomes in (assign(state, acttype),)
+                if outcomes is not None
+            ]
+            choices.append((WAIT, 1.0, advance(state, caps)))
+        for action, cost, outcomes in choices:
+            row_states.append(index)
+            row_actions.append(action)
+            row_costs.append(cost)
+            row_sizes.append(len(outcomes))
+            for probability, successor in outcomes:
+                if successor not in indexes:
+                    indexes[successor] = len(indexes)
+                    states.append(successor)
+                successors.append(indexes[successor])
+                probabilities.append(probability)
+        index += 1
+    row_states = np.array(row_states, dtype=np.int32)
+    row_costs = np.array(row_costs)
+    successors = np.array(successors, dtype=np.int32)
+    probabilities = np.array(probabilities)
+    row_starts = np.concatenate(([0], np.cumsum(row_sizes)[:-1]))
+    state_starts = np.flatnonzero(np.diff(row_states, prepend=-1))
+    values = np.zeros(len(indexes))
+    while True:
+        costs = row_costs + np.add.reduceat(
+            probabilities * values[successors], row_starts
+        )
+        updated = np.minimum.reduceat(costs, state_starts)
+        delta = np.max(np.abs(updated - values))
+        values = updated
+        if delta < tolerance:
+            break
+    # first best decision of each state: activities before waiting
+    best = np.flatnonzero(costs <= values[row_states] + tolerance)
+    best = best[np.unique(row_states[best], return_index=True)[1]]
+    keys = np.fromiter((pack(state) for state in indexes), np.uint64, len(indexes))
+    open_states = np.array([len(state[4]) < target for state in indexes])
+    table = np.zeros(int(open_states.sum()), dtype=TABLE_DTYPE)
+    table["key"] = keys[open_states]
+    table["action"] = np.array(row_actions, dtype=np.int8)[best][open_states]
+    table["ticks"] = values[open_states]
+    table.sort(order="key")
+    return table
+
+
+def save(table: np.ndarray, path: str) -> None:
+    np.save(path, table)
+
+
+def load(path: str) -> np.ndarray:
+    """Memory-map the policy table saved in path"""
+    table = np.load(path, mmap_mode="r")
+    if table.dtype != TABLE_DTYPE:
+        raise ValueError(f"{path} is not a policy table")
+    return table
+
+
+def abstract_state(situation: Dict, tick: int) -> Optional[Tuple]:
+    """
+    Abstract state of a factory situation (see Factory.to_dict) at tick.
+
+    Return None if the situation is outside the abstract states.
+    """
+    resources = situation["resources"]
+    codes = []
+    for bot in situation["robots"]:
+        current = bot["current"]
+        if bot["status"] == READY or current is None:
+            codes.append(IDLE_CODES[bot["previous"]])
+            continue
+        acttype = current["type"]
+        remaining = bot["start_tick"] + math.ceil(current["duration"]) - tick
+        busy = (acttype, remaining, current.get("nbtosell", 0))
+        if busy not in BUSY_CODES:
+            return None
+        codes.append(BUSY_CODES[busy])
+    state = (
+        resources["foos"],
+        resources["bars"],
+        resources["foobars"],
+        resources["money"],
+        tuple(sorted(codes)),
+    )
+    if len(codes) > MAX_ROBOTS or any(
+        value >= 2**bits for value, bits in zip(state, RESOURCE_BITS)
+    ):
+        return None
+    return state
+
+
+class OptimalPilot(FactoryPilot):
+    """
+    This autopilot plays the decisions of a policy table computed by solve().
+
+    The table is memory-mapped: the decisions are read from the file as they are
+    looked up. Outside the table (more robots than its target, more resources than
+    its caps), the fallback pilot decides.
+    """
+
+    def __init__(self, table, fallback: Optional[SmartAutopilot] = None) -> None:
+        super().__init__()
+        if isinstance(table, str):
+            table = load(table)
+        self.table = table
+        self._keys = table["key"]
+        self._actions = table["action"]
+        self.fallback = fallback or SmartAutopilot()
+
+    def decision(self, state: Tuple) -> Optional[int]:
+        """Decision of the table in state, None if the state is not in the table"""
+        key = np.uint64(pack(state))
+        index = int(np.searchsorted(self._keys, key))
+        if index < len(self._keys) and self._keys[index] == key:
+            return int(self._actions[index])
+        return None
+
+    def get_activities(self, situation: Dict) -> List:
+        robots = situation["situation"]["robots"]
+        nbready = self._get_nb_possible_actions(robots)
+        res: ResourceLedger = self._get_resources(situation)
+        state = abstract_state(situation["situation"], situation["tick"])
+        activities = []
+        while nbready:
+            decision = None if state is None else self.decision(state)
+            if decision is None:
+                return activities + self.fallback.choose(res, nbready)
+            if decision == WAIT:
+                break
+            activities.append(self._reserve(res, decision))
+            nbready -= 1
+            if decision == MINEBAR:
+                # the next decisions depend on its duration, drawn once programmed:
+                # they are taken in the next round, at the same tick
+                break
+            state = assign(state, decision)[0][1]
+        return activities
+
+
+@click.command()
+@click.option(
+    "--target", default=3, help="Number of robots to reach. Default 3.", type=int
+)
+@click.option(
+    "--caps",
+    default=None,
+    help="Caps of foos, bars, foobars and money, comma separated. "
+    "Default: what target - 2 robots cost.",
+)
+@click.option(
+    "--output",
+    required=True,
+    type=click.Path(dir_okay=False, writable=True),
+    help="File of the policy table (.npy).",
+)
+def solve_command(target: int, caps: str, output: str):
+    start = perf_counter()
+    if caps:
+        caps = tuple(int(cap) for cap in caps.split(","))
+    table = solve(target, caps)
+    save(table, output)
+    elapsed = perf_counter() - start
+    start_key = pack((0, 0, 0, 0, (IDLE_CODES[None],) * 2))
+    ticks = table["ticks"][np.searchsorted(table["key"], start_key)]
+    click.secho(f"States: {len(table)}  Solved in {elapsed:.1f}s", fg="blue")
+    click.secho(f"Expected ticks to reach {target} robots: {ticks:.2f}", fg="green")
+
+
+if __name__ == "__main__":
+    solve_command()
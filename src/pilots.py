@@ -0,0 +1,398 @@
+"""Pilots: choose the activities the factory robots should do next"""
+
+from typing import Dict, Iterable, List, Optional
+import click
+import numpy as np
+
+from model import lockstep
+from model.changes import ChangeStream, FactoryDelta
+from model.decisiontable import DEFAULT_BOUNDS, DecisionTable
+from model.resources import COSTS, ResourceLedger, cost
+
+from model.constants import (
+    ACTIVITY_TYPES,
+    READY,
+    RES_KEY_BARS,
+    RES_KEY_FOOS,
+    RES_KEY_FOOBARS,
+    RES_KEY_MONEY,
+    MINEFOO,
+    MINEBAR,
+    ASSEMBLEFOOBAR,
+    SELLFOOBAR,
+    BUYROBOT,
+)
+
+
+class FactoryPilot:
+    """Base class for pilot: choose activities to do depending on the situation."""
+
+    @staticmethod
+    def _get_nb_possible_actions(robots: Iterable[Dict]):
+        if not robots:
+            return 0
+        return len([bot for bot in robots if bot["status"] == READY])
+
+    @staticmethod
+    def _get_type_possible_actions(resources):
+        if not isinstance(resources, ResourceLedger):
+            resources = ResourceLedger.from_dict(resources)
+        return resources.feasible_types()
+
+    @staticmethod
+    def _get_resources(situation: Dict) -> ResourceLedger:
+        """Return a scratch ledger of the resources of the situation"""
+        return ResourceLedger.from_dict(situation.get("situation").get("resources"))
+
+    @staticmethod
+    def _reserve(res: ResourceLedger, acttype: int, sell_max: int = 5):
+        """
+        Take the resources of an activity for the next choices of the same round
+
+        Return the activity descriptor to program. Foobars are sold sell_max at most.
+        """
+        if acttype == SELLFOOBAR:
+            nbtosell = min(res[RES_KEY_FOOBARS], sell_max)
+            res.reserve(cost(foobars=nbtosell))
+            return (SELLFOOBAR, {"nbtosell": nbtosell})
+        res.reserve(COSTS[acttype])
+        return acttype
+
+    def get_activities(self, situation: Dict) -> List:
+        raise NotImplementedError()
+
+
+class InteractiveFactoryPilot(FactoryPilot):
+
+    display_labels = {
+        MINEFOO: "Mine (F)oo",
+        MINEBAR: "Mine (B)ar",
+        ASSEMBLEFOOBAR: "(A)ssemble foobar",
+        SELLFOOBAR: "(S)ell foobars",
+        BUYROBOT: "Buy (R)obot",
+    }
+
+    keys = {
+        "F": MINEFOO,
+        "B": MINEBAR,
+        "A": ASSEMBLEFOOBAR,
+        "S": SELLFOOBAR,
+        "R": BUYROBOT,
+    }
+
+    def get_activities(self, situation: Dict) -> List:
+        res = self._get_resources(situation)
+        activities = []
+        for _ in range(
+            0, self._get_nb_possible_actions(situation.get("situation").get("robots"))
+        ):
+            possible_types = self._get_type_possible_actions(res)
+            possible_actions = [self.display_labels.get(act) for act in possible_types]
+            possible_actions.extend(["Do (N)othing"])
+            while True:
+                key = click.prompt(", ".join(possible_actions), type=str).upper()
+                if key == "N":
+                    # voluntary no action
+                    break
+                if self.keys.get(key) in possible_types:
+                    activities.append(self._reserve(res, self.keys[key]))
+                    break
+                click.secho("Invalid key pressed, try again", fg="white", bg="red")
+        return activities
+
+
+class DumbAutopilot(FactoryPilot):
+
+    """
+    This autopilot follows a straightforward strategy:
+
+    - 28 new robots to buy
+    - means 6*28 = 168 foos to provide
+    - and 3*28 = 84 money units to provide
+    - means 84 foobars to sell
+    - means 84 foobars to assemble but that will require more attempts
+    - means 84 more foos and 84 bars to provide
+
+    The strategy will be:
+    - assemble 84 foobars
+    - mine 168 foos
+    - buy robots
+
+    Obviously this is not optimized at all because only two robots are doing all the work.
+
+    The goals can be changed: foobar_goal foobars (default 3 per robot to buy),
+    foo_goal foos (default 6 per robot to buy), foobars sold sell_max at most.
+    """
+
+    def __init__(
+        self,
+        target,
+        foobar_goal: Optional[int] = None,
+        foo_goal: Optional[int] = None,
+        sell_max: int = 5,
+    ) -> None:
+        super().__init__()
+        self.target = target
+        self.foobar_goal = 3 * (target - 2) if foobar_goal is None else foobar_goal
+        self.foo_goal = 6 * (target - 2) if foo_goal is None else foo_goal
+        self.sell_max = sell_max
+
+    def get_activities(self, situation: Dict) -> List:
+        # nbpa will always be 2 at the beginning because this strategy is dumb:
+        nbpa = self._get_nb_possible_actions(situation.get("situation").get("robots"))
+        nbrobots = len(situation.get("situation").get("robots"))
+        # get a snapshot of the current resources
+        return self.choose(self._get_resources(situation), nbpa, nbrobots)
+
+    def choose(self, res: ResourceLedger, nbpa: int, nbrobots: int) -> List:
+        """
+        Choose the activities of nbpa robots of a fleet of nbrobots with the
+        resources res
+
+        The resources of the chosen activities are reserved in res.
+        """
+        # when nbrobots is greater than 2, it means we are buying robots with all
+        # our resources, and do nothing else than that.
+        # hold chosen activities
+        activities = []
+        for _ in range(0, nbpa):
+            nbfoobars = res.get(RES_KEY_FOOBARS)
+            nbfoos = res.get(RES_KEY_FOOS)
+            nbmoney = res.get(RES_KEY_MONEY)
+            if nbrobots == 2:
+                # Do foobars as long as we haven't reach 84
+                if nbfoobars + nbmoney < self.foobar_goal:
+                    nbmissing = self.foobar_goal - nbmoney - nbfoobars
+                    if res.get(RES_KEY_FOOS) < nbmissing:
+                        activities.append(MINEFOO)
+                    elif res.get(RES_KEY_BARS) < nbmissing:
+                        activities.append(MINEBAR)
+                    else:
+                        # enough resources
+                        # adjust resources for next activity choice of the same round
+                        # assuming foobar will succeed
+                        activities.append(self._reserve(res, ASSEMBLEFOOBAR))
+                # Do foos as long as we haven't reach 168
+                elif nbfoos < self.foo_goal:
+                    activities.append(MINEFOO)
+                # Sell foobars
+                elif nbmoney < self.foobar_goal:
+                    # adjust resources for next activity choice of the same round
+                    activities.append(self._reserve(res, SELLFOOBAR, self.sell_max))
+                # Buy robot
+                elif nbmoney >= 3 and nbfoos >= 6:
+                    activities.append(self._reserve(res, BUYROBOT))
+            elif nbmoney >= 3 and nbfoos >= 6:
+                activities.append(self._reserve(res, BUYROBOT))
+        return activities
+
+    def choose_batch(self, resources: np.ndarray, nbrobots: np.ndarray) -> np.ndarray:
+        """Vectorized decision for one robot of many factories (see model.lockstep)"""
+        foos, bars, foobars, money = resources.T
+        missing = self.foobar_goal
+        nbmissing = missing - money - foobars
+        beginning = nbrobots == 2
+        making_foobars = beginning & (foobars + money < missing)
+        return np.select(
+            [
+                making_foobars & (foos < nbmissing),
+                making_foobars & (bars < nbmissing),
+                making_foobars,
+                beginning & (foos < self.foo_goal),
+                beginning & (money < missing),
+                (money >= 3) & (foos >= 6),
+            ],
+            [
+                lockstep.TYPE_CODES[MINEFOO],
+                lockstep.TYPE_CODES[MINEBAR],
+                lockstep.TYPE_CODES[ASSEMBLEFOOBAR],
+                lockstep.TYPE_CODES[MINEFOO],
+                lockstep.TYPE_CODES[SELLFOOBAR],
+                lockstep.TYPE_CODES[BUYROBOT],
+            ],
+            lockstep.NO_ACTIVITY,
+        )
+
+
+class SmartAutopilot(FactoryPilot):
+    """
+    This autopilot follows a smarter strategy: buy robots as fast as possible :
+
+    - if you can buy a robot, buy it
+    - if not, sell a foobar if you can
+    - if not :
+      * if you have less than 7 foos, mine one
+      * if you have more than 7 foos:
+        - if you have less than 1 bar, mine one
+        - else assemble one foobar
+
+    The thresholds can be changed: foobars are sold from sell_from foobars, sell_max
+    at most, foos are mined under foo_stock foos and bars under bar_stock bars.
+    """
+
+    def __init__(
+        self,
+        foo_stock: int = 7,
+        bar_stock: int = 1,
+        sell_from: int = 1,
+        sell_max: int = 5,
+    ) -> None:
+        super().__init__()
+        self.foo_stock = foo_stock
+        self.bar_stock = bar_stock
+        self.sell_from = sell_from
+        self.sell_max = sell_max
+
+    def get_activities(self, situation: Dict) -> List:
+        nbpa = self._get_nb_possible_actions(situation.get("situation").get("robots"))
+        return self.choose(self._get_resources(situation), nbpa)
+
+    def choose(
+        self, res: ResourceLedger, nbready: int, nbrobots: Optional[int] = None
+    ) -> List:
+        """
+        Choose the activities of nbready robots with the resources res
+
+        The resources of the chosen activities are reserved in res. The strategy
+        does not depend on the number of robots of the fleet, nbrobots.
+        """
+        # hold chosen activities
+        activities = []
+        for _ in range(0, nbready):
+            nbfoobars = res.get(RES_KEY_FOOBARS)
+            nbbars = res.get(RES_KEY_BARS)
+            nbfoos = res.get(RES_KEY_FOOS)
+            nbmoney = res.get(RES_KEY_MONEY)
+            if nbmoney >= 3 and nbfoos >= 6:
+                activities.append(self._reserve(res, BUYROBOT))
+            elif nbfoobars >= self.sell_from:
+                activities.append(self._reserve(res, SELLFOOBAR, self.sell_max))
+            elif nbfoos < self.foo_stock:
+                activities.append(MINEFOO)
+            elif nbbars < self.bar_stock:
+                activities.append(MINEBAR)
+            elif nbfoos >= 1 and nbbars >= 1:
+                activities.append(self._reserve(res, ASSEMBLEFOOBAR))
+        return activities
+
+    def choose_batch(self, resources: np.ndarray, nbrobots: np.ndarray) -> np.ndarray:
+        """
+        Vectorized decision for one robot of many factories (see model.lockstep)
+
+        The foobars sold at once are capped by the engine: see sell_max of
+        lockstep.play.
+        """
+        foos, bars, foobars, money = resources.T
+        return np.select(
+            [
+                (money >= 3) & (foos >= 6),
+                foobars >= self.sell_from,
+                foos < self.foo_stock,
+                bars < self.bar_stock,
+                (foos >= 1) & (bars >= 1),
+            ],
+            [
+                lockstep.TYPE_CODES[BUYROBOT],
+                lockstep.TYPE_CODES[SELLFOOBAR],
+                lockstep.TYPE_CODES[MINEFOO],
+                lockstep.TYPE_CODES[MINEBAR],
+                lockstep.TYPE_CODES[ASSEMBLEFOOBAR],
+            ],
+            lockstep.NO_ACTIVITY,
+        )
+
+
+# resources consumed by each activity code, as Python ints
+_CODE_COSTS = lockstep.COSTS.tolist()
+
+
+class CompiledPilot(FactoryPilot):
+    """
+    A rule-based autopilot compiled into a decision table.
+
+    The pilot must decide through a lockstep policy, choose_batch; its decisions are
+    computed once over the domain of bounds (see model.decisiontable), then each
+    decision is a lookup: no ledger, no rules walked. A round starting outside the
+    domain is left to the pilot. choose_batch is the table, for the lockstep engine.
+    The foobars are sold sell_max at most at once, like the pilot does.
+    """
+
+    def __init__(self, pilot: FactoryPilot, bounds=DEFAULT_BOUNDS) -> None:
+        super().__init__()
+        self.pilot = pilot
+        self.sell_max = getattr(pilot, "sell_max", lockstep.MAX_SOLD)
+        self.choose_batch = DecisionTable.compile(pilot.choose_batch, bounds)
+
+    def get_activities(self, situation: Dict) -> List:
+        robots = situation["situation"]["robots"]
+        res = situation["situation"]["resources"]
+        foos, bars = res[RES_KEY_FOOS], res[RES_KEY_BARS]
+        foobars, money = res[RES_KEY_FOOBARS], res[RES_KEY_MONEY]
+        table = self.choose_batch
+        if not table.covers(foos, bars, foobars, money, len(robots)):
+            # the choices of a round only spend: the round stays inside once in
+            return self.pilot.get_activities(situation)
+        decide = table.decide
+        activities = []
+        for _ in range(0, self._get_nb_possible_actions(robots)):
+            code = decide(foos, bars, foobars, money, len(robots))
+            if code == lockstep.NO_ACTIVITY:
+                # the resources are the same for the next robots: nothing either
+                break
+            acttype = ACTIVITY_TYPES[code]
+            if acttype == SELLFOOBAR:
+                nbtosell = min(foobars, self.sell_max)
+                foobars -= nbtosell
+                activities.append((SELLFOOBAR, {"nbtosell": nbtosell}))
+                continue
+            spent_foos, spent_bars, _, spent_money = _CODE_COSTS[code]
+            foos -= spent_foos
+            bars -= spent_bars
+            money -= spent_money
+            activities.append(acttype)
+        return activities
+
+
+class StreamPilot(FactoryPilot):
+    """
+    An autopilot fed with the changes of the factory instead of its whole situation.
+
+    The pilot keeps its own counts of the resources, of the robots and of the
+    available ones, updated with the changes read from a change stream of the
+    factory at each round (see model.changes): a round costs what changed since the
+    previous one, not the size of the fleet. The decisions are the ones of the
+    wrapped pilot, which must choose from the counts, like SmartAutopilot.choose:
+    the situation given to get_activities is not read.
+    """
+
+    def __init__(self, pilot: FactoryPilot, stream: ChangeStream) -> None:
+        super().__init__()
+        self.pilot = pilot
+        self.stream = stream
+        self.resources = ResourceLedger()
+        self.nbrobots = 0
+        self.nbready = 0
+        # status of each robot
+        self._statuses = []
+
+    def update(self, delta: FactoryDelta) -> None:
+        """Apply the changes of the factory to the counts"""
+        if delta.reset:
+            self._statuses = []
+            self.nbready = 0
+        statuses = self._statuses
+        for index, status, _, _ in delta.robots:
+            if index < len(statuses):
+                self.nbready -= statuses[index] == READY
+                statuses[index] = status
+            else:
+                statuses.append(status)
+            self.nbready += status == READY
+        slots = self.resources.slots
+        for slot, change in enumerate(delta.resources):
+            slots[slot] += change
+        self.nbrobots = delta.nbrobots
+
+    def get_activities(self, situation: Optional[Dict] = None) -> List:
+        self.update(self.stream.read())
+        return self.pilot.choose(self.resources.copy(), self.nbready, self.nbrobots)
@@ -0,0 +1,172 @@
+"""
+Optional instrumentation of the game loop.
+
+The runtime and the CLI time their phases through a profiler. The default one,
+NullProfiler, does nothing and costs one method call per phase; PhaseProfiler
+accumulates the time of each phase and a latency histogram per round.
+StackSampler samples the Python stack for flamegraphs.
+"""
+
+import math
+import os
+import signal
+from collections import Counter, defaultdict
+from time import perf_counter
+from typing import Callable, Dict, List
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+class NullProfiler:
+    """Profiler doing nothing, the default"""
+
+    enabled = False
+
+    def phase(self, name: str) -> _NoPhase:
+        return _NO_PHASE
+
+    def end_round(self) -> None:
+        pass
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: "PhaseProfiler", name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = self.profiler.clock()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, self.profiler.clock() - self.start)
+        return False
+
+
+def latency_bucket(seconds: float) -> int:
+    """Upper bound, in microseconds, of the power of 2 bucket of a latency"""
+    return 2 ** max(0, math.ceil(math.log2(max(seconds * 1e6, 1))))
+
+
+class PhaseProfiler:
+    """
+    Accumulate the time spent in each phase of the game loop.
+
+    A round is one decision of the pilot and its execution: end_round() records
+    the time of each phase during the round in a histogram of the phase, and the
+    whole round in the "round" histogram. The times are read from clock, in
+    seconds.
+    """
+
+    enabled = True
+
+    def __init__(self, clock: Callable[[], float] = perf_counter) -> None:
+        self.clock = clock
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        # phase -> latency bucket (us) -> number of rounds
+        self.histograms = defaultdict(Counter)
+        self.rounds = 0
+        self._current = defaultdict(float)
+        self._round_start = clock()
+
+    def phase(self, name: str) -> _Phase:
+        """Context manager timing a phase"""
+        return _Phase(self, name)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.totals[name] += seconds
+        self.calls[name] += 1
+        self._current[name] += seconds
+
+    def end_round(self) -> None:
+        now = self.clock()
+        self._current["round"] = now - self._round_start
+        for name, seconds in self._current.items():
+            self.histograms[name][latency_bucket(seconds)] += 1
+        self._current.clear()
+        self._round_start = now
+        self.rounds += 1
+
+    def report(self) -> Dict:
+        return {
+            "rounds": self.rounds,
+            "phases": {
+                name: {"calls": self.calls[name], "seconds": total}
+                for name, total in sorted(
+                    self.totals.items(), key=lambda item: -item[1]
+                )
+            },
+            "histograms": {
+                name: dict(sorted(counts.items()))
+                for name, counts in self.histograms.items()
+            },
+        }
+
+    def format_report(self) -> List[str]:
+        """Human readable report lines"""
+        report = self.report()
+        measured = sum(phase["seconds"] for phase in report["phases"].values())
+        lines = [
+            f"Rounds: {report['rounds']}",
+            f"{'phase':<14}{'calls':>10}{'total s':>12}{'mean us':>12}{'share':>8}",
+        ]
+        for name, phase in report["phases"].items():
+            lines.append(
+                f"{name:<14}{phase['calls']:>10}{phase['seconds']:>12.3f}"
+                f"{1e6 * phase['seconds'] / phase['calls']:>12.1f}"
+                f"{100 * phase['seconds'] / (measured or 1):>7.1f}%"
+            )
+        lines.append("Latency per round (us upper bound: rounds)")
+        for name, counts in report["histograms"].items():
+            buckets = "  ".join(f"{bound}: {count}" for bound, count in counts.items())
+            lines.append(f"{name:<14}{buckets}")
+        return lines
+
+
+class StackSampler:
+    """
+    Sample the Python stack on SIGPROF (every interval seconds of CPU time).
+
+    The samples are dumped in the collapsed format of flamegraph.pl / speedscope:
+    one line per stack, frames separated by ';', followed by the number of samples.
+    Unix only.
+    """
+
+    def __init__(self, interval: float = 0.001) -> None:
+        self.interval = interval
+        self.stacks = Counter()
+
+    def start(self) -> None:
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self) -> None:
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def _sample(self, signum, frame) -> None:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, path: str) -> None:
+        with open(path, "w") as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f"{stack} {count}\n")
@@ -0,0 +1,153 @@
+"""
+Structured log of a run: JSON lines written by a background thread.
+
+The game loop only queues log records holding a reference to the situation
+snapshot of the round; the JSON line, with the changes since the previous logged
+round, is built and written by a QueueListener thread.
+
+A round line holds "round", "tick", "nbrobots", then only what changed:
+"resources" by key and "robots" by index, each robot written as
+[status, current activity type, current activity start tick, previous type]
+(codes of model.constants, null when none).
+"""
+
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional
+
+LEVELS = {
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "off": logging.CRITICAL + 1,
+}
+
+
+class RecordQueueHandler(QueueHandler):
+    """Queue the records untouched: they are formatted by the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Format records as compact JSON lines.
+
+    The records of a round carry the situation snapshot in record.situation: only
+    the resources and the robots which changed since the previous round formatted
+    are written, the first round is written in full.
+    CAUTION : stateful, one formatter per log file.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._resources = {}
+        self._robots = []
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = {"time": round(record.created, 6), "level": record.levelname}
+        situation = getattr(record, "situation", None)
+        if situation is None:
+            line["msg"] = record.getMessage()
+        else:
+            line["round"] = record.round
+            line["tick"] = record.tick
+            line.update(self._delta(situation))
+        return json.dumps(line, separators=(",", ":"))
+
+    @staticmethod
+    def _robot_line(bot: Dict) -> List:
+        current = bot["current"]
+        if current is None:
+            return [bot["status"], None, None, bot["previous"]]
+        return [bot["status"], current["type"], current["start_tick"], bot["previous"]]
+
+    def _delta(self, situation: Dict) -> Dict:
+        resources = situation["resources"]
+        robots = [self._robot_line(bot) for bot in situation["robots"]]
+        previous = self._robots
+        delta = {"nbrobots": len(robots)}
+        changed = {
+            key: qty for key, qty in resources.items() if self._resources.get(key) != qty
+        }
+        if changed:
+            delta["resources"] = changed
+        changed = {
+            index: bot
+            for index, bot in enumerate(robots)
+            if index >= len(previous) or previous[index] != bot
+        }
+        if changed:
+            delta["robots"] = changed
+        self._resources, self._robots = resources, robots
+        return delta
+
+
+class RunLog:
+    """
+    Sampled, level-gated log of the rounds of a run.
+
+    Only every Nth round is logged, and nothing is built for a round which is not
+    logged.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        every: int = 1,
+        listener: Optional[QueueListener] = None,
+    ) -> None:
+        self.logger = logger
+        self.every = every
+        self.rounds = 0
+        self._listener = listener
+
+    @classmethod
+    def open(
+        cls, logger: logging.Logger, path: str, level: str = "info", every: int = 1
+    ) -> "RunLog":
+        """
+        Log to the JSON lines file path through a background thread.
+
+        With level "off", no file is created.
+        """
+        logger.setLevel(LEVELS[level])
+        if level == "off":
+            return cls(logger, every)
+        file_handler = logging.FileHandler(path)
+        file_handler.setFormatter(JsonLinesFormatter())
+        records = queue.Queue()
+        logger.addHandler(RecordQueueHandler(records))
+        listener = QueueListener(records, file_handler)
+        listener.start()
+        return cls(logger, every, listener)
+
+    def round(self, datadict: Dict, force: bool = False) -> None:
+        """Log the situation of a round, if sampled (or forced) and INFO enabled"""
+        self.rounds += 1
+        if (force or self.rounds % self.every == 0) and self.logger.isEnabledFor(
+            logging.INFO
+        ):
+            self.logger.info(
+                "round",
+                extra={
+                    "round": self.rounds,
+                    "tick": datadict["tick"],
+                    "situation": datadict["situation"],
+                },
+            )
+
+    def close(self) -> None:
+        """Write the queued records and release the file"""
+        if self._listener is None:
+            return
+        self._listener.stop()
+        for handler in list(self.logger.handlers):
+            if isinstance(handler, RecordQueueHandler):
+                self.logger.removeHandler(handler)
+        for handler in self._listener.handlers:
+            handler.close()
+        self._listener = None
@@ -1,81 +1,253 @@
+import asyncio
+import inspect
 from time import sleep
-from typing import Dict
+from typing import Callable, Dict, Iterator, Optional
 
 from model import factory
 from model.activities import get_activty
-from model.constants import READY
+from model.changes import ChangeStream
+from model.randomness import OutcomeStream, Seed
+from profiling import NullProfiler
+
+
+def build_activities(outcomes, *activitydescriptors):
+    """Build the activities described by the pilot, drawing from outcomes"""
+    activities = list()
+    for act in activitydescriptors:
+        if type(act) is tuple:
+            acttype, actparams = act
+            activities.append(get_activty(acttype, outcomes=outcomes, **actparams))
+        else:
+            activities.append(get_activty(act, outcomes=outcomes))
+    return activities
 
 
 class FactoryRunner:
-    def __init__(self) -> None:
-        self.factory = factory.Factory()
+    def __init__(self, seed: Seed = None) -> None:
+        self.factory = factory.Factory(seed=seed)
         self.tick = 0
+        self._snapshot = None
+        self._snapshot_key = None
 
-    def expose(self):
-        self.factory.run(self.tick)
-        return self.factory.to_dict()
+    def expose(self) -> Dict:
+        """
+        Return a read-only snapshot of the factory situation, without running it.
+
+        The snapshot is shared by all the callers until the tick or the factory
+        situation changes: do not modify it.
+        """
+        key = (self.tick, self.factory.version)
+        if key != self._snapshot_key:
+            self._snapshot = self.factory.to_dict()
+            self._snapshot_key = key
+        return self._snapshot
+
+    def count_ready(self) -> int:
+        return self.factory.count_ready()
+
+    def count_robots(self) -> int:
+        return len(self.factory.robots)
+
+    def change_stream(self) -> ChangeStream:
+        return self.factory.change_stream()
+
+    def seed(self, seed: Seed) -> None:
+        """Restart the random outcomes of the factory from seed"""
+        self.factory.outcomes = OutcomeStream(seed)
 
     def load(self, *acts):
-        activities = self._build_activities(*acts)
+        """Program the activities described by acts, return the activities"""
+        activities = build_activities(self.factory.outcomes, *acts)
         self.factory.set_activities(self.tick, *activities)
+        return activities
 
     def run(self):
         self.factory.run(self.tick)
 
-    def next(self):
-        self.tick += 1
-
-    @staticmethod
-    def _build_activities(*activitydescriptors):
-        activities = list()
-        for act in activitydescriptors:
-            if type(act) is tuple:
-                acttype, actparams = act
-                activities.append(get_activty(acttype, **actparams))
-            else:
-                activities.append(get_activty(act))
-        return activities
+    def next(self, nbticks: int = 1):
+        self.tick += nbticks
+
+    def next_event_tick(self):
+        return self.factory.next_event_tick()
 
 
 class Runtime:
-    def __init__(self, tick_delay=1) -> None:
+    def __init__(self, tick_delay=1, event_driven=True, seed: Seed = None) -> None:
         """
         Runtime constructor
 
         Args:
         - tick_delay: duration of a tick, default to 1 second.
+        - event_driven: when True, jump directly to the next tick at which a robot
+          starts or completes an activity instead of stepping tick by tick.
+          Default True.
+        - seed: seed of the random outcomes of the activities, for reproducible runs.
+          Default None: not reproducible.
         """
-        self.runner = FactoryRunner()
+        self.runner = FactoryRunner(seed=seed)
         self.tick_delay = tick_delay
+        self.event_driven = event_driven
+        self.profiler = NullProfiler()
+        self.recorder = None
 
     def set_tick_delay(self, delay: int) -> None:
         self.tick_delay = delay
 
+    def set_event_driven(self, event_driven: bool) -> None:
+        self.event_driven = event_driven
+
+    def set_seed(self, seed: Seed) -> None:
+        self.runner.seed(seed)
+
+    def set_recorder(self, recorder) -> None:
+        """Record the programmed rounds with recorder (see gametrace)"""
+        self.recorder = recorder
+
+    def set_profiler(self, profiler) -> None:
+        """Time the phases of the runtime with profiler (see profiling)"""
+        self.profiler = profiler
+
+    def _ticks_to_next_event(self, force_one_next=False) -> int:
+        """Number of ticks to advance before something can happen in the factory"""
+        if force_one_next or not self.event_driven:
+            return 1
+        next_tick = self.runner.next_event_tick()
+        if next_tick is None:
+            return 1
+        return max(1, next_tick - self.runner.tick)
+
     def _count_available_robots(self):
-        current = self.runner.expose()
-        # there always are robots (at least 2)
-        return len([r for r in current.get("robots") if r.get("status") == READY])
+        return self.runner.count_ready()
 
-    def run(self, force_one_next=False) -> Dict:
+    def _steps(self, force_one_next=False) -> Iterator[int]:
         """
-        Run the loaded activities until at least one robot is available
-        Args:
-        - force_one_next : When True, at least one tick will advance, even if some robots are available. Default False.
+        Run the loaded activities until at least one robot is available, yielding
+        the number of ticks to wait before each advance of the tick
         """
         do_next_anyway = force_one_next
         while True:  # run until robots are available
-            self.runner.run()
+            with self.profiler.phase("factory_run"):
+                self.runner.run()
             if self._count_available_robots() > 0 and not do_next_anyway:
-                break
-            if self.tick_delay > 0:  # else : no sleep, speed-of-light factory
-                sleep(self.tick_delay)
-            self.runner.next()
+                return
+            nbticks = self._ticks_to_next_event(do_next_anyway)
+            yield nbticks
+            self.runner.next(nbticks)
             do_next_anyway = False
-        return self.runner.expose()
+
+    def run(self, force_one_next=False, situation=True) -> Optional[Dict]:
+        """
+        Run the loaded activities until at least one robot is available
+        Args:
+        - force_one_next : When True, at least one tick will advance, even if some robots are available. Default False.
+        - situation : When False, return None instead of the situation, which is not built. Default True.
+        """
+        profiler = self.profiler
+        for nbticks in self._steps(force_one_next):
+            if self.tick_delay > 0:  # else : no sleep, speed-of-light factory
+                with profiler.phase("delay"):
+                    sleep(self.tick_delay * nbticks)
+        if not situation:
+            return None
+        with profiler.phase("snapshot"):
+            return self.runner.expose()
 
     def program(self, *activycodes) -> None:
         """Program robots with these activities to do next"""
-        self.runner.load(*activycodes)
+        with self.profiler.phase("program"):
+            if self.recorder is None:
+                self.runner.load(*activycodes)
+                return
+            self.recorder.before_round(self.runner.tick, self.runner.factory)
+            activities = self.runner.load(*activycodes)
+            self.recorder.record_round(self.runner.tick, activities)
 
     def display(self) -> Dict:
-        return {"tick": self.runner.tick, "situation": self.runner.expose()}
+        with self.profiler.phase("snapshot"):
+            return {"tick": self.runner.tick, "situation": self.runner.expose()}
+
+    def count_robots(self) -> int:
+        return self.runner.count_robots()
+
+    def change_stream(self) -> ChangeStream:
+        """
+        Open a stream of the changes of the factory, an alternative to the whole
+        situation of display() (see model.changes)
+        """
+        return self.runner.change_stream()
+
+
+class AsyncRuntime(Runtime):
+    """
+    Runtime for an asyncio event loop: run() and program() are coroutines, and the
+    delay between ticks is awaited instead of slept, so that many factories run
+    concurrently in one thread.
+
+    Each runtime keeps its own clock: tick n is due tick_delay * n seconds after
+    the first run, whatever the time spent by the pilot or by the other factories
+    of the loop.
+    """
+
+    def __init__(self, tick_delay=1, event_driven=True, seed: Seed = None) -> None:
+        super().__init__(tick_delay=tick_delay, event_driven=event_driven, seed=seed)
+        # loop time of tick 0, set by the first run
+        self._origin: Optional[float] = None
+
+    def set_tick_delay(self, delay: int) -> None:
+        super().set_tick_delay(delay)
+        self._origin = None
+
+    async def run(self, force_one_next=False, situation=True) -> Optional[Dict]:
+        """
+        Run the loaded activities until at least one robot is available, awaiting
+        the ticks
+        Args:
+        - force_one_next : When True, at least one tick will advance, even if some robots are available. Default False.
+        - situation : When False, return None instead of the situation, which is not built. Default True.
+        """
+        profiler = self.profiler
+        loop = asyncio.get_event_loop()
+        if self._origin is None:
+            self._origin = loop.time() - self.tick_delay * self.runner.tick
+        for nbticks in self._steps(force_one_next):
+            if self.tick_delay > 0:  # else : no sleep, speed-of-light factory
+                due = self._origin + self.tick_delay * (self.runner.tick + nbticks)
+                with profiler.phase("delay"):
+                    await asyncio.sleep(max(0, due - loop.time()))
+        if self.tick_delay <= 0:
+            # let the other factories of the loop run between two rounds
+            await asyncio.sleep(0)
+        if not situation:
+            return None
+        with profiler.phase("snapshot"):
+            return self.runner.expose()
+
+    async def program(self, *activycodes) -> None:
+        """Program robots with these activities to do next"""
+        super().program(*activycodes)
+
+
+async def autoplay(
+    runtime: AsyncRuntime,
+    pilot,
+    target: int,
+    observer: Optional[Callable[[Dict], None]] = None,
+) -> int:
+    """
+    Play the factory of runtime with pilot until target robots, return the tick.
+
+    The get_activities method of the pilot may be a coroutine. observer, when given,
+    is called with the situation displayed after each round.
+    """
+    while len(runtime.display()["situation"]["robots"]) < target:
+        activities = pilot.get_activities(runtime.display())
+        if inspect.isawaitable(activities):
+            activities = await activities
+        if activities:
+            await runtime.program(*activities)
+            await runtime.run()
+        else:
+            await runtime.run(force_one_next=True)
+        if observer:
+            observer(runtime.display())
+    return runtime.display()["tick"]
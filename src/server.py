@@ -0,0 +1,450 @@
+"""
+Local game server: many factories hosted by one asyncio process.
+
+Clients talk JSON lines over TCP. A request is an object with an "op", the
+parameters of the op and an optional "id", echoed in the reply. The reply is
+{"id": ..., "ok": true, ...} with the result of the op, or
+{"id": ..., "ok": false, "error": "..."}.
+
+Ops:
+- create: start a new game, with optional tick_delay (seconds, default 0), seed and
+  event_driven, like the Runtime constructor. With a pilot ("smart" or "dumb") and a
+  target (default 30), the game plays by itself until target robots. Reply the
+  "game" id.
+- state: reply the "tick" and the "situation" of a game.
+- program: program the "activities" of a game, as given to Runtime.program (activity
+  types, or [type, params] pairs), then run it until robots are available. Reply
+  the new state.
+- wait: run a game at least one tick without programming. Reply the new state.
+- subscribe, unsubscribe: receive {"event": "state", "game": ..., "tick": ...,
+  "situation": ...} lines after each round of a game, then {"event": "closed",
+  "game": ...} when it is closed.
+  A game whose pilot programs activities the factory refuses is closed: its creator
+  and its subscribers first receive {"event": "error", "game": ..., "error": ...}.
+- close: close a game.
+
+Anyone may watch a game, only its creator may program or close it; the games of a
+client are closed when it disconnects. The memory is bounded: the number of games,
+the games created by a client and the subscriptions of a client are capped, and the
+updates of a game are coalesced for each subscriber, which receives the latest
+state of the game when it is ready to read, never a backlog of all of them.
+"""
+
+import asyncio
+import itertools
+import json
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+import click
+
+from model.factory import FactoryException
+from pilots import DumbAutopilot, FactoryPilot, SmartAutopilot
+from runtime import AsyncRuntime, autoplay
+
+MAX_GAMES = 10000
+# games created by one client at most, so that one client cannot take them all
+MAX_OWNED_GAMES = 100
+MAX_SUBSCRIPTIONS = 1000
+# longest request line read by the server, in bytes
+MAX_REQUEST = 64 * 1024
+# longest line read by the client, in bytes: the state of a game grows with its
+# robots
+MAX_MESSAGE = 16 * 1024 * 1024
+# events kept by a client until they are read, the oldest ones are dropped
+CLIENT_EVENTS = 1000
+PILOTS = {"smart": lambda target: SmartAutopilot(), "dumb": DumbAutopilot}
+
+
+class ServerError(Exception):
+    """A request which cannot be served, reported to the client"""
+
+    pass
+
+
+def _param(request: Dict, name: str, kinds, default=None):
+    value = request.get(name, default)
+    if value is not default and not isinstance(value, kinds):
+        raise ServerError(f"Invalid {name}")
+    return value
+
+
+def _encode(message: Dict) -> bytes:
+    return json.dumps(message).encode() + b"\n"
+
+
+class Game:
+    """A factory hosted by the server"""
+
+    def __init__(self, gid: int, owner: "Connection", runtime: AsyncRuntime) -> None:
+        self.id = gid
+        self.owner = owner
+        self.runtime = runtime
+        self.subscribers: Set["Connection"] = set()
+        # the rounds of the game are run one at a time
+        self.lock = asyncio.Lock()
+        # the task of the pilot, if the game plays by itself
+        self.task: Optional[asyncio.Future] = None
+
+    def state(self) -> Dict:
+        return self.runtime.display()
+
+    def publish(self, *_) -> None:
+        for connection in self.subscribers:
+            connection.notify(self.id)
+
+
+class Connection:
+    """A client connected to the server"""
+
+    def __init__(
+        self,
+        server: "GameServer",
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.owned: Set[int] = set()
+        self.subscriptions: Set[int] = set()
+        # games with an update to send, in the order of their first update
+        self.dirty: "OrderedDict[int, None]" = OrderedDict()
+        self.wake = asyncio.Event()
+        self.write_lock = asyncio.Lock()
+        self.done = asyncio.Event()
+
+    def notify(self, gid: int) -> None:
+        """Send the latest state of game gid when the client is ready"""
+        self.dirty[gid] = None
+        self.wake.set()
+
+    async def send(self, message: Dict) -> None:
+        async with self.write_lock:
+            self.writer.write(_encode(message))
+            await self.writer.drain()
+
+    async def push_updates(self) -> None:
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            while self.dirty:
+                gid = self.dirty.popitem(last=False)[0]
+                if gid not in self.subscriptions:
+                    continue
+                game = self.server.games.get(gid)
+                if game is None:
+                    self.subscriptions.discard(gid)
+                    await self.send({"event": "closed", "game": gid})
+                else:
+                    await self.send({"event": "state", "game": gid, **game.state()})
+
+    async def serve(self) -> None:
+        pusher = asyncio.ensure_future(self.push_updates())
+        try:
+            while True:
+                try:
+                    line = await self.reader.readline()
+                except (ValueError, ConnectionError):
+                    # request too long, or connection lost
+                    break
+                if not line:
+                    break
+                await self.send(await self.handle(line))
+        except ConnectionError:
+            pass
+        finally:
+            pusher.cancel()
+            self.server.disconnect(self)
+            self.writer.close()
+            self.done.set()
+
+    async def handle(self, line: bytes) -> Dict:
+        """Serve one request line, return the reply"""
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {"id": None, "ok": False, "error": "Invalid JSON"}
+        request_id = request.get("id") if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict):
+                raise ServerError("A request is a JSON object")
+            op = self.server.ops.get(request.get("op"))
+            if op is None:
+                raise ServerError(f"Unknown op {request.get('op')}")
+            result = await op(self, request)
+        except ServerError as err:
+            return {"id": request_id, "ok": False, "error": str(err)}
+        except FactoryException as err:
+            return {"id": request_id, "ok": False, "error": err.args[0]}
+        return {"id": request_id, "ok": True, **result}
+
+
+class GameServer:
+    """Host games for the clients connected on a local TCP port"""
+
+    def __init__(
+        self,
+        max_games: int = MAX_GAMES,
+        max_subscriptions: int = MAX_SUBSCRIPTIONS,
+        max_owned_games: int = MAX_OWNED_GAMES,
+    ) -> None:
+        self.max_games = max_games
+        self.max_owned_games = max_owned_games
+        self.max_subscriptions = max_subscriptions
+        self.games: Dict[int, Game] = {}
+        self.connections: Set[Connection] = set()
+        self._ids = itertools.count(1)
+        self._server = None
+        self.ops = {
+            "create": self.create,
+            "state": self.state,
+            "program": self.program,
+            "wait": self.wait,
+            "subscribe": self.subscribe,
+            "unsubscribe": self.unsubscribe,
+            "close": self.close_game,
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        """Listen on host and port, 0 for any free port; return (host, port)"""
+        self._server = await asyncio.start_server(
+            self._connect, host, port, limit=MAX_REQUEST
+        )
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def stop(self) -> None:
+        """Stop listening, disconnect the clients and close the games"""
+        self._server.close()
+        for connection in list(self.connections):
+            connection.writer.close()
+            await connection.done.wait()
+        await self._server.wait_closed()
+        for gid in list(self.games):
+            self._close(gid)
+
+    async def _connect(self, reader, writer) -> None:
+        connection = Connection(self, reader, writer)
+        self.connections.add(connection)
+        await connection.serve()
+
+    def disconnect(self, connection: Connection) -> None:
+        self.connections.discard(connection)
+        for gid in connection.subscriptions:
+            game = self.games.get(gid)
+            if game:
+                game.subscribers.discard(connection)
+        for gid in list(connection.owned):
+            self._close(gid)
+
+    def _close(self, gid: int) -> None:
+        game = self.games.pop(gid)
+        game.owner.owned.discard(gid)
+        if game.task:
+            game.task.cancel()
+        # the subscribers find the game closed
+        game.publish()
+
+    def _game(self, request: Dict) -> Game:
+        game = self.games.get(request.get("game"))
+        if game is None:
+            raise ServerError(f"Unknown game {request.get('game')}")
+        return game
+
+    def _owned_game(self, connection: Connection, request: Dict) -> Game:
+        game = self._game(request)
+        if game.owner is not connection:
+            raise ServerError(f"Not the owner of game {game.id}")
+        return game
+
+    async def _autoplay(self, game: Game, pilot: FactoryPilot, target: int) -> None:
+        try:
+            async with game.lock:
+                await autoplay(game.runtime, pilot, target, observer=game.publish)
+        except FactoryException as err:
+            # the game cannot go on: tell why before it is found closed
+            message = {"event": "error", "game": game.id, "error": err.args[0]}
+            await asyncio.gather(
+                *(
+                    connection.send(message)
+                    for connection in game.subscribers | {game.owner}
+                ),
+                return_exceptions=True,
+            )
+            game.task = None
+            self._close(game.id)
+
+    # Ops
+
+    async def create(self, connection: Connection, request: Dict) -> Dict:
+        if len(self.games) >= self.max_games:
+            raise ServerError("Too many games")
+        if len(connection.owned) >= self.max_owned_games:
+            raise ServerError("Too many games for this client")
+        tick_delay = _param(request, "tick_delay", (int, float), 0)
+        seed = _param(request, "seed", int)
+        event_driven = _param(request, "event_driven", bool, True)
+        pilot = _param(request, "pilot", str)
+        target = _param(request, "target", int, 30)
+        if pilot is not None and pilot not in PILOTS:
+            raise ServerError(f"Unknown pilot {pilot}")
+        runtime = AsyncRuntime(tick_delay, event_driven=event_driven, seed=seed)
+        game = Game(next(self._ids), connection, runtime)
+        self.games[game.id] = game
+        connection.owned.add(game.id)
+        if pilot:
+            game.task = asyncio.ensure_future(
+                self._autoplay(game, PILOTS[pilot](target), target)
+            )
+        return {"game": game.id}
+
+    async def state(self, connection: Connection, request: Dict) -> Dict:
+        return self._game(request).state()
+
+    async def program(self, connection: Connection, request: Dict) -> Dict:
+        game = self._owned_game(connection, request)
+        if game.task:
+            raise ServerError(f"Game {game.id} is played by a pilot")
+        activities = _param(request, "activities", list)
+        if not activities:
+            raise ServerError("No activities")
+        descriptors = [
+            tuple(act) if isinstance(act, list) else act for act in activities
+        ]
+        async with game.lock:
+            try:
+                await game.runtime.program(*descriptors)
+            except (TypeError, ValueError) as err:
+                raise ServerError(f"Invalid activities: {err}")
+            await game.runtime.run()
+        game.publish()
+        return game.state()
+
+    async def wait(self, connection: Connection, request: Dict) -> Dict:
+        game = self._owned_game(connection, request)
+        if game.task:
+            raise ServerError(f"Game {game.id} is played by a pilot")
+        async with game.lock:
+            await game.runtime.run(force_one_next=True)
+        game.publish()
+        return game.state()
+
+    async def subscribe(self, connection: Connection, request: Dict) -> Dict:
+        game = self._game(request)
+        if (
+            game.id not in connection.subscriptions
+            and len(connection.subscriptions) >= self.max_subscriptions
+        ):
+            raise ServerError("Too many subscriptions")
+        connection.subscriptions.add(game.id)
+        game.subscribers.add(connection)
+        connection.notify(game.id)
+        return {"game": game.id}
+
+    async def unsubscribe(self, connection: Connection, request: Dict) -> Dict:
+        game = self._game(request)
+        connection.subscriptions.discard(game.id)
+        connection.dirty.pop(game.id, None)
+        game.subscribers.discard(connection)
+        return {"game": game.id}
+
+    async def close_game(self, connection: Connection, request: Dict) -> Dict:
+        game = self._owned_game(connection, request)
+        self._close(game.id)
+        return {"game": game.id}
+
+
+class GameClient:
+    """
+    Client of a game server, for bots, dashboards and tests.
+
+    request() sends a request and returns its result, next_event() returns the next
+    event of the subscribed games. The events are kept until they are read, up to
+    CLIENT_EVENTS: then the oldest ones are dropped.
+    """
+
+    def __init__(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.events: asyncio.Queue = asyncio.Queue(maxsize=CLIENT_EVENTS)
+        self._ids = itertools.count(1)
+        self._replies: Dict[int, asyncio.Future] = {}
+        self._listener = asyncio.ensure_future(self._listen())
+
+    @classmethod
+    async def connect(cls, host: str = "127.0.0.1", port: int = 8765) -> "GameClient":
+        reader, writer = await asyncio.open_connection(host, port, limit=MAX_MESSAGE)
+        return cls(reader, writer)
+
+    async def request(self, op: str, **params) -> Dict:
+        """Send a request, return the reply; raise ServerError if it failed"""
+        request_id = next(self._ids)
+        reply = asyncio.get_event_loop().create_future()
+        self._replies[request_id] = reply
+        self.writer.write(_encode(dict(params, op=op, id=request_id)))
+        await self.writer.drain()
+        message = await reply
+        if not message["ok"]:
+            raise ServerError(message["error"])
+        return message
+
+    async def next_event(self) -> Dict:
+        return await self.events.get()
+
+    async def _listen(self) -> None:
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if "event" not in message:
+                    reply = self._replies.pop(message.get("id"), None)
+                    if reply:
+                        reply.set_result(message)
+                    continue
+                if self.events.full():
+                    self.events.get_nowait()
+                self.events.put_nowait(message)
+        finally:
+            for reply in self._replies.values():
+                if not reply.done():
+                    reply.set_exception(ConnectionError("Connection closed"))
+
+    async def close(self) -> None:
+        self._listener.cancel()
+        self.writer.close()
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="Address. Default 127.0.0.1.")
+@click.option("--port", default=8765, type=int, help="TCP port. Default 8765.")
+@click.option(
+    "--max-games",
+    default=MAX_GAMES,
+    type=int,
+    help=f"Games hosted at most. Default {MAX_GAMES}.",
+)
+@click.option(
+    "--max-games-per-client",
+    default=MAX_OWNED_GAMES,
+    type=int,
+    help=f"Games created by one client at most. Default {MAX_OWNED_GAMES}.",
+)
+def serve(host: str, port: int, max_games: int, max_games_per_client: int):
+    loop = asyncio.get_event_loop()
+    server = GameServer(max_games=max_games, max_owned_games=max_games_per_client)
+    host, port = loop.run_until_complete(server.start(host, port))
+    click.secho(f"Serving on {host}:{port}", fg="green")
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.stop())
+
+
+if __name__ == "__main__":
+    serve()
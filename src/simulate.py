@@ -0,0 +1,270 @@
+"""Play many headless games per pilot on a process pool and report statistics"""
+
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Sequence
+
+import click
+
+from model import cohorts, lockstep
+from model.factory import FactoryException
+from model.randomness import Seed, spawn_seeds
+from pilots import CompiledPilot, DumbAutopilot, FactoryPilot, SmartAutopilot
+from runtime import Runtime
+
+PILOTS = ("smart", "dumb")
+ENGINES = ("object", "lockstep", "cohort")
+# games played per task sent to a worker, by engine
+BATCH_SIZES = {"object": 100, "lockstep": 5000, "cohort": 100}
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+# Pilot instances of the current worker process, built once by _init_worker
+_WORKER_PILOTS = {}
+
+
+def build_pilot(name: str, target: int, **params) -> FactoryPilot:
+    """The pilot name, with the thresholds params (see pilots)"""
+    if name == "smart":
+        return SmartAutopilot(**params)
+    if name == "dumb":
+        return DumbAutopilot(target=target, **params)
+    raise ValueError(f"Unknown pilot {name}")
+
+
+def play(
+    pilot: FactoryPilot, target: int, runtime: Runtime = None, seed: Seed = None
+) -> int:
+    """
+    Play one game without any output and return the number of ticks to reach target.
+
+    Args:
+    - pilot: the pilot taking the decisions
+    - target: number of robots to reach
+    - runtime: the runtime to play on. Default a fresh runtime without tick delay.
+    - seed: seed of the random outcomes of the fresh runtime.
+    """
+    if runtime is None:
+        runtime = Runtime(tick_delay=0, seed=seed)
+    situation = runtime.display()
+    while len(situation["situation"]["robots"]) < target:
+        activities = pilot.get_activities(situation)
+        try:
+            if activities:
+                runtime.program(*activities)
+                runtime.run()
+            else:
+                runtime.run(force_one_next=True)
+        except FactoryException:
+            # unlike the CLI, which asks the pilot again at the same tick, move on
+            # to the next event: a pilot repeating a bad decision cannot loop
+            # forever on one tick
+            runtime.run(force_one_next=True)
+        situation = runtime.display()
+    return situation["tick"]
+
+
+def _init_worker(target: int, compiled: bool = False) -> None:
+    for name in PILOTS:
+        pilot = build_pilot(name, target)
+        _WORKER_PILOTS[name] = CompiledPilot(pilot) if compiled else pilot
+
+
+def _play_batch(pilot_name: str, target: int, seeds: List[Seed]) -> List[int]:
+    pilot = _WORKER_PILOTS[pilot_name]
+    return [play(pilot, target, seed=s) for s in seeds]
+
+
+def _play_lockstep_batch(
+    pilot_name: str, target: int, nbgames: int, seed: Seed
+) -> List[int]:
+    pilot = _WORKER_PILOTS[pilot_name]
+    return lockstep.play(pilot.choose_batch, nbgames, target, seed=seed).tolist()
+
+
+def _play_cohort_batch(pilot_name: str, target: int, seeds: List[Seed]) -> List[int]:
+    decide = cohorts.cohort_policy(_WORKER_PILOTS[pilot_name].choose_batch)
+    return [cohorts.play(decide, target, seed=s)[0] for s in seeds]
+
+
+def _batches(nbgames: int, batch_size: int) -> List[int]:
+    sizes = [batch_size] * (nbgames // batch_size)
+    if nbgames % batch_size:
+        sizes.append(nbgames % batch_size)
+    return sizes
+
+
+def run_games(
+    pilot_names: Sequence[str],
+    nbgames: int,
+    target: int = 30,
+    workers: int = None,
+    batch_size: int = None,
+    engine: str = "object",
+    seed: Seed = None,
+    compiled: bool = False,
+) -> Dict[str, List[int]]:
+    """
+    Play nbgames games for each pilot and return the ticks-to-target of each game
+
+    The object engine plays each game on a Runtime, the lockstep engine plays whole
+    batches of games at once on model.lockstep arrays, the cohort engine plays each
+    game on a model.cohorts fleet counted by state.
+    Each game gets its own seed derived from seed, so that the results of a seed
+    depend neither on the number of workers nor on the batch size. The games of a
+    lockstep batch share one generator: the batch gets the seed, and the results
+    depend on the batch size.
+    With compiled, the pilots decide through their decision tables (see
+    pilots.CompiledPilot), compiled once per worker.
+    """
+    play_batch = {
+        "object": _play_batch,
+        "lockstep": _play_lockstep_batch,
+        "cohort": _play_cohort_batch,
+    }[engine]
+    batch_size = batch_size or BATCH_SIZES[engine]
+    if engine == "lockstep":
+        sizes = _batches(nbgames, batch_size)
+        tasks = list(zip(sizes, spawn_seeds(seed, len(sizes))))
+    else:
+        seeds = spawn_seeds(seed, nbgames)
+        tasks = [
+            (seeds[start : start + batch_size],)
+            for start in range(0, nbgames, batch_size)
+        ]
+    results = {name: [] for name in pilot_names}
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        initializer=_init_worker,
+        initargs=(target, compiled),
+    ) as pool:
+        # every pilot plays the same games
+        futures = [
+            (name, pool.submit(play_batch, name, target, *task))
+            for name in pilot_names
+            for task in tasks
+        ]
+        for name, future in futures:
+            results[name].extend(future.result())
+    return results
+
+
+def percentile(sorted_values: Sequence[int], pct: float) -> int:
+    """Nearest-rank percentile of already sorted values"""
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def histogram(values: Sequence[int], nbbins: int) -> List[Dict]:
+    """Split values into nbbins bins of equal width"""
+    low, high = min(values), max(values)
+    width = max(1, math.ceil((high - low + 1) / nbbins))
+    counts = [0] * math.ceil((high - low + 1) / width)
+    for val in values:
+        counts[(val - low) // width] += 1
+    return [
+        {"from": low + i * width, "to": low + (i + 1) * width - 1, "count": count}
+        for i, count in enumerate(counts)
+    ]
+
+
+def summarize(ticks: Sequence[int], nbbins: int = 20) -> Dict:
+    values = sorted(ticks)
+    mean = sum(values) / len(values)
+    return {
+        "games": len(values),
+        "mean": mean,
+        "stdev": math.sqrt(sum((v - mean) ** 2 for v in values) / len(values)),
+        "min": values[0],
+        "max": values[-1],
+        "percentiles": {pct: percentile(values, pct) for pct in PERCENTILES},
+        "histogram": histogram(values, nbbins),
+    }
+
+
+def display(name: str, summary: Dict) -> None:
+    click.secho(f"Pilot {name}", fg="blue", bold=True)
+    click.secho(
+        f"Games: {summary['games']}  Mean: {summary['mean']:.1f}  "
+        f"Stdev: {summary['stdev']:.1f}  Min: {summary['min']}  Max: {summary['max']}",
+        fg="green",
+    )
+    click.secho(
+        "  ".join(f"p{pct}: {val}" for pct, val in summary["percentiles"].items()),
+        fg="green",
+    )
+    biggest = max(b["count"] for b in summary["histogram"])
+    for b in summary["histogram"]:
+        bar = "#" * math.ceil(50 * b["count"] / biggest)
+        click.echo(f"{b['from']:>7} - {b['to']:<7} {b['count']:>8} {bar}")
+
+
+@click.command()
+@click.option("--games", default=1000, help="Number of games per pilot. Default 1000.")
+@click.option(
+    "--target", default=30, help="Number of robots to reach to win. Default 30."
+)
+@click.option(
+    "--pilot",
+    "pilot_names",
+    type=click.Choice(PILOTS),
+    multiple=True,
+    default=PILOTS,
+    help="Pilot to evaluate, can be repeated. Default all autopilots.",
+)
+@click.option(
+    "--workers", default=None, type=int, help="Worker processes. Default: one per core."
+)
+@click.option(
+    "--engine",
+    type=click.Choice(ENGINES),
+    default="object",
+    help="object: one Runtime per game. lockstep: NumPy arrays of games. "
+    "cohort: robots counted by state, for huge targets. Default object.",
+)
+@click.option(
+    "--batch-size",
+    default=None,
+    type=int,
+    help="Games played per task sent to a worker. Default 100 (object, cohort), "
+    "5000 (lockstep).",
+)
+@click.option(
+    "--seed",
+    default=None,
+    type=int,
+    help="Seed of the games, for reproducible results. Default: random.",
+)
+@click.option(
+    "--compiled",
+    is_flag=True,
+    help="Compile the pilots into decision tables before playing.",
+)
+@click.option("--bins", default=20, help="Number of histogram bins. Default 20.")
+@click.option("--json", "as_json", is_flag=True, help="Output a JSON report.")
+def simulate(
+    games,
+    target,
+    pilot_names,
+    workers,
+    engine,
+    batch_size,
+    seed,
+    compiled,
+    bins,
+    as_json,
+):
+    results = run_games(
+        pilot_names, games, target, workers, batch_size, engine, seed, compiled
+    )
+    summaries = {name: summarize(ticks, bins) for name, ticks in results.items()}
+    if as_json:
+        click.echo(json.dumps(summaries))
+        return
+    for name, summary in summaries.items():
+        display(name, summary)
+
+
+if __name__ == "__main__":
+    simulate()
@@ -0,0 +1,356 @@
+"""
+Sweep the thresholds of an autopilot: evaluate configurations of its parameters on
+many seeded games on a process pool, and rank them.
+
+The configurations are the grid of the parameter values, or a random or Latin
+hypercube sample of it. They are played by rounds of one batch of games each on the
+lockstep engine (see model.lockstep), every configuration on the same seeds, so
+that the games of two configurations are paired. After each round, a configuration
+stops when it is worse than the best one so far with confidence: its mean number of
+ticks exceeds the one of the best configuration by more than z standard errors of
+the paired differences.
+"""
+
+import itertools
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Sequence
+
+import click
+import numpy as np
+
+from model import lockstep
+from model.randomness import Seed, spawn_seeds
+from simulate import PILOTS, build_pilot
+
+METHODS = ("grid", "random", "lhs")
+
+# A configuration: value of each parameter of the pilot
+Config = Dict[str, int]
+# Values of each parameter
+Space = Dict[str, List[int]]
+
+
+def default_space(pilot_name: str, target: int) -> Space:
+    """Values around the default thresholds of the pilot"""
+    if pilot_name == "smart":
+        return {
+            "foo_stock": list(range(4, 11)),
+            "bar_stock": [1, 2, 3],
+            "sell_from": [1, 2, 3],
+            "sell_max": [3, 4, 5],
+        }
+    foobars = 3 * (target - 2)
+    return {
+        "foobar_goal": list(range(foobars, foobars + 25, 5)),
+        "foo_goal": list(range(2 * foobars, 2 * foobars + 40, 10)),
+        "sell_max": [1, 2, 3, 4, 5],
+    }
+
+
+def parse_values(spec: str) -> List[int]:
+    """Values of "low:high" or "low:high:step" (high included), or "v1,v2,..." """
+    if ":" in spec:
+        bounds = [int(val) for val in spec.split(":")]
+        low, high, step = bounds if len(bounds) == 3 else bounds + [1]
+        return list(range(low, high + 1, step))
+    return [int(val) for val in spec.split(",")]
+
+
+def grid(space: Space) -> List[Config]:
+    names = list(space)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(space[name] for name in names))
+    ]
+
+
+def _unique(configs: List[Config]) -> List[Config]:
+    seen = set()
+    unique = []
+    for config in configs:
+        key = tuple(sorted(config.items()))
+        if key not in seen:
+            seen.add(key)
+            unique.append(config)
+    return unique
+
+
+def random_sample(space: Space, nbsamples: int, seed: Seed = None) -> List[Config]:
+    """nbsamples configurations drawn uniformly, without the duplicates"""
+    rng = np.random.default_rng(seed)
+    columns = {
+        name: rng.integers(0, len(values), size=nbsamples)
+        for name, values in space.items()
+    }
+    return _unique(
+        [
+            {name: space[name][columns[name][i]] for name in space}
+            for i in range(0, nbsamples)
+        ]
+    )
+
+
+def latin_hypercube(space: Space, nbsamples: int, seed: Seed = None) -> List[Config]:
+    """
+    nbsamples configurations of a Latin hypercube, without the duplicates: the
+    values of each parameter are split into nbsamples strata, each one sampled once
+    """
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for name, values in space.items():
+        positions = (rng.permutation(nbsamples) + rng.random(nbsamples)) / nbsamples
+        columns[name] = (positions * len(values)).astype(np.int64)
+    return _unique(
+        [
+            {name: space[name][columns[name][i]] for name in space}
+            for i in range(0, nbsamples)
+        ]
+    )
+
+
+def _evaluate(
+    pilot_name: str, config: Config, target: int, nbgames: int, seed, max_ticks: int
+) -> List[int]:
+    """Ticks of nbgames games of a configuration, max_ticks + 1 if not reached"""
+    pilot = build_pilot(pilot_name, target, **config)
+    ticks = lockstep.play(
+        pilot.choose_batch,
+        nbgames,
+        target,
+        seed=seed,
+        max_ticks=max_ticks,
+        sell_max=pilot.sell_max,
+    )
+    ticks[ticks < 0] = max_ticks + 1
+    return ticks.tolist()
+
+
+def paired_z(ticks: np.ndarray, best: np.ndarray) -> float:
+    """How many standard errors the mean of ticks - best is above 0"""
+    diffs = ticks - best
+    mean = diffs.mean()
+    stderr = diffs.std(ddof=1) / math.sqrt(len(diffs))
+    if stderr == 0:
+        return math.copysign(math.inf, mean) if mean else 0.0
+    return mean / stderr
+
+
+def sweep(
+    pilot_name: str,
+    configs: Sequence[Config],
+    nbgames: int,
+    target: int = 30,
+    batch_size: int = 250,
+    z: float = 3.0,
+    max_ticks: int = 5000,
+    workers: int = None,
+    seed: Seed = None,
+) -> List[Dict]:
+    """
+    Evaluate the configurations and return their results, best first.
+
+    The configurations are played by rounds of batch_size games; after each round,
+    the ones worse than the best by more than z standard errors stop (z None: none
+    stops). The result of a configuration holds its parameters, the number of games
+    played, the mean and the standard error of the ticks, the number of games which
+    did not reach the target within max_ticks and whether it stopped early. The
+    configurations which played all the games come first.
+    """
+    nbrounds = math.ceil(nbgames / batch_size)
+    seeds = spawn_seeds(seed, nbrounds)
+    ticks = [[] for _ in configs]
+    alive = list(range(0, len(configs)))
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for round_index, round_seed in enumerate(seeds):
+            size = min(batch_size, nbgames - round_index * batch_size)
+            futures = [
+                (
+                    index,
+                    pool.submit(
+                        _evaluate,
+                        pilot_name,
+                        configs[index],
+                        target,
+                        size,
+                        round_seed,
+                        max_ticks,
+                    ),
+                )
+                for index in alive
+            ]
+            for index, future in futures:
+                ticks[index].extend(future.result())
+            if z is None or len(alive) < 2 or len(ticks[alive[0]]) < 2:
+                continue
+            played = {index: np.array(ticks[index]) for index in alive}
+            best = min(alive, key=lambda index: played[index].mean())
+            alive = [
+                index
+                for index in alive
+                if index == best or paired_z(played[index], played[best]) <= z
+            ]
+    results = []
+    for index, config in enumerate(configs):
+        values = np.array(ticks[index])
+        results.append(
+            {
+                "params": config,
+                "games": len(values),
+                "mean": float(values.mean()),
+                "stderr": (
+                    float(values.std(ddof=1) / math.sqrt(len(values)))
+                    if len(values) > 1
+                    else 0.0
+                ),
+                "failed": int((values > max_ticks).sum()),
+                "stopped": index not in alive,
+            }
+        )
+    return sorted(results, key=lambda result: (result["stopped"], result["mean"]))
+
+
+def display(results: List[Dict]) -> None:
+    names = list(results[0]["params"])
+    click.secho(
+        f"{'rank':>4}  "
+        + "  ".join(f"{name:>11}" for name in names)
+        + f"  {'games':>6}  {'mean':>8}  {'stderr':>6}  {'failed':>6}",
+        fg="blue",
+        bold=True,
+    )
+    for rank, result in enumerate(results, 1):
+        line = (
+            f"{rank:>4}  "
+            + "  ".join(f"{result['params'][name]:>11}" for name in names)
+            + f"  {result['games']:>6}  {result['mean']:>8.1f}  "
+            f"{result['stderr']:>6.2f}  {result['failed']:>6}"
+        )
+        click.secho(line, fg="white" if result["stopped"] else "green")
+
+
+@click.command()
+@click.option(
+    "--pilot",
+    "pilot_name",
+    type=click.Choice(PILOTS),
+    default="smart",
+    help="Pilot whose thresholds are swept. Default smart.",
+)
+@click.option(
+    "--param",
+    "params",
+    multiple=True,
+    help="Values of a parameter, as name=low:high[:step] or name=v1,v2,...; can be "
+    "repeated. Default: values around the default thresholds of the pilot.",
+)
+@click.option(
+    "--method",
+    type=click.Choice(METHODS),
+    default="grid",
+    help="grid: every combination of the values. random: uniform sample. lhs: Latin "
+    "hypercube sample. Default grid.",
+)
+@click.option(
+    "--samples",
+    default=32,
+    help="Configurations sampled by the random and lhs methods. Default 32.",
+)
+@click.option(
+    "--games", default=1000, help="Games per configuration at most. Default 1000."
+)
+@click.option(
+    "--batch-size", default=250, help="Games per configuration per round. Default 250."
+)
+@click.option(
+    "--target", default=30, help="Number of robots to reach to win. Default 30."
+)
+@click.option(
+    "--z",
+    default=3.0,
+    help="Stop a configuration when it is worse than the best one by more than z "
+    "standard errors. Default 3.",
+)
+@click.option(
+    "--no-early-stop", is_flag=True, help="Play all the games of every configuration."
+)
+@click.option(
+    "--max-ticks",
+    default=5000,
+    help="Ticks after which a game which did not reach the target stops, counted "
+    "max-ticks + 1. Default 5000.",
+)
+@click.option(
+    "--workers", default=None, type=int, help="Worker processes. Default: one per core."
+)
+@click.option(
+    "--seed",
+    default=None,
+    type=int,
+    help="Seed of the samples and of the games, for reproducible results. "
+    "Default: random.",
+)
+@click.option("--top", default=20, help="Configurations displayed. Default 20.")
+@click.option("--json", "as_json", is_flag=True, help="Output the results in JSON.")
+def sweep_command(
+    pilot_name,
+    params,
+    method,
+    samples,
+    games,
+    batch_size,
+    target,
+    z,
+    no_early_stop,
+    max_ticks,
+    workers,
+    seed,
+    top,
+    as_json,
+):
+    space = default_space(pilot_name, target)
+    if params:
+        try:
+            space = {
+                name: parse_values(spec)
+                for name, spec in (param.split("=", 1) for param in params)
+            }
+        except ValueError:
+            raise click.BadParameter("name=low:high[:step] or name=v1,v2,...")
+    sample_seed, games_seed = spawn_seeds(seed, 2)
+    if method == "grid":
+        configs = grid(space)
+    elif method == "random":
+        configs = random_sample(space, samples, sample_seed)
+    else:
+        configs = latin_hypercube(space, samples, sample_seed)
+    try:
+        build_pilot(pilot_name, target, **configs[0])
+    except TypeError as err:
+        raise click.BadParameter(str(err), param_hint="--param")
+    results = sweep(
+        pilot_name,
+        configs,
+        games,
+        target,
+        batch_size,
+        None if no_early_stop else z,
+        max_ticks,
+        workers,
+        games_seed,
+    )
+    if as_json:
+        click.echo(json.dumps(results))
+        return
+    click.secho(
+        f"{len(configs)} configurations, "
+        f"{sum(result['stopped'] for result in results)} stopped early",
+        fg="blue",
+    )
+    display(results[:top])
+
+
+if __name__ == "__main__":
+    sweep_command()
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from cluster import Cluster, ClusterError, TickMetrics, cluster_command
+from pilots import SmartAutopilot
+
+FACTORIES = 300
+TARGET = 10
+
+
+class FailingPilot(SmartAutopilot):
+    def choose_batch(self, resources, nbrobots):
+        raise RuntimeError("broken")
+
+
+# Fixtures
+
+
+@pytest.fixture
+def cluster():
+    """Yield a cluster of one worker, with small blocks"""
+    with Cluster(1, block_size=64) as cluster:
+        yield cluster
+
+
+# Tests
+
+
+class TestCluster:
+    def test_resize(self, cluster):
+        """The results do not depend on the number of workers"""
+        single = cluster.run(SmartAutopilot(), FACTORIES, TARGET, seed=1)
+        cluster.resize(2)
+        assert cluster.nbworkers == 2
+        double = cluster.run(SmartAutopilot(), FACTORIES, TARGET, seed=1)
+        assert np.array_equal(single.ticks, double.ticks)
+        assert single.metrics == double.metrics
+        assert (single.ticks > 0).all()
+        for name in ("foobars", "completed"):
+            assert sum(getattr(line, name) for line in single.metrics) == sum(
+                getattr(line, name) for line in double.metrics
+            )
+        # every factory reached the target once, at the tick of its result
+        assert sum(line.completed for line in single.metrics) == FACTORIES
+        assert single.metrics[-1].playing == 0
+        assert len(single.metrics) == single.ticks.max() + 1
+        assert np.bincount(single.ticks).tolist() == [
+            line.completed for line in single.metrics
+        ]
+
+    def test_seed(self, cluster):
+        first = cluster.run(SmartAutopilot(), 100, TARGET, seed=1)
+        other = cluster.run(SmartAutopilot(), 100, TARGET, seed=2)
+        assert not np.array_equal(first.ticks, other.ticks)
+
+    def test_on_tick(self, cluster):
+        reported = []
+        run = cluster.run(
+            SmartAutopilot(),
+            100,
+            TARGET,
+            seed=1,
+            ticks_per_message=7,
+            on_tick=reported.append,
+        )
+        assert reported == run.metrics
+        assert all(isinstance(line, TickMetrics) for line in reported)
+        assert [line.tick for line in reported] == list(range(0, len(reported)))
+
+    def test_max_ticks(self, cluster):
+        run = cluster.run(SmartAutopilot(), 100, TARGET, max_ticks=50, seed=1)
+        assert len(run.metrics) == 51
+        assert (run.ticks == -1).all()
+        assert run.metrics[-1].playing == 100
+
+    def test_worker_error(self, cluster):
+        with pytest.raises(ClusterError, match="broken"):
+            cluster.run(FailingPilot(), 100, TARGET, seed=1)
+        # the workers are still in step with the coordinator
+        run = cluster.run(SmartAutopilot(), 100, TARGET, seed=1)
+        assert run.metrics[-1].playing == 0
+
+    def test_no_worker(self):
+        with Cluster(0) as cluster:
+            assert cluster.nbworkers == 0
+            with pytest.raises(ClusterError, match="no worker"):
+                cluster.run(SmartAutopilot(), 100, TARGET, seed=1)
+
+    def test_no_factory(self, cluster):
+        run = cluster.run(SmartAutopilot(), 0, TARGET, seed=1)
+        assert run.metrics == []
+        assert run.ticks.size == 0
+
+    def test_close(self):
+        cluster = Cluster(2)
+        processes = [process for process, _ in cluster._workers]
+        cluster.close()
+        assert cluster.nbworkers == 0
+        assert not any(process.is_alive() for process in processes)
+
+
+class TestCommand:
+    def test_summary(self):
+        result = CliRunner().invoke(
+            cluster_command,
+            ["--factories", "100", "--workers", "1", "--target", str(TARGET)]
+            + ["--seed", "1", "--block-size", "64"],
+        )
+        assert result.exit_code == 0
+        assert "1 workers: " in result.output
+        assert " foobars/tick, " in result.output
+        assert "100/100 reached the target" in result.output
+
+    @pytest.mark.parametrize(["factories"], [("0",), ("-3",)])
+    def test_no_factory(self, factories):
+        result = CliRunner().invoke(cluster_command, ["--factories", factories])
+        assert result.exit_code == 2
+        assert "--factories" in result.output
@@ -0,0 +1,200 @@
+import json
+import re
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+import evolve
+from evolve import RulePilot, Search, crossover, mutate, random_genome, smart_genome
+from model import lockstep
+from model.constants import BUYROBOT, MINEFOO, SELLFOOBAR
+from model.resources import ResourceLedger
+from pilots import SmartAutopilot
+
+
+class SerialPool:
+    """Pool evaluating in the calling process"""
+
+    @staticmethod
+    def map(function, *iterables):
+        return map(function, *iterables)
+
+
+def check_genome(genome):
+    """Assert that genome is a valid, JSON-shaped genome"""
+    assert json.loads(json.dumps(genome)) == genome
+    assert 1 <= len(genome["rules"]) <= evolve.MAX_RULES
+    assert 1 <= genome["sell_max"] <= lockstep.MAX_SOLD
+    for rule in genome["rules"]:
+        assert rule["activity"] in evolve.TYPE_NAMES
+        assert len(rule["conditions"]) <= evolve.MAX_CONDITIONS
+        for variable, operator, threshold in rule["conditions"]:
+            assert variable in evolve.VARIABLES
+            assert operator in evolve.OPERATORS
+            assert threshold >= 0
+    RulePilot.from_dict(genome)
+
+
+# Tests
+
+
+class TestRulePilot:
+    @pytest.mark.parametrize(["seed"], list((seed,) for seed in range(0, 8)))
+    def test_choose_batch(self, seed):
+        """The vectorized decision is the decision of the first robot"""
+        rng = np.random.default_rng(seed)
+        pilot = RulePilot.from_dict(random_genome(rng))
+        resources = rng.integers(0, [22, 12, 12, 14], size=(400, 4))
+        nbrobots = rng.integers(2, 42, size=400)
+        codes = pilot.choose_batch(resources, nbrobots)
+        for row, robots, code in zip(resources, nbrobots, codes):
+            res = ResourceLedger(*(int(value) for value in row))
+            acttype = pilot.decide(res, int(robots))
+            assert code == (
+                lockstep.NO_ACTIVITY
+                if acttype is None
+                else lockstep.TYPE_CODES[acttype]
+            )
+            chosen = pilot.choose(res.copy(), 1, int(robots))
+            assert [act[0] if type(act) is tuple else act for act in chosen] == (
+                [] if acttype is None else [acttype]
+            )
+
+    def test_choose(self):
+        pilot = RulePilot.from_dict(smart_genome())
+        res = ResourceLedger(foos=13, bars=0, foobars=7, money=6)
+        activities = pilot.choose(res, 5, 10)
+        # two robots bought, then the foobars sold 5 at most at once, then foos
+        assert activities == [
+            BUYROBOT,
+            BUYROBOT,
+            (SELLFOOBAR, {"nbtosell": 5}),
+            (SELLFOOBAR, {"nbtosell": 2}),
+            MINEFOO,
+        ]
+        assert res == ResourceLedger(foos=1, bars=0, foobars=0, money=0)
+
+    def test_to_dict(self):
+        genome = random_genome(np.random.default_rng(0))
+        assert RulePilot.from_dict(genome).to_dict() == genome
+
+    def test_smart(self):
+        """The rules of smart_genome play the games of SmartAutopilot"""
+        ticks = lockstep.play(SmartAutopilot().choose_batch, 50, 10, seed=0)
+        assert evolve.evaluate(smart_genome(), 10, 50, 0, 1000) == ticks.mean()
+
+
+class TestBreeding:
+    def test_random_genome(self):
+        rng = np.random.default_rng(0)
+        for _ in range(0, 50):
+            check_genome(random_genome(rng))
+
+    def test_mutate(self):
+        rng = np.random.default_rng(0)
+        genome = smart_genome()
+        changed = 0
+        for _ in range(0, 200):
+            mutated = mutate(genome, rng)
+            check_genome(mutated)
+            changed += mutated != genome
+            genome = mutated
+        # a threshold moved below 0 stays at 0: seldom no change
+        assert changed > 150
+
+    def test_mutate_copy(self):
+        genome = smart_genome()
+        mutate(genome, np.random.default_rng(0))
+        assert genome == smart_genome()
+
+    def test_mutate_reproducible(self):
+        genome = smart_genome()
+        assert mutate(genome, np.random.default_rng(5)) == mutate(
+            genome, np.random.default_rng(5)
+        )
+
+    def test_crossover(self):
+        rng = np.random.default_rng(0)
+        for _ in range(0, 50):
+            first, second = random_genome(rng), random_genome(rng)
+            child = crossover(first, second, rng)
+            check_genome(child)
+            rules = child["rules"]
+            assert child["sell_max"] in (first["sell_max"], second["sell_max"])
+            # the first rules of first, then the last rules of second
+            assert any(
+                rules[:size] == first["rules"][:size]
+                and any(
+                    rules[size:] == second["rules"][start:][: len(rules) - size]
+                    for start in range(0, len(second["rules"]))
+                )
+                for size in range(1, len(rules) + 1)
+            )
+            # an independent copy
+            rules[0]["conditions"].append(["foos", "<", 1])
+            assert rules[0] != first["rules"][0]
+
+
+class TestSearch:
+    @pytest.fixture
+    def search(self):
+        yield Search(6, target=5, nbgames=10, elite=2, max_ticks=500, seed=1)
+
+    def test_population(self, search):
+        assert len(search.population) == 6
+        assert search.population[0] == smart_genome()
+        for genome in search.population:
+            check_genome(genome)
+
+    def test_step(self, search):
+        best = search.step(SerialPool())
+        assert search.generation == 1
+        assert search.history[0][0] == best
+        # the elite is kept as it is
+        assert search.history[0][1] in search.population[:2]
+        assert len(search.population) == 6
+
+    def test_checkpoint(self, search, tmp_path):
+        """A search resumed from its checkpoint goes on as if it never stopped"""
+        path = str(tmp_path / "search.json")
+        search.step(SerialPool())
+        search.save(path)
+        resumed = Search.load(path)
+        assert resumed.population == search.population
+        assert resumed.history == search.history
+        assert resumed.generation == search.generation
+        assert resumed.elite == search.elite
+        assert not (tmp_path / "search.json.tmp").exists()
+        assert resumed.step(SerialPool()) == search.step(SerialPool())
+        assert resumed.population == search.population
+
+
+class TestCommand:
+    ARGS = ["--population", "4", "--games", "4", "--target", "5", "--seed", "1"]
+    ARGS += ["--validation-games", "4", "--max-ticks", "300", "--workers", "1"]
+
+    @pytest.mark.parametrize(["elite"], [(0,), (1,), (5,)])
+    def test_validation(self, elite, tmp_path):
+        """The best pilots of the last elite generations are validated"""
+        output = tmp_path / "rules.json"
+        result = CliRunner().invoke(
+            evolve.evolve_command,
+            self.ARGS
+            + ["--generations", "3", "--elite", str(elite), "--output", str(output)],
+        )
+        assert result.exit_code == 0
+        genome = json.loads(output.read_text())
+        check_genome(genome)
+        if not elite:
+            # SmartAutopilot only
+            assert genome == smart_genome()
+            best, smart = re.findall(r"(\d+\.\d) ticks", result.output)[-2:]
+            assert best == smart
+
+    def test_tournament(self):
+        result = CliRunner().invoke(
+            evolve.evolve_command, self.ARGS + ["--tournament", "5"]
+        )
+        assert result.exit_code == 2
+        assert "--tournament" in result.output
@@ -0,0 +1,177 @@
+import re
+
+import pytest
+from click.testing import CliRunner
+
+import foobarfactory
+from foobarfactory import ProgressLine
+from runtime import Runtime
+
+LATENCY = "Latency per round (us upper bound: rounds)"
+
+# Fixtures
+
+
+@pytest.fixture
+def invoke(monkeypatch, tmp_path):
+    """
+    Yield a function running the command with the given arguments, on a fresh
+    factory, without delay nor log file
+    """
+    monkeypatch.setattr(foobarfactory, "LOG_DIR", str(tmp_path))
+
+    def invoke(*args):
+        monkeypatch.setattr(foobarfactory, "FOOBARFACTORY", Runtime())
+        return CliRunner().invoke(
+            foobarfactory.foobarfactory, ["--delay", "0", "--log-level", "off", *args]
+        )
+
+    yield invoke
+
+
+class FakeClock:
+    """Clock moved forward by hand, in seconds"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def without_wall_time(output):
+    return re.sub(r"Wall time: \S+", "", output)
+
+
+def situation(tick, nbrobots, foos=0):
+    return {
+        "tick": tick,
+        "situation": {
+            "resources": {"foos": foos, "bars": 0, "foobars": 0, "money": 0},
+            "robots": [{}] * nbrobots,
+        },
+    }
+
+
+# Tests
+
+
+class TestHeadless:
+    @pytest.mark.parametrize(["flag"], [("--headless",), ("--quiet",)])
+    def test_summary(self, invoke, flag):
+        """Only the final situation is shown, without the robots"""
+        result = invoke(flag, "--target", "10", "--seed", "3")
+        assert result.exit_code == 0
+        summary, reached = result.output.splitlines()
+        assert re.fullmatch(
+            r"Tick (\d+)  Robots: \d+  Foos: \d+  Bars: \d+  Foobars: \d+  "
+            r"Money: \d+  Wall time: \d+\.\d{3}s",
+            summary,
+        )
+        tick = summary.split()[1]
+        assert reached == f"Number of robots reached after {tick} ticks"
+
+    def test_rendered(self, invoke):
+        result = invoke("--target", "4", "--seed", "3")
+        assert result.exit_code == 0
+        assert "Robot: {" in result.output
+        assert "Wall time" not in result.output
+
+    @pytest.mark.parametrize(["flag"], [("--headless",), ("--progress",)])
+    def test_interactive(self, invoke, flag):
+        result = invoke(flag, "--pilot", "interactive")
+        assert result.exit_code == 2
+        assert "The interactive pilot needs the situation displayed" in result.output
+
+    def test_progress(self, invoke):
+        """--progress implies --headless"""
+        result = invoke("--progress", "--target", "10", "--seed", "3")
+        assert result.exit_code == 0
+        progress, summary, reached, _ = result.output.split("\n")
+        refreshes = progress.split("\r")[1:]
+        assert refreshes[0].startswith("Tick 0  Robots: 2/10  ")
+        # the last refresh shows the final situation
+        tick, nbrobots = re.match(r"Tick (\d+)  Robots: (\d+)", summary).groups()
+        assert refreshes[-1].startswith(f"Tick {tick}  Robots: {nbrobots}/10  ")
+        assert reached == f"Number of robots reached after {tick} ticks"
+        assert "Robot: {" not in result.output
+
+
+class TestProgressLine:
+    def test_interval(self, capsys):
+        clock = FakeClock()
+        progress = ProgressLine(10, interval=0.2, clock=clock)
+        progress.update(situation(0, 2))
+        clock.now = 0.1
+        progress.update(situation(1, 2))
+        clock.now = 0.2
+        progress.update(situation(2, 2))
+        clock.now = 0.3
+        progress.update(situation(3, 2))
+        progress.update(situation(4, 2), force=True)
+        progress.finish(situation(5, 3))
+        refreshes = capsys.readouterr().out.split("\r")[1:]
+        assert [line.split("  ")[0] for line in refreshes] == [
+            "Tick 0",
+            "Tick 2",
+            "Tick 4",
+            "Tick 5",
+        ]
+        assert refreshes[-1].endswith("\n")
+
+    def test_erase(self, capsys):
+        """A shorter line covers the whole previous one"""
+        progress = ProgressLine(100, interval=0, clock=FakeClock())
+        progress.update(situation(1000, 10, foos=123))
+        progress.update(situation(7, 2, foos=1))
+        first, second = capsys.readouterr().out.split("\r")[1:]
+        assert len(second) == len(first)
+        line = "Tick 7  Robots: 2/100  Foos: 1  Bars: 0  Foobars: 0  Money: 0"
+        assert second == line.ljust(len(first))
+
+
+class TestProfile:
+    def test_profile(self, invoke):
+        """The report of the phases follows the summary"""
+        result = invoke("--headless", "--profile", "--target", "6", "--seed", "3")
+        assert result.exit_code == 0
+        lines = result.output.split("\n")
+        assert lines[1].startswith("Number of robots reached after")
+        assert lines[2].startswith("Rounds: ")
+        assert lines[3].split() == [
+            "phase",
+            "calls",
+            "total",
+            "s",
+            "mean",
+            "us",
+            "share",
+        ]
+        phases = {line.split()[0] for line in lines[4 : lines.index(LATENCY)]}
+        assert {"pilot", "log", "render"} <= phases
+        assert any(line.startswith("round ") for line in lines)
+
+    def test_stacks(self, invoke, tmp_path):
+        stacks = tmp_path / "stacks.txt"
+        result = invoke("--headless", "--profile-stacks", str(stacks), "--seed", "3")
+        assert result.exit_code == 0
+        assert "Rounds: " in result.output
+        assert stacks.exists()
+
+
+class TestStream:
+    @pytest.mark.parametrize(["pilot"], [("smart",), ("dumb",)])
+    def test_stream(self, invoke, pilot):
+        """The pilot fed with the changes plays the same game"""
+        args = ["--headless", "--pilot", pilot, "--target", "10", "--seed", "3"]
+        streamed = invoke("--stream", *args)
+        assert streamed.exit_code == 0
+        assert "Number of robots reached after" in streamed.output
+        assert without_wall_time(streamed.output) == without_wall_time(
+            invoke(*args).output
+        )
+
+    def test_stream_pilot(self, invoke):
+        result = invoke("--stream", "--pilot", "mcts")
+        assert result.exit_code == 2
+        assert "Only the smart and dumb pilots read a stream" in result.output
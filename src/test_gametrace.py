@@ -0,0 +1,154 @@
+import pytest
+from click.testing import CliRunner
+
+import gametrace
+from gametrace import TraceException, TraceReader, TraceRecorder
+from pilots import SmartAutopilot
+from runtime import Runtime
+from simulate import play
+
+TARGET = 12
+
+
+# Fixtures
+
+
+def record(path, keyframe_every, seed=3):
+    """Record a seeded game in path, return the runtime which played it"""
+    runtime = Runtime(tick_delay=0, seed=seed)
+    recorder = TraceRecorder(open(path, "wb"), keyframe_every)
+    runtime.set_recorder(recorder)
+    play(SmartAutopilot(), TARGET, runtime)
+    recorder.close(runtime.display()["tick"])
+    return runtime
+
+
+def layout(factory):
+    """Pool of the ready robots, as indexes in the fleet"""
+    indexes = {id(bot): index for index, bot in enumerate(factory.robots)}
+    return [
+        (acttype, [indexes[id(bot)] for bot in bots])
+        for acttype, bots in factory.ready_layout()
+    ]
+
+
+@pytest.fixture
+def trace(tmp_path):
+    """Yield the path of a trace with a keyframe every 5 rounds, and its runtime"""
+    path = str(tmp_path / "game.trace")
+    runtime = record(path, 5)
+    yield path, runtime
+
+
+# Tests
+
+
+class TestTrace:
+    def test_replay(self, trace):
+        path, runtime = trace
+        tick, factory = TraceReader(path).replay()
+        assert tick == runtime.display()["tick"]
+        assert factory.to_dict() == runtime.display()["situation"]
+        assert len(factory.robots) >= TARGET
+
+    def test_keyframes(self, trace):
+        path, runtime = trace
+        reader = TraceReader(path)
+        rounds = list(reader.rounds())
+        assert len(reader.keyframes) == (len(rounds) + 4) // 5
+        assert reader.keyframes[0][0] == 0
+        assert reader.end_tick == runtime.display()["tick"]
+
+    def test_factory_at(self, trace, tmp_path):
+        path, _ = trace
+        reader = TraceReader(path)
+        # the same game with only the first keyframe, replayed from the start
+        single_path = str(tmp_path / "single.trace")
+        record(single_path, 10**6)
+        single = TraceReader(single_path)
+        assert len(single.keyframes) == 1
+        keyframe_ticks = [tick for tick, _ in reader.keyframes]
+        ticks = (
+            [
+                (first + second) // 2
+                for first, second in zip(keyframe_ticks, keyframe_ticks[1:])
+            ]
+            + keyframe_ticks
+            + [reader.end_tick]
+        )
+        for tick in ticks:
+            factory, expected = reader.factory_at(tick), single.factory_at(tick)
+            assert factory.to_dict() == expected.to_dict()
+            assert layout(factory) == layout(expected)
+        assert (
+            reader.factory_at(reader.end_tick).to_dict() == reader.replay()[1].to_dict()
+        )
+
+    def test_factory_at_before_start(self, trace):
+        path, _ = trace
+        with pytest.raises(TraceException):
+            TraceReader(path).factory_at(-1)
+
+    def test_truncated(self, trace, tmp_path):
+        path, _ = trace
+        with open(path, "rb") as tracefile:
+            data = tracefile.read()
+        truncated = tmp_path / "truncated.trace"
+        truncated.write_bytes(data[:-3])
+        with pytest.raises(TraceException):
+            TraceReader(str(truncated))
+
+    def test_truncated_keyframe(self, trace):
+        path, _ = trace
+        reader = TraceReader(path)
+        _, offset = reader.keyframes[-1]
+        payload = bytes(next(reader._records(offset))[2])
+        # in the pool of the ready robots, in the robots, in the resources
+        for size in (
+            len(payload) - 2,
+            gametrace.KEYFRAME.size + gametrace.ROBOT.size + 3,
+            gametrace.KEYFRAME.size - 1,
+        ):
+            with pytest.raises(TraceException):
+                gametrace.decode_keyframe(payload[:size])
+
+    def test_truncated_round(self, trace):
+        path, _ = trace
+        reader = TraceReader(path)
+        for _, kind, payload in reader._records(gametrace.HEADER.size):
+            if kind == gametrace.KIND_ROUND and len(payload) > gametrace.ROUND.size:
+                break
+        with pytest.raises(TraceException):
+            gametrace.decode_round(bytes(payload)[:-1])
+
+    @pytest.mark.parametrize(
+        ["header"],
+        [
+            (gametrace.HEADER.pack(gametrace.MAGIC, gametrace.VERSION - 1),),
+            (gametrace.HEADER.pack(b"FBFX", gametrace.VERSION),),
+        ],
+    )
+    def test_wrong_header(self, trace, tmp_path, header):
+        path, _ = trace
+        with open(path, "rb") as tracefile:
+            data = tracefile.read()
+        wrong = tmp_path / "wrong.trace"
+        wrong.write_bytes(header + data[gametrace.HEADER.size :])
+        with pytest.raises(TraceException):
+            TraceReader(str(wrong))
+
+    def test_without_keyframe(self, tmp_path):
+        path = tmp_path / "empty.trace"
+        recorder = TraceRecorder(open(path, "wb"))
+        recorder.close(0)
+        with pytest.raises(TraceException):
+            TraceReader(str(path))
+
+    def test_replay_command(self, trace):
+        path, runtime = trace
+        result = CliRunner().invoke(gametrace.replay, [path, "--tick", "10"])
+        assert result.exit_code == 0
+        assert result.output.startswith("Tick 10  Robots: ")
+        result = CliRunner().invoke(gametrace.replay, [path])
+        assert result.exit_code == 0
+        assert f"Tick {runtime.display()['tick']}  " in result.output
@@ -0,0 +1,171 @@
+import pytest
+
+from mcts import MctsAutopilot, legal_decisions, rollout, run_until_ready
+from model import activities
+from model.constants import (
+    ASSEMBLEFOOBAR,
+    BUYROBOT,
+    MINEBAR,
+    MINEFOO,
+    SELLFOOBAR,
+)
+from model.factory import Factory
+from model.resources import ResourceLedger
+from pilots import FactoryPilot, SmartAutopilot
+from runtime import Runtime
+from simulate import play
+
+TARGET = 4
+
+
+# Fixtures
+
+
+@pytest.fixture
+def pilot():
+    """Yield a pilot playing its rollouts in the calling process"""
+    pilot = MctsAutopilot(TARGET, rollouts=24, workers=0, scenarios=2, seed=0)
+    yield pilot
+    pilot.close()
+
+
+def activity_type(descriptor):
+    return descriptor[0] if type(descriptor) is tuple else descriptor
+
+
+# Tests
+
+
+class TestRunUntilReady:
+    def test_ready(self):
+        assert run_until_ready(Factory(seed=0), 3) == 3
+
+    def test_force_one_next(self):
+        assert run_until_ready(Factory(seed=0), 3, force_one_next=True) == 4
+
+    def test_next_event(self):
+        factory = Factory(seed=0)
+        factory.set_activities(3, activities.MineFoo(), activities.MineFoo())
+        # the robots complete their activity at tick 4
+        assert run_until_ready(factory, 3) == 4
+        assert factory.count_ready() == 2
+        assert factory.resources["foos"] == 2
+
+    def test_next_event_changing_activity(self):
+        factory = Factory(1, seed=0)
+        factory.set_activities(0, activities.MineFoo())
+        run_until_ready(factory, 0)
+        factory.set_activities(1, activities.MineBar())
+        # 5 ticks to change activity, then a MineBar of up to 2 ticks
+        assert 6 <= run_until_ready(factory, 1) <= 8
+
+
+class TestLegalDecisions:
+    @pytest.mark.parametrize(
+        ["resources", "last", "expected"],
+        [
+            (ResourceLedger(), -1, [MINEFOO, MINEBAR, None]),
+            (ResourceLedger(), MINEBAR, [MINEBAR, None]),
+            (
+                ResourceLedger(foos=6, bars=1, foobars=1, money=3),
+                -1,
+                [MINEFOO, MINEBAR, ASSEMBLEFOOBAR, SELLFOOBAR, BUYROBOT, None],
+            ),
+            (
+                ResourceLedger(foos=6, bars=1, foobars=1, money=3),
+                SELLFOOBAR,
+                [SELLFOOBAR, BUYROBOT, None],
+            ),
+            (ResourceLedger(foos=6, money=2), ASSEMBLEFOOBAR, [None]),
+        ],
+    )
+    def test_legal_decisions(self, resources, last, expected):
+        assert legal_decisions(resources, last) == expected
+
+
+class TestRollout:
+    @pytest.mark.parametrize(["seed"], [(0,), (1,), (2,)])
+    def test_from_start(self, seed):
+        """A rollout from the start plays the game of the rollout policy"""
+        factory = Factory(seed=0)
+        ticks = rollout(
+            factory.snapshot(), 0, [], tuple(factory.resources.slots), 2, 6, seed
+        )
+        assert ticks == play(SmartAutopilot(), 6, seed=seed)
+
+    def test_round_started(self):
+        """The descriptors chosen are played with the ones of the rollout policy"""
+        factory = Factory(seed=0)
+        state = factory.snapshot()
+        slots = tuple(factory.resources.slots)
+        ticks = rollout(state, 0, [MINEBAR], slots, 1, 3, 5)
+        assert ticks == rollout(state, 0, [MINEBAR], slots, 1, 3, 5)
+        assert ticks > 0
+
+    def test_target_reached(self):
+        factory = Factory(3, seed=0)
+        assert rollout(factory.snapshot(), 7, [], (0,) * 5, 3, 3, 0) == 8
+
+
+class TestMctsAutopilot:
+    def test_budget(self):
+        with pytest.raises(ValueError):
+            MctsAutopilot(TARGET, rollouts=None)
+
+    def test_game(self, pilot):
+        """Each round is feasible, and the tree is kept from a round to the next"""
+        runtime = Runtime(tick_delay=0, seed=1)
+        situation = runtime.display()
+        reused = 0
+        while len(situation["situation"]["robots"]) < TARGET:
+            previous = pilot._root if pilot._tick is not None else None
+            descriptors = pilot.get_activities(situation)
+            ready = situation["situation"]["robots"]
+            nbready = sum(1 for bot in ready if bot["status"] == 0)
+            assert len(descriptors) <= nbready
+            resources = ResourceLedger.from_dict(situation["situation"]["resources"])
+            for acttype in map(activity_type, descriptors):
+                assert acttype in resources.feasible_types()
+                FactoryPilot._reserve(resources, acttype)
+            if previous is not None and previous.visits:
+                # the new root is the child reached by the decisions taken
+                node = previous
+                for acttype in map(activity_type, descriptors):
+                    node = node.children.get(acttype)
+                    if node is None:
+                        break
+                if node is not None and len(descriptors) < nbready:
+                    node = node.children.get(None)
+                if node is not None:
+                    assert pilot._root is node
+                    reused += 1
+            if descriptors:
+                runtime.program(*descriptors)
+                runtime.run()
+            else:
+                runtime.run(force_one_next=True)
+            situation = runtime.display()
+        assert reused
+        assert pilot._pool is None
+
+    def test_another_game(self, pilot):
+        runtime = Runtime(tick_delay=0, seed=1)
+        situation = runtime.display()
+        runtime.program(*pilot.get_activities(situation))
+        runtime.run()
+        pilot.get_activities(runtime.display())
+        kept = pilot._root
+        # back to the start: the tree of the previous game is dropped
+        pilot.get_activities(situation)
+        assert pilot._tick == 0
+        assert all(pilot._root is not child for child in kept.children.values())
+
+    def test_reproducible(self):
+        situation = Runtime(tick_delay=0, seed=1).display()
+        chosen = [
+            MctsAutopilot(
+                TARGET, rollouts=16, workers=0, scenarios=2, seed=3
+            ).get_activities(situation)
+            for _ in range(0, 2)
+        ]
+        assert chosen[0] == chosen[1]
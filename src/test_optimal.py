@@ -0,0 +1,263 @@
+import math
+
+import numpy as np
+import pytest
+
+import optimal
+from model import activities, factory
+from model.constants import ASSEMBLEFOOBAR, BUYROBOT, MINEBAR, MINEFOO, SELLFOOBAR
+from optimal import (
+    BUSY_CODES,
+    IDLE_CODES,
+    WAIT,
+    OptimalPilot,
+    abstract_state,
+    advance,
+    assign,
+    pack,
+)
+from runtime import Runtime
+from simulate import play
+
+IDLE = IDLE_CODES[None]
+START = (0, 0, 0, 0, (IDLE, IDLE))
+# the smallest caps which allow to buy a robot: solved in a few seconds
+CAPS = optimal.MIN_CAPS
+LARGE_CAPS = (50, 20, 10, 20)
+
+
+# Fixtures
+
+
+@pytest.fixture(scope="module")
+def table():
+    """Yield the policy table of the target 3 with tight caps"""
+    yield optimal.solve(3, CAPS)
+
+
+def busy(acttype, remaining, sold=0):
+    return BUSY_CODES[(acttype, remaining, sold)]
+
+
+def state(foos=0, bars=0, foobars=0, money=0, robots=(IDLE, IDLE)):
+    return (foos, bars, foobars, money, tuple(sorted(robots)))
+
+
+# Tests
+
+
+class TestPack:
+    def test_resources(self):
+        assert pack((1, 2, 3, 4, ())) == 1 | 2 << 6 | 3 << 11 | 4 << 15
+
+    def test_robots(self):
+        assert pack(state(robots=(IDLE,))) == 1 << 20
+        assert pack(state(robots=(IDLE, 3))) == 1 << 20 | 4 << 27
+
+    def test_distinct(self):
+        states = [
+            state(),
+            state(robots=(IDLE,)),
+            state(robots=(IDLE, IDLE, IDLE)),
+            state(foos=1),
+            state(robots=(IDLE, IDLE_CODES[MINEFOO])),
+            state(robots=(IDLE, busy(MINEBAR, 2))),
+        ]
+        assert len({pack(value) for value in states}) == len(states)
+
+
+class TestAdvance:
+    def test_idle(self):
+        assert advance(START, LARGE_CAPS) == [(1.0, START)]
+
+    def test_progress(self):
+        before = state(robots=(busy(MINEFOO, 1), busy(MINEBAR, 3)))
+        after = state(foos=1, robots=(IDLE_CODES[MINEFOO], busy(MINEBAR, 2)))
+        assert advance(before, LARGE_CAPS) == [(1.0, after)]
+
+    def test_sell(self):
+        before = state(robots=(busy(SELLFOOBAR, 1, 4),))
+        after = state(money=4, robots=(IDLE_CODES[SELLFOOBAR],))
+        assert advance(before, LARGE_CAPS) == [(1.0, after)]
+
+    def test_buy(self):
+        before = state(robots=(busy(BUYROBOT, 1),))
+        after = state(robots=(IDLE, IDLE_CODES[BUYROBOT]))
+        assert advance(before, LARGE_CAPS) == [(1.0, after)]
+
+    def test_caps(self):
+        before = state(foos=6, money=5, robots=(busy(MINEFOO, 1),))
+        ((probability, after),) = advance(before, (6, 3, 3, 3))
+        assert after[:4] == (6, 0, 0, 3)
+
+    @pytest.mark.parametrize(["assemblies"], [(1,), (2,), (3,)])
+    def test_assemblies(self, assemblies):
+        before = state(bars=1, robots=(busy(ASSEMBLEFOOBAR, 1),) * assemblies)
+        outcomes = advance(before, LARGE_CAPS)
+        assert len(outcomes) == assemblies + 1
+        assert math.isclose(sum(probability for probability, _ in outcomes), 1)
+        for won, (probability, after) in enumerate(outcomes):
+            # a failed assembly gives its bar back
+            assert after[:4] == (0, 1 + assemblies - won, won, 0)
+            assert math.isclose(
+                probability,
+                math.factorial(assemblies)
+                / math.factorial(won)
+                / math.factorial(assemblies - won)
+                * optimal.ASSEMBLY_SUCCESS**won
+                * (1 - optimal.ASSEMBLY_SUCCESS) ** (assemblies - won),
+            )
+
+
+class TestAssign:
+    @pytest.mark.parametrize(
+        ["before", "acttype"],
+        [
+            (state(robots=(busy(MINEFOO, 1),)), MINEFOO),
+            (state(foos=1), ASSEMBLEFOOBAR),
+            (state(bars=1), ASSEMBLEFOOBAR),
+            (state(), SELLFOOBAR),
+            (state(foos=5, money=3), BUYROBOT),
+            (state(foos=6, money=2), BUYROBOT),
+        ],
+    )
+    def test_impossible(self, before, acttype):
+        assert assign(before, acttype) is None
+
+    def test_minefoo(self):
+        assert assign(START, MINEFOO) == [(1.0, state(robots=(IDLE, busy(MINEFOO, 1))))]
+
+    def test_minebar(self):
+        outcomes = assign(START, MINEBAR)
+        assert math.isclose(sum(probability for probability, _ in outcomes), 1)
+        assert {after[4] for _, after in outcomes} == {
+            tuple(sorted((IDLE, busy(MINEBAR, ticks))))
+            for ticks, _ in optimal.TICKS[MINEBAR]
+        }
+
+    def test_same_type_first(self):
+        before = state(robots=(IDLE_CODES[MINEBAR], IDLE_CODES[MINEFOO]))
+        ((_, after),) = assign(before, MINEFOO)
+        assert after[4] == tuple(sorted((IDLE_CODES[MINEBAR], busy(MINEFOO, 1))))
+
+    def test_change(self):
+        before = state(robots=(IDLE_CODES[MINEBAR],))
+        ((_, after),) = assign(before, MINEFOO)
+        assert after[4] == (busy(MINEFOO, optimal.CHANGE_TICKS + 1),)
+
+    def test_assemble(self):
+        ((_, after),) = assign(state(foos=2, bars=1), ASSEMBLEFOOBAR)
+        assert after[:4] == (1, 0, 0, 0)
+
+    def test_sell(self):
+        ((_, after),) = assign(state(foobars=7), SELLFOOBAR)
+        assert after[2] == 2
+        assert busy(SELLFOOBAR, 10, 5) in after[4]
+
+    def test_buy(self):
+        """A robot bought without delay is available at once, as its buyer"""
+        ((_, after),) = assign(state(foos=7, money=4), BUYROBOT)
+        assert after == state(
+            foos=1, money=1, robots=(IDLE, IDLE, IDLE_CODES[BUYROBOT])
+        )
+
+    def test_buy_change(self):
+        before = state(foos=6, money=3, robots=(IDLE_CODES[MINEFOO],))
+        ((_, after),) = assign(before, BUYROBOT)
+        assert after == state(robots=(busy(BUYROBOT, optimal.CHANGE_TICKS),))
+
+
+class TestAbstractState:
+    def test_start(self):
+        assert abstract_state(factory.Factory(seed=0).to_dict(), 0) == START
+
+    def test_busy(self):
+        fac = factory.Factory(2, seed=0)
+        fac.set_activities(0, activities.MineFoo(), activities.MineFoo())
+        fac.run(0)
+        fac.run(1)
+        fac.set_activities(1, activities.MineBar())
+        bar = fac.robots[1].current_activity or fac.robots[0].current_activity
+        remaining = optimal.CHANGE_TICKS + math.ceil(bar.duration)
+        assert abstract_state(fac.to_dict(), 1) == state(
+            foos=2, robots=(IDLE_CODES[MINEFOO], busy(MINEBAR, remaining))
+        )
+
+    def test_too_many_robots(self):
+        fac = factory.Factory(optimal.MAX_ROBOTS + 1, seed=0)
+        assert abstract_state(fac.to_dict(), 0) is None
+
+    def test_too_many_resources(self):
+        situation = factory.Factory(seed=0).to_dict()
+        situation["resources"]["foos"] = 2 ** optimal.RESOURCE_BITS[0]
+        assert abstract_state(situation, 0) is None
+
+
+class TestSolve:
+    @pytest.mark.parametrize(
+        ["target", "caps"],
+        [
+            (2, CAPS),
+            (optimal.MAX_TARGET + 1, CAPS),
+            (3, (64, 1, 1, 3)),
+            (3, (5, 1, 1, 3)),
+            (3, (6, 1, 1, 2)),
+        ],
+    )
+    def test_invalid(self, target, caps):
+        with pytest.raises(ValueError):
+            optimal.solve(target, caps)
+
+    def test_table(self, table):
+        assert table.dtype == optimal.TABLE_DTYPE
+        assert (table["key"][1:] > table["key"][:-1]).all()
+        start = np.searchsorted(table["key"], pack(START))
+        assert table["key"][start] == pack(START)
+        # mining foos then bars, assembling, selling then buying takes a while
+        assert 20 < table["ticks"][start] < 100
+        assert (table["ticks"] >= 0).all()
+
+    def test_save_load(self, table, tmp_path):
+        path = str(tmp_path / "policy.npy")
+        optimal.save(table, path)
+        loaded = optimal.load(path)
+        assert isinstance(loaded, np.memmap)
+        assert np.array_equal(loaded, table)
+        pilot = OptimalPilot(path)
+        assert pilot.decision(START) == OptimalPilot(table).decision(START)
+
+    def test_load_other(self, tmp_path):
+        path = str(tmp_path / "other.npy")
+        np.save(path, np.zeros(3))
+        with pytest.raises(ValueError):
+            optimal.load(path)
+
+
+class TestOptimalPilot:
+    def test_decision(self, table):
+        pilot = OptimalPilot(table)
+        assert pilot.decision(START) in (WAIT, MINEFOO, MINEBAR)
+        # more robots than the target of the table
+        assert pilot.decision(state(robots=(IDLE,) * 3)) is None
+
+    def test_get_activities(self, table):
+        pilot = OptimalPilot(table)
+        situation = Runtime(tick_delay=0, seed=0).display()
+        decision = pilot.decision(START)
+        assert [
+            act[0] if type(act) is tuple else act
+            for act in pilot.get_activities(situation)
+        ][:1] == ([] if decision == WAIT else [decision])
+
+    def test_fallback(self, table):
+        pilot = OptimalPilot(table)
+        runtime = Runtime(tick_delay=0, seed=0)
+        runtime.runner.factory.resources.credit(0, 40)
+        situation = runtime.display()
+        assert pilot.get_activities(situation) == pilot.fallback.get_activities(
+            situation
+        )
+
+    @pytest.mark.parametrize(["seed"], [(0,), (1,)])
+    def test_play(self, table, seed):
+        assert play(OptimalPilot(table), 3, seed=seed) > 0
@@ -0,0 +1,176 @@
+import pytest
+
+from model import lockstep
+from model.constants import (
+    BUYROBOT,
+    MINEBAR,
+    MINEFOO,
+    READY,
+    SELLFOOBAR,
+)
+from pilots import CompiledPilot, DumbAutopilot, SmartAutopilot, StreamPilot
+from runtime import Runtime
+from simulate import play
+
+TARGET = 30
+
+
+class RecordingPilot:
+    """Pilot recording the activities chosen by pilot at each round"""
+
+    def __init__(self, pilot) -> None:
+        self.pilot = pilot
+        self.rounds = []
+
+    def get_activities(self, situation):
+        activities = self.pilot.get_activities(situation)
+        self.rounds.append((situation["tick"], activities))
+        return activities
+
+
+class CountingPilot(SmartAutopilot):
+    """SmartAutopilot counting the rounds it decides from the situation"""
+
+    def __init__(self, **thresholds) -> None:
+        super().__init__(**thresholds)
+        self.calls = 0
+
+    def get_activities(self, situation):
+        self.calls += 1
+        return super().get_activities(situation)
+
+
+def situation(nbready, foos=0, bars=0, foobars=0, money=0):
+    """Situation of a round with nbready robots available"""
+    return {
+        "tick": 0,
+        "situation": {
+            "resources": {
+                "foos": foos,
+                "bars": bars,
+                "foobars": foobars,
+                "money": money,
+            },
+            "robots": [{"status": READY}] * nbready,
+        },
+    }
+
+
+def record(pilot, target, seed, runtime=None):
+    """
+    Play a seeded game, on runtime if given, return its ticks and the activities of
+    its rounds
+    """
+    recording = RecordingPilot(pilot)
+    if runtime is None:
+        runtime = Runtime(tick_delay=0, seed=seed)
+    return play(recording, target, runtime), recording.rounds
+
+
+# Tests
+
+
+class TestCompiledPilot:
+    @pytest.mark.parametrize(["seed"], [(0,), (1,), (2,)])
+    @pytest.mark.parametrize(
+        ["pilot"],
+        [
+            (SmartAutopilot(sell_max=2),),
+            (SmartAutopilot(foo_stock=9, bar_stock=2, sell_from=3, sell_max=3),),
+            (DumbAutopilot(TARGET, sell_max=1),),
+        ],
+    )
+    def test_thresholds(self, pilot, seed):
+        """The compiled pilot plays the games of the pilot it wraps"""
+        assert record(CompiledPilot(pilot), TARGET, seed) == record(pilot, TARGET, seed)
+
+    @pytest.mark.parametrize(["seed"], [(0,), (1,)])
+    def test_domain(self, seed):
+        """Inside the domain the table decides, outside the pilot"""
+        inside = CountingPilot(sell_max=3)
+        assert record(CompiledPilot(inside), TARGET, seed) == record(
+            SmartAutopilot(sell_max=3), TARGET, seed
+        )
+        assert inside.calls == 0
+        # more robots than the 31 of DEFAULT_BOUNDS
+        outside = CountingPilot(sell_max=3)
+        assert record(CompiledPilot(outside), 40, seed) == record(
+            SmartAutopilot(sell_max=3), 40, seed
+        )
+        assert outside.calls > 0
+
+    def test_out_of_domain_resources(self):
+        pilot = CountingPilot()
+        rich = situation(3, foos=100, foobars=2, money=1)
+        assert CompiledPilot(pilot).get_activities(rich) == [
+            (SELLFOOBAR, {"nbtosell": 2}),
+            MINEBAR,
+            MINEBAR,
+        ]
+        assert pilot.calls == 1
+
+    def test_round_spending(self):
+        """The robots of a round decide from what the previous ones left"""
+        pilot = CompiledPilot(SmartAutopilot(sell_max=4))
+        activities = pilot.get_activities(situation(7, foos=14, foobars=7, money=9))
+        assert activities == [
+            BUYROBOT,
+            BUYROBOT,
+            (SELLFOOBAR, {"nbtosell": 4}),
+            (SELLFOOBAR, {"nbtosell": 3}),
+            MINEFOO,
+            MINEFOO,
+            MINEFOO,
+        ]
+        assert activities == SmartAutopilot(sell_max=4).get_activities(
+            situation(7, foos=14, foobars=7, money=9)
+        )
+
+    def test_nothing(self):
+        """The next robots do nothing either"""
+        # past the beginning, the dumb pilot only buys robots
+        pilot = CompiledPilot(DumbAutopilot(TARGET))
+        assert pilot.get_activities(situation(3, foos=7, money=2)) == []
+        assert pilot.get_activities(situation(3, foos=7, money=3)) == [BUYROBOT]
+
+    def test_sell_max(self):
+        assert CompiledPilot(SmartAutopilot(sell_max=2)).sell_max == 2
+        assert CompiledPilot(SmartAutopilot()).sell_max == lockstep.MAX_SOLD
+
+
+class TestStreamPilot:
+    @pytest.mark.parametrize(["seed"], [(0,), (1,), (2,)])
+    @pytest.mark.parametrize(["pilot"], [(SmartAutopilot(),), (DumbAutopilot(TARGET),)])
+    def test_game(self, pilot, seed):
+        """The pilot fed with the changes plays the game of the situations"""
+        runtime = Runtime(tick_delay=0, seed=seed)
+        stream = StreamPilot(pilot, runtime.change_stream())
+        assert record(stream, TARGET, seed, runtime) == record(pilot, TARGET, seed)
+
+    def test_counts(self):
+        runtime = Runtime(tick_delay=0, seed=0)
+        pilot = StreamPilot(SmartAutopilot(), runtime.change_stream())
+        play(pilot, 5, runtime)
+        pilot.update(pilot.stream.read())
+        situation = runtime.display()["situation"]
+        assert pilot.resources.to_dict() == situation["resources"]
+        assert pilot.nbrobots == len(situation["robots"])
+        assert pilot.nbready == sum(
+            bot["status"] == READY for bot in situation["robots"]
+        )
+
+    def test_reset(self):
+        """The counts follow a factory restored to a previous situation"""
+        runtime = Runtime(tick_delay=0, seed=0)
+        factory = runtime.runner.factory
+        pilot = StreamPilot(SmartAutopilot(), runtime.change_stream())
+        play(pilot, 4, runtime)
+        state = factory.snapshot()
+        before = runtime.display()
+        play(pilot, 6, runtime)
+        factory.restore(state)
+        activities = pilot.get_activities()
+        assert activities == SmartAutopilot().get_activities(before)
+        assert pilot.nbrobots == len(before["situation"]["robots"])
+        assert pilot.resources.to_dict() == before["situation"]["resources"]
+        assert pilot.nbready == factory.count_ready()
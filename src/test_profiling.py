@@ -0,0 +1,169 @@
+import signal
+import sys
+import time
+
+import pytest
+
+from profiling import NullProfiler, PhaseProfiler, StackSampler, latency_bucket
+
+
+class FakeClock:
+    """Clock moved forward by hand, in seconds"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+# Fixtures
+
+
+@pytest.fixture
+def clock():
+    """Yield a clock standing still until moved"""
+    yield FakeClock()
+
+
+@pytest.fixture
+def profiler(clock):
+    """
+    Yield a profiler of two rounds:
+
+    - pilot 1 ms, run 3 ms, pilot 1 ms, then 2 ms out of any phase
+    - run 3 ms
+    """
+    profiler = PhaseProfiler(clock)
+    for name, seconds in (("pilot", 0.001), ("run", 0.003), ("pilot", 0.001)):
+        with profiler.phase(name):
+            clock.now += seconds
+    clock.now += 0.002
+    profiler.end_round()
+    with profiler.phase("run"):
+        clock.now += 0.003
+    profiler.end_round()
+    yield profiler
+
+
+# Tests
+
+
+class TestLatencyBucket:
+    @pytest.mark.parametrize(
+        ["seconds", "bound"],
+        [
+            (0, 1),
+            (0.5e-6, 1),
+            (1e-6, 1),
+            (1.5e-6, 2),
+            (2e-6, 2),
+            (3e-6, 4),
+            (4e-6, 4),
+            (0.001, 1024),
+            (0.5, 524288),
+        ],
+    )
+    def test_bucket(self, seconds, bound):
+        assert latency_bucket(seconds) == bound
+
+
+class TestPhaseProfiler:
+    def test_totals(self, profiler):
+        report = profiler.report()
+        assert report["rounds"] == 2
+        # the longest phase first
+        assert list(report["phases"]) == ["run", "pilot"]
+        assert report["phases"]["run"]["calls"] == 2
+        assert report["phases"]["run"]["seconds"] == pytest.approx(0.006)
+        assert report["phases"]["pilot"]["calls"] == 2
+        assert report["phases"]["pilot"]["seconds"] == pytest.approx(0.002)
+
+    def test_histograms(self, profiler):
+        """A phase is counted once per round, with its time during the round"""
+        assert profiler.report()["histograms"] == {
+            "pilot": {2048: 1},
+            "run": {4096: 2},
+            # 7 ms, then 3 ms
+            "round": {4096: 1, 8192: 1},
+        }
+
+    def test_exception(self, profiler, clock):
+        """A phase ending with an exception is timed too"""
+        with pytest.raises(RuntimeError):
+            with profiler.phase("pilot"):
+                clock.now += 0.001
+                raise RuntimeError()
+        assert profiler.calls["pilot"] == 3
+
+    def test_format_report(self, profiler):
+        assert profiler.format_report() == [
+            "Rounds: 2",
+            "phase              calls     total s     mean us   share",
+            "run                    2       0.006      3000.0   75.0%",
+            "pilot                  2       0.002      1000.0   25.0%",
+            "Latency per round (us upper bound: rounds)",
+            "pilot         2048: 1",
+            "run           4096: 2",
+            "round         4096: 1  8192: 1",
+        ]
+
+    def test_format_empty(self):
+        assert PhaseProfiler().format_report() == [
+            "Rounds: 0",
+            "phase              calls     total s     mean us   share",
+            "Latency per round (us upper bound: rounds)",
+        ]
+
+
+class TestNullProfiler:
+    def test_nothing(self):
+        profiler = NullProfiler()
+        assert not profiler.enabled
+        with profiler.phase("pilot") as phase:
+            pass
+        assert profiler.phase("run") is phase
+        assert profiler.end_round() is None
+        assert vars(profiler) == {}
+
+    def test_exception(self):
+        with pytest.raises(RuntimeError):
+            with NullProfiler().phase("pilot"):
+                raise RuntimeError()
+
+
+class TestStackSampler:
+    def test_dump(self, tmp_path):
+        sampler = StackSampler()
+
+        def inner():
+            sampler._sample(signal.SIGPROF, sys._getframe())
+
+        for _ in range(0, 2):
+            inner()
+        sampler._sample(signal.SIGPROF, sys._getframe())
+        path = tmp_path / "stacks.txt"
+        sampler.dump(str(path))
+        lines = path.read_text().splitlines()
+        # the most sampled stack first, the outermost frame first
+        assert len(lines) == 2
+        assert lines[0].endswith(
+            ";test_profiling.py:test_dump;test_profiling.py:inner 2"
+        )
+        assert lines[1].endswith(";test_profiling.py:test_dump 1")
+
+    @pytest.mark.skipif(
+        not hasattr(signal, "setitimer"), reason="Sampling needs a Unix timer"
+    )
+    def test_start_stop(self):
+        sampler = StackSampler(interval=0.001)
+        sampler.start()
+        try:
+            deadline = time.perf_counter() + 5
+            while not sampler.stacks and time.perf_counter() < deadline:
+                sum(range(0, 1000))
+        finally:
+            sampler.stop()
+        assert sampler.stacks
+        assert signal.getsignal(signal.SIGPROF) == signal.SIG_DFL
+        assert signal.getitimer(signal.ITIMER_PROF) == (0.0, 0.0)
@@ -0,0 +1,109 @@
+import json
+import logging
+
+import pytest
+
+from model import activities, factory, robots
+from model.constants import MINEFOO, READY, SCHEDULING
+from runlog import RecordQueueHandler, RunLog
+
+# Fixtures
+
+
+@pytest.fixture
+def logger(request):
+    """Return a logger of its own, not propagating to the root logger"""
+    logger = logging.getLogger(f"test_runlog.{request.node.name}")
+    logger.propagate = False
+    return logger
+
+
+def read_lines(path):
+    with open(path) as logfile:
+        return [json.loads(line) for line in logfile]
+
+
+# Tests
+
+
+class TestRunLog:
+    def test_rounds(self, logger, tmp_path):
+        path = tmp_path / "run.log"
+        run_log = RunLog.open(logger, str(path), every=2)
+        fac = factory.Factory(2, seed=0)
+        run_log.round({"tick": 0, "situation": fac.to_dict()})
+        fac.set_activities(0, activities.MineFoo(), activities.MineFoo())
+        run_log.round({"tick": 0, "situation": fac.to_dict()})
+        fac.run(0)
+        fac.run(1)
+        run_log.round({"tick": 1, "situation": fac.to_dict()})
+        run_log.round({"tick": 1, "situation": fac.to_dict()})
+        logger.warning("stopped")
+        run_log.round({"tick": 1, "situation": fac.to_dict()}, force=True)
+        run_log.close()
+        lines = read_lines(path)
+        for line in lines:
+            del line["time"]
+        assert lines == [
+            # the first round logged is written in full
+            {
+                "level": "INFO",
+                "round": 2,
+                "tick": 0,
+                "nbrobots": 2,
+                "resources": {"foos": 0, "bars": 0, "foobars": 0, "money": 0},
+                "robots": {
+                    "0": [SCHEDULING, MINEFOO, None, None],
+                    "1": [SCHEDULING, MINEFOO, None, None],
+                },
+            },
+            # then only what changed since the previous round logged
+            {
+                "level": "INFO",
+                "round": 4,
+                "tick": 1,
+                "nbrobots": 2,
+                "resources": {"foos": 2},
+                "robots": {
+                    "0": [READY, None, None, MINEFOO],
+                    "1": [READY, None, None, MINEFOO],
+                },
+            },
+            {"level": "WARNING", "msg": "stopped"},
+            # forced although not sampled, nothing changed
+            {"level": "INFO", "round": 5, "tick": 1, "nbrobots": 2},
+        ]
+        assert not any(
+            isinstance(handler, RecordQueueHandler) for handler in logger.handlers
+        )
+
+    def test_new_robots(self, logger, tmp_path):
+        path = tmp_path / "run.log"
+        run_log = RunLog.open(logger, str(path))
+        fac = factory.Factory(1, seed=0)
+        run_log.round({"tick": 0, "situation": fac.to_dict()})
+        fac.replace_robots(fac.robots + [robots.Robot()])
+        run_log.round({"tick": 0, "situation": fac.to_dict()})
+        run_log.close()
+        last = read_lines(path)[-1]
+        assert last["nbrobots"] == 2
+        assert last["robots"] == {"1": [READY, None, None, None]}
+
+    def test_level(self, logger, tmp_path):
+        path = tmp_path / "run.log"
+        run_log = RunLog.open(logger, str(path), level="warning")
+        run_log.round({"tick": 0, "situation": factory.Factory().to_dict()})
+        logger.error("failed")
+        run_log.close()
+        assert [line["msg"] for line in read_lines(path)] == ["failed"]
+        assert run_log.rounds == 1
+
+    def test_off(self, logger, tmp_path):
+        path = tmp_path / "run.log"
+        run_log = RunLog.open(logger, str(path), level="off")
+        run_log.round({"tick": 0, "situation": factory.Factory().to_dict()})
+        run_log.close()
+        assert not path.exists()
+        assert not any(
+            isinstance(handler, RecordQueueHandler) for handler in logger.handlers
+        )
@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+from pilots import SmartAutopilot
+from runtime import AsyncRuntime, autoplay
+from simulate import play
+
+TARGET = 5
+
+
+# Fixtures
+
+
+class AsyncPilot:
+    """Pilot whose get_activities is a coroutine, counting its calls"""
+
+    def __init__(self) -> None:
+        self.pilot = SmartAutopilot()
+        self.calls = 0
+
+    async def get_activities(self, situation):
+        self.calls += 1
+        await asyncio.sleep(0)
+        return self.pilot.get_activities(situation)
+
+
+def gather(loop, *coroutines):
+    """Run the coroutines concurrently in loop, return their results"""
+
+    async def main():
+        return await asyncio.gather(*coroutines)
+
+    return loop.run_until_complete(main())
+
+
+# Tests
+
+
+class TestAsyncRuntime:
+    def test_concurrent_games(self, loop):
+        """Games of one loop end as they would alone, sharing the wall time"""
+        seeds = [0, 1, 2, 3]
+        runtimes = [AsyncRuntime(tick_delay=0.002, seed=seed) for seed in seeds]
+        start = time.perf_counter()
+        ticks = gather(
+            loop, *(autoplay(runtime, SmartAutopilot(), TARGET) for runtime in runtimes)
+        )
+        elapsed = time.perf_counter() - start
+        assert ticks == [play(SmartAutopilot(), TARGET, seed=seed) for seed in seeds]
+        assert elapsed >= 0.002 * max(ticks)
+        # the delays overlap
+        assert elapsed < 0.002 * sum(ticks)
+
+    def test_no_drift(self, loop):
+        """A coroutine blocking the loop does not delay the ticks after it"""
+        runtime = AsyncRuntime(tick_delay=0.01, seed=0)
+
+        async def ticks():
+            for _ in range(0, 30):
+                await runtime.run(force_one_next=True, situation=False)
+
+        async def blocking():
+            await asyncio.sleep(0.02)
+            time.sleep(0.1)
+
+        start = time.perf_counter()
+        gather(loop, ticks(), blocking())
+        elapsed = time.perf_counter() - start
+        assert runtime.display()["tick"] == 30
+        # tick 30 is due 0.3s after the first run, the blocking time is caught up
+        assert 0.3 <= elapsed < 0.38
+
+    def test_set_tick_delay(self, loop):
+        runtime = AsyncRuntime(tick_delay=0.01, seed=0)
+        loop.run_until_complete(runtime.run(force_one_next=True))
+        assert runtime._origin is not None
+        runtime.set_tick_delay(0)
+        assert runtime._origin is None
+        assert runtime.tick_delay == 0
+
+    def test_program(self, loop):
+        runtime = AsyncRuntime(tick_delay=0, seed=0)
+        loop.run_until_complete(runtime.program(0, 1))
+        situation = loop.run_until_complete(runtime.run())
+        assert situation["resources"]["foos"] == 1
+        assert loop.run_until_complete(runtime.run(situation=False)) is None
+
+
+class TestAutoplay:
+    def test_awaited_pilot(self, loop):
+        pilot = AsyncPilot()
+        runtime = AsyncRuntime(tick_delay=0, seed=2)
+        tick = loop.run_until_complete(autoplay(runtime, pilot, TARGET))
+        assert tick == play(SmartAutopilot(), TARGET, seed=2)
+        assert pilot.calls > 0
+
+    def test_observer(self, loop):
+        situations = []
+        runtime = AsyncRuntime(tick_delay=0, seed=0)
+        tick = loop.run_until_complete(
+            autoplay(runtime, SmartAutopilot(), TARGET, situations.append)
+        )
+        # one call per round, the last one with the target reached
+        assert len(situations) > 1
+        assert [situation["tick"] for situation in situations] == sorted(
+            situation["tick"] for situation in situations
+        )
+        assert situations[-1]["tick"] == tick
+        assert len(situations[-1]["situation"]["robots"]) >= TARGET
+
+    def test_yield(self, loop):
+        """Without tick delay, the games of the loop still take turns"""
+        rounds = []
+        gather(
+            loop,
+            *(
+                autoplay(
+                    AsyncRuntime(tick_delay=0, seed=seed),
+                    SmartAutopilot(),
+                    TARGET,
+                    lambda situation, game=seed: rounds.append(game),
+                )
+                for seed in (0, 1)
+            )
+        )
+        assert rounds[:4] == [0, 1, 0, 1]
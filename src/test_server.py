@@ -0,0 +1,271 @@
+import asyncio
+
+import pytest
+
+import server as server_module
+from model.constants import BUYROBOT
+from server import GameClient, GameServer, ServerError
+
+# seconds to wait for an event before failing
+TIMEOUT = 5
+
+
+# Fixtures
+
+
+class BrokenPilot:
+    """Pilot buying a robot without the resources, once told to go"""
+
+    def __init__(self) -> None:
+        self.go = asyncio.Event()
+
+    async def get_activities(self, situation):
+        await self.go.wait()
+        return [BUYROBOT]
+
+
+def serve(loop, scenario, nbclients=1, **limits):
+    """
+    Run scenario(server, *clients) against a server started on a free port, with
+    nbclients clients connected
+    """
+
+    async def main():
+        server = GameServer(**limits)
+        host, port = await server.start()
+        clients = [await GameClient.connect(host, port) for _ in range(0, nbclients)]
+        try:
+            await scenario(server, *clients)
+        finally:
+            for client in clients:
+                await client.close()
+            await server.stop()
+
+    loop.run_until_complete(main())
+
+
+async def next_event(client):
+    return await asyncio.wait_for(client.next_event(), TIMEOUT)
+
+
+# Tests
+
+
+class TestGames:
+    def test_create_program_wait_state(self, loop):
+        async def scenario(server, client):
+            reply = await client.request("create", seed=1)
+            game = reply["game"]
+            assert reply["ok"]
+            state = await client.request("state", game=game)
+            assert state["tick"] == 0
+            assert len(state["situation"]["robots"]) == 2
+            state = await client.request("program", game=game, activities=[0, 0])
+            assert state["tick"] == 1
+            assert state["situation"]["resources"]["foos"] == 2
+            state = await client.request("wait", game=game)
+            assert state["tick"] == 2
+            assert (await client.request("state", game=game))["tick"] == 2
+            await client.request("close", game=game)
+            assert not server.games
+
+        serve(loop, scenario)
+
+    def test_activity_params(self, loop):
+        async def scenario(server, client):
+            game = (await client.request("create", seed=1))["game"]
+            server.games[game].runtime.runner.factory.resources.credit(2, 2)
+            state = await client.request(
+                "program", game=game, activities=[[3, {"nbtosell": 2}]]
+            )
+            assert state["situation"]["resources"]["foobars"] == 0
+
+        serve(loop, scenario)
+
+    @pytest.mark.parametrize(
+        ["op", "params", "error"],
+        [
+            ("dance", {}, "Unknown op dance"),
+            ("state", {"game": 42}, "Unknown game 42"),
+            ("create", {"seed": "one"}, "Invalid seed"),
+            ("create", {"pilot": "clever"}, "Unknown pilot clever"),
+            ("program", {"activities": []}, "No activities"),
+            ("program", {"activities": [9]}, "Invalid activities"),
+            ("program", {"activities": [4]}, "resources"),
+        ],
+    )
+    def test_errors(self, loop, op, params, error):
+        async def scenario(server, client):
+            game = (await client.request("create", seed=1))["game"]
+            if op == "program":
+                params["game"] = game
+            with pytest.raises(ServerError) as err:
+                await client.request(op, **params)
+            assert error in str(err.value)
+            # the connection is still served
+            assert (await client.request("state", game=game))["tick"] == 0
+
+        serve(loop, scenario)
+
+    def test_invalid_lines(self, loop):
+        async def scenario(server, client):
+            reply = client._replies[None] = loop.create_future()
+            client.writer.write(b"not json\n")
+            assert (await asyncio.wait_for(reply, TIMEOUT))["error"] == "Invalid JSON"
+            reply = client._replies[None] = loop.create_future()
+            client.writer.write(b"[1, 2]\n")
+            assert (await asyncio.wait_for(reply, TIMEOUT))["error"] == (
+                "A request is a JSON object"
+            )
+
+        serve(loop, scenario)
+
+    def test_owner_only(self, loop):
+        async def scenario(server, owner, other):
+            game = (await owner.request("create", seed=1))["game"]
+            for op in ("program", "wait", "close"):
+                with pytest.raises(ServerError, match="Not the owner"):
+                    await other.request(op, game=game, activities=[0])
+            # anyone may watch
+            assert (await other.request("state", game=game))["tick"] == 0
+            assert game in server.games
+
+        serve(loop, scenario, nbclients=2)
+
+    def test_pilot(self, loop):
+        async def scenario(server, client):
+            game = (await client.request("create", pilot="smart", target=4))["game"]
+            await client.request("subscribe", game=game)
+            with pytest.raises(ServerError, match="played by a pilot"):
+                await client.request("program", game=game, activities=[0])
+            with pytest.raises(ServerError, match="played by a pilot"):
+                await client.request("wait", game=game)
+            while True:
+                event = await next_event(client)
+                if len(event["situation"]["robots"]) >= 4:
+                    break
+            await asyncio.wait_for(server.games[game].task, TIMEOUT)
+
+        serve(loop, scenario)
+
+    def test_pilot_error(self, loop, monkeypatch):
+        """A game whose pilot fails is closed, its owner and watchers told why"""
+        pilots = []
+
+        def broken(target):
+            pilots.append(BrokenPilot())
+            return pilots[-1]
+
+        monkeypatch.setitem(server_module.PILOTS, "broken", broken)
+
+        async def scenario(server, owner, watcher):
+            game = (await owner.request("create", pilot="broken"))["game"]
+            await watcher.request("subscribe", game=game)
+            assert (await next_event(watcher))["tick"] == 0
+            pilots[0].go.set()
+            error = await next_event(owner)
+            assert error["event"] == "error"
+            assert error["game"] == game
+            assert "resources" in error["error"]
+            assert await next_event(watcher) == error
+            assert await next_event(watcher) == {"event": "closed", "game": game}
+            assert not server.games
+            # the owner may create another game in its place
+            await owner.request("create", seed=1)
+
+        serve(loop, scenario, nbclients=2, max_owned_games=1)
+
+    def test_disconnect(self, loop):
+        """The games of a client are closed when it disconnects"""
+
+        async def scenario(server, owner, watcher):
+            games = [(await owner.request("create"))["game"] for _ in range(0, 2)]
+            await watcher.request("subscribe", game=games[0])
+            assert (await next_event(watcher))["event"] == "state"
+            await owner.close()
+            assert await next_event(watcher) == {"event": "closed", "game": games[0]}
+            assert not server.games
+            assert watcher.events.empty()
+
+        serve(loop, scenario, nbclients=2)
+
+
+class TestSubscriptions:
+    def test_coalesced(self, loop):
+        """A subscriber receives the latest state, not a backlog of all of them"""
+
+        async def scenario(server, owner, watcher):
+            game = (await owner.request("create", seed=1))["game"]
+            await watcher.request("subscribe", game=game)
+            first = await next_event(watcher)
+            assert first["tick"] == 0
+            # a watcher slow to read: its connection cannot write meanwhile
+            (connection,) = [
+                connection
+                for connection in server.connections
+                if game in connection.subscriptions
+            ]
+            nbwaits = 20
+            async with connection.write_lock:
+                for _ in range(0, nbwaits):
+                    await owner.request("wait", game=game)
+            await owner.request("close", game=game)
+            events = []
+            while True:
+                event = await next_event(watcher)
+                events.append(event)
+                if event["event"] == "closed":
+                    break
+            states = events[:-1]
+            assert events[-1] == {"event": "closed", "game": game}
+            assert all(event["event"] == "state" for event in states)
+            # the state being sent when the watcher stopped reading, then the latest
+            assert [event["tick"] for event in states] == [1, nbwaits]
+
+        serve(loop, scenario, nbclients=2)
+
+    def test_unsubscribe(self, loop):
+        async def scenario(server, owner, watcher):
+            game = (await owner.request("create", seed=1))["game"]
+            await watcher.request("subscribe", game=game)
+            assert (await next_event(watcher))["tick"] == 0
+            await watcher.request("unsubscribe", game=game)
+            await owner.request("wait", game=game)
+            await owner.request("close", game=game)
+            # neither the new state nor the closing are sent
+            await asyncio.sleep(0.05)
+            assert watcher.events.empty()
+
+        serve(loop, scenario, nbclients=2)
+
+
+class TestLimits:
+    def test_games(self, loop):
+        async def scenario(server, first, second):
+            for _ in range(0, 2):
+                await first.request("create")
+            with pytest.raises(ServerError, match="Too many games for this client"):
+                await first.request("create")
+            await second.request("create")
+            with pytest.raises(ServerError, match="Too many games"):
+                await second.request("create")
+            assert len(server.games) == 3
+            # a game closed frees its place
+            await second.request("close", game=max(server.games))
+            await second.request("create")
+
+        serve(loop, scenario, nbclients=2, max_games=3, max_owned_games=2)
+
+    def test_subscriptions(self, loop):
+        async def scenario(server, client):
+            games = [(await client.request("create"))["game"] for _ in range(0, 3)]
+            for game in games[:2]:
+                await client.request("subscribe", game=game)
+            # subscribing again to a game is not another subscription
+            await client.request("subscribe", game=games[0])
+            with pytest.raises(ServerError, match="Too many subscriptions"):
+                await client.request("subscribe", game=games[2])
+            await client.request("unsubscribe", game=games[0])
+            await client.request("subscribe", game=games[2])
+
+        serve(loop, scenario, max_subscriptions=2)
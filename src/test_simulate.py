@@ -0,0 +1,143 @@
+import json
+import math
+
+import pytest
+from click.testing import CliRunner
+
+import simulate
+from model.randomness import spawn_seeds
+from pilots import DumbAutopilot, SmartAutopilot
+from simulate import histogram, percentile, run_games, summarize
+
+TARGET = 6
+
+
+# Tests
+
+
+class TestStatistics:
+    @pytest.mark.parametrize(
+        ["pct", "value"], [(1, 1), (10, 1), (11, 2), (50, 5), (95, 10), (100, 10)]
+    )
+    def test_percentile(self, pct, value):
+        assert percentile(list(range(1, 11)), pct) == value
+
+    def test_histogram(self):
+        bins = histogram([3, 4, 4, 7, 12], 4)
+        assert bins == [
+            {"from": 3, "to": 5, "count": 3},
+            {"from": 6, "to": 8, "count": 1},
+            {"from": 9, "to": 11, "count": 0},
+            {"from": 12, "to": 14, "count": 1},
+        ]
+
+    def test_histogram_narrow(self):
+        """Bins are one tick wide at least"""
+        assert histogram([5, 5, 6], 10) == [
+            {"from": 5, "to": 5, "count": 2},
+            {"from": 6, "to": 6, "count": 1},
+        ]
+
+    def test_summarize(self):
+        summary = summarize([4, 2, 8, 6], nbbins=2)
+        assert summary["games"] == 4
+        assert summary["mean"] == 5
+        assert math.isclose(summary["stdev"], math.sqrt(5))
+        assert (summary["min"], summary["max"]) == (2, 8)
+        assert summary["percentiles"] == {
+            1: 2,
+            5: 2,
+            25: 2,
+            50: 4,
+            75: 6,
+            95: 8,
+            99: 8,
+        }
+        assert [b["count"] for b in summary["histogram"]] == [2, 2]
+
+
+class TestRunGames:
+    @pytest.mark.parametrize(["engine"], [("object",), ("cohort",)])
+    def test_seed(self, engine):
+        """The games of a seed do not depend on the workers or the batch size"""
+        results = [
+            run_games(
+                ["smart"],
+                12,
+                TARGET,
+                workers=workers,
+                batch_size=batch_size,
+                engine=engine,
+                seed=3,
+            )
+            for workers, batch_size in ((1, 12), (2, 5), (3, 1))
+        ]
+        assert results[0] == results[1] == results[2]
+        assert results[0] != run_games(
+            ["smart"], 12, TARGET, workers=1, engine=engine, seed=4
+        )
+
+    def test_lockstep_seed(self):
+        """The lockstep games of a seed do not depend on the workers"""
+        single, double = (
+            run_games(
+                ["dumb"], 40, TARGET, workers, batch_size=7, engine="lockstep", seed=3
+            )
+            for workers in (1, 2)
+        )
+        assert single == double
+
+    def test_object(self):
+        """The object engine plays each game on its own seed"""
+        results = run_games(simulate.PILOTS, 5, TARGET, workers=1, seed=0)
+        seeds = spawn_seeds(0, 5)
+        assert results == {
+            "smart": [simulate.play(SmartAutopilot(), TARGET, seed=s) for s in seeds],
+            "dumb": [
+                simulate.play(DumbAutopilot(TARGET), TARGET, seed=s) for s in seeds
+            ],
+        }
+
+    @pytest.mark.parametrize(["engine"], list((engine,) for engine in simulate.ENGINES))
+    def test_engines(self, engine):
+        results = run_games(
+            simulate.PILOTS, 10, TARGET, workers=1, engine=engine, seed=0
+        )
+        for ticks in results.values():
+            assert len(ticks) == 10
+            assert min(ticks) > 0
+
+    def test_compiled(self):
+        assert run_games(
+            ["smart"], 5, TARGET, workers=1, seed=0, compiled=True
+        ) == run_games(["smart"], 5, TARGET, workers=1, seed=0)
+
+    def test_build_pilot(self):
+        assert simulate.build_pilot("smart", TARGET, foo_stock=9).foo_stock == 9
+        assert simulate.build_pilot("dumb", TARGET).target == TARGET
+        with pytest.raises(ValueError, match="Unknown pilot"):
+            simulate.build_pilot("clever", TARGET)
+
+
+class TestCommand:
+    def test_json(self):
+        result = CliRunner().invoke(
+            simulate.simulate,
+            ["--games", "8", "--target", str(TARGET), "--workers", "1"]
+            + ["--seed", "0", "--pilot", "smart", "--json"],
+        )
+        assert result.exit_code == 0
+        report = json.loads(result.output)
+        assert list(report) == ["smart"]
+        assert report["smart"]["games"] == 8
+
+    def test_display(self):
+        result = CliRunner().invoke(
+            simulate.simulate,
+            ["--games", "8", "--target", str(TARGET), "--workers", "1"]
+            + ["--seed", "0", "--bins", "3"],
+        )
+        assert result.exit_code == 0
+        assert "Pilot smart" in result.output
+        assert "Pilot dumb" in result.output
+        assert "p50: " in result.output
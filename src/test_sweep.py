@@ -0,0 +1,109 @@
+import math
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+import sweep
+from sweep import latin_hypercube, paired_z, parse_values
+
+# Tests
+
+
+class TestSpace:
+    @pytest.mark.parametrize(
+        ["spec", "values"],
+        [
+            ("1:5", [1, 2, 3, 4, 5]),
+            ("2:10:4", [2, 6, 10]),
+            ("7", [7]),
+            ("3,5,8", [3, 5, 8]),
+        ],
+    )
+    def test_parse_values(self, spec, values):
+        assert parse_values(spec) == values
+
+    @pytest.mark.parametrize(["spec"], [("a",), ("1:b",), ("1,,2",)])
+    def test_parse_invalid(self, spec):
+        with pytest.raises(ValueError):
+            parse_values(spec)
+
+    def test_grid(self):
+        configs = sweep.grid({"a": [1, 2], "b": [3, 4, 5]})
+        assert len(configs) == 6
+        assert {"a": 2, "b": 4} in configs
+
+    def test_random_sample(self):
+        space = {"a": [1, 2], "b": [3, 4]}
+        configs = sweep.random_sample(space, 50, seed=0)
+        # without the duplicates
+        assert sorted(tuple(config.values()) for config in configs) == [
+            (1, 3),
+            (1, 4),
+            (2, 3),
+            (2, 4),
+        ]
+
+    @pytest.mark.parametrize(["seed"], [(0,), (1,), (2,)])
+    def test_latin_hypercube(self, seed):
+        """Each stratum of each parameter is sampled once"""
+        space = {"a": list(range(0, 10)), "b": list(range(100, 120))}
+        configs = latin_hypercube(space, 10, seed=seed)
+        assert len(configs) == 10
+        assert sorted(config["a"] for config in configs) == space["a"]
+        # two values per stratum
+        assert sorted((config["b"] - 100) // 2 for config in configs) == list(
+            range(0, 10)
+        )
+
+    def test_latin_hypercube_reproducible(self):
+        space = sweep.default_space("smart", 30)
+        assert latin_hypercube(space, 8, seed=3) == latin_hypercube(space, 8, seed=3)
+
+
+class TestPairedZ:
+    def test_z(self):
+        best = np.array([10, 12, 14, 16])
+        ticks = best + np.array([1, 3, 1, 3])
+        # mean 2, standard deviation 2 / sqrt(3), standard error 1 / sqrt(3)
+        assert math.isclose(paired_z(ticks, best), 2 * math.sqrt(3))
+        assert math.isclose(paired_z(best, ticks), -2 * math.sqrt(3))
+
+    def test_zero_stderr(self):
+        best = np.array([10, 12, 14])
+        assert paired_z(best + 2, best) == math.inf
+        assert paired_z(best - 2, best) == -math.inf
+        assert paired_z(best, best) == 0.0
+
+
+class TestSweep:
+    def test_sweep(self):
+        """A configuration which never reaches the target stops early"""
+        results = sweep.sweep(
+            "smart",
+            [{"foo_stock": 4}, {"foo_stock": 8}],
+            nbgames=40,
+            batch_size=20,
+            max_ticks=1000,
+            workers=1,
+            seed=0,
+        )
+        best, worst = results
+        assert best["params"] == {"foo_stock": 8}
+        assert best["games"] == 40
+        assert not best["stopped"]
+        assert best["failed"] == 0
+        assert best["stderr"] > 0
+        # foo_stock 4 never gets the 6 foos of a robot
+        assert worst["params"] == {"foo_stock": 4}
+        assert worst["stopped"]
+        assert worst["games"] == 20
+        assert worst["failed"] == 20
+        assert worst["mean"] == 1001
+
+    def test_invalid_param(self):
+        result = CliRunner().invoke(sweep.sweep_command, ["--param", "foo_stock=a"])
+        assert result.exit_code == 2
+        result = CliRunner().invoke(sweep.sweep_command, ["--param", "speed=1,2"])
+        assert result.exit_code == 2
+        assert "speed" in result.output